@@ -0,0 +1,89 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2018.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""
+An array backed layout of a physical register, for the routing passes.
+
+During routing the virtual qubits are the qubits of the canonical register ``q`` (identified
+by their index) and the layout only changes by swaps. Keeping the permutation in two integer
+arrays makes lookups and swaps O(1), the ``Layout`` is only built once routing is done.
+"""
+
+import numpy as np
+
+from qiskit.transpiler.layout import Layout
+
+
+class ArrayLayout:
+    """Virtual to physical qubit permutation stored in two integer arrays.
+
+    Attributes:
+        v2p (ndarray): the physical qubit of every virtual qubit index
+        p2v (ndarray): the virtual qubit index on every physical qubit
+    """
+
+    def __init__(self, v2p):
+        """Create an ArrayLayout from the physical qubit of every virtual qubit.
+
+        Args:
+            v2p (list or ndarray): a permutation of ``range(len(v2p))``
+        """
+        self.v2p = np.array(v2p, dtype=np.int64)
+        self.p2v = np.empty_like(self.v2p)
+        self.p2v[self.v2p] = np.arange(len(self.v2p), dtype=np.int64)
+
+    @classmethod
+    def trivial(cls, num_qubits):
+        """Return the layout mapping virtual qubit i onto physical qubit i."""
+        return cls(np.arange(num_qubits, dtype=np.int64))
+
+    @classmethod
+    def from_layout(cls, layout, qreg):
+        """Return the ArrayLayout of `layout` restricted to the qubits of `qreg`."""
+        return cls([layout[qubit] for qubit in qreg])
+
+    def __len__(self):
+        return len(self.v2p)
+
+    def copy(self):
+        """Returns a copy of the ArrayLayout."""
+        layout_copy = type(self).__new__(type(self))
+        layout_copy.v2p = self.v2p.copy()
+        layout_copy.p2v = self.p2v.copy()
+        return layout_copy
+
+    def physical(self, virtual):
+        """Return the physical qubit of the virtual qubit index `virtual`."""
+        return int(self.v2p[virtual])
+
+    def virtual(self, physical):
+        """Return the virtual qubit index on the physical qubit `physical`."""
+        return int(self.p2v[physical])
+
+    def swap(self, physical1, physical2):
+        """Swaps the virtual qubits on the physical qubits `physical1` and `physical2`."""
+        virtual1 = self.p2v[physical1]
+        virtual2 = self.p2v[physical2]
+        self.p2v[physical1] = virtual2
+        self.p2v[physical2] = virtual1
+        self.v2p[virtual1] = physical2
+        self.v2p[virtual2] = physical1
+
+    def to_layout(self, qreg):
+        """Return the Layout mapping the qubits of `qreg` onto their physical qubits.
+
+        Args:
+            qreg (QuantumRegister): the register the virtual qubit indices refer to
+        Returns:
+            Layout: the equivalent layout
+        """
+        return Layout({qreg[virtual]: int(physical) for virtual, physical in enumerate(self.v2p)})
@@ -14,11 +14,10 @@
 
 from qiskit.transpiler.basepasses import TransformationPass
 from qiskit.transpiler.exceptions import TranspilerError
-from qiskit.dagcircuit import DAGCircuit
-from qiskit.transpiler.layout import Layout
 from qiskit.circuit.library.standard_gates import SwapGate
-import networkx as nx
-import qiskit
+
+from array_layout import ArrayLayout
+from coupling_tables import get_coupling_tables
 
 
 class BasicSwap_(TransformationPass):
@@ -29,17 +28,30 @@ class BasicSwap_(TransformationPass):
     one or more swaps in front to make it compatible.
     """
 
-    def __init__(self, coupling_map, fake_run=False):
+    def __init__(self, coupling_map, fake_run=False, parallel_layers=False, meeting_point_table=False):
         """BasicSwap initializer.
 
         Args:
             coupling_map (CouplingMap): Directed graph represented a coupling map.
             fake_run (bool): if true, it only pretend to do routing, i.e., no
                 swap is effectively added.
+            parallel_layers (bool): if true, the dag is routed layer by layer over
+                ``dag.multigraph_layers()`` and the swaps and gates are appended to the
+                output dag directly, instead of composing one sub-dag per gate.
+            meeting_point_table (bool): if true, the meeting point of every physical qubit
+                triple is precomputed (on devices of up to ``MEETING_TABLE_MAX_QUBITS`` qubits).
         """
         super().__init__()
         self.coupling_map = coupling_map
         self.fake_run = fake_run
+        self.parallel_layers = parallel_layers
+        self.meeting_point_table = meeting_point_table
+
+    def _get_coupling_tables(self):
+        coupling_tables = get_coupling_tables(self.coupling_map)
+        if self.meeting_point_table:
+            coupling_tables.build_meeting_point_table()
+        return coupling_tables
 
     def run(self, dag):
         """Run the BasicSwap pass on `dag`.
@@ -62,7 +74,10 @@ class BasicSwap_(TransformationPass):
         #     connectivity.add_edge(qr[pair[0]], qr[pair[1]])
 
         if self.fake_run:
-            return self.fake_run(dag)
+            return self._fake_run(dag)
+
+        if self.parallel_layers:
+            return self._run_parallel_layers(dag)
 
         #copy the metadata (the circuit global phase, the duration, classical and quantum registers etc)
         #and keep the dag empty (that is do not copy the content)
@@ -75,13 +90,13 @@ class BasicSwap_(TransformationPass):
             raise TranspilerError("The layout does not match the amount of qubits in the DAG")
 
         canonical_register = dag.qregs["q"]
-        trivial_layout = Layout.generate_trivial_layout(canonical_register)
-        
-        #a diciontary of |dag.qregs['q']| terms which has integers as keys and qubits as values.
-        #Eg - {0: Qubit(QuantumRegister(6, 'q'), 0), 1: Qubit(QuantumRegister(6, 'q'), 1), ..., 5: Qubit(QuantumRegister(6, 'q'), 5)}
-        current_layout = trivial_layout.copy()
-        #print('The starting layout is: ', current_layout)
-        #print('#######################################################################################################################################################################################')
+
+        #the virtual qubits are identified by their index in the canonical register, the
+        #layout starts trivial and is only changed by the swaps
+        qubit_indices = {bit: index for index, bit in enumerate(canonical_register)}
+        current_layout = ArrayLayout.trivial(len(canonical_register))
+        coupling_tables = self._get_coupling_tables()
+        adjacency = coupling_tables.adjacency
 
         for layer in dag.serial_layers():
             subdag = layer["graph"]
@@ -90,51 +105,16 @@ class BasicSwap_(TransformationPass):
             #for all two qubit gates in the layer
             for gate in subdag.two_qubit_ops():
 
-                
-                physical_q0 = current_layout[gate.qargs[0]]
-                physical_q1 = current_layout[gate.qargs[1]]
-
-                #print('The virtual qubits for the cnot are: ', gate.qargs[0], gate.qargs[1])
-                #print('The physical qubits for the cnot are: ', physical_q0, physical_q1)
+                physical_q0 = current_layout.physical(qubit_indices[gate.qargs[0]])
+                physical_q1 = current_layout.physical(qubit_indices[gate.qargs[1]])
 
                 #if the qubits are not adjacent to each other
-                if self.coupling_map.distance(physical_q0, physical_q1) != 1:
-                    
-                    # Insert a new layer with the SWAP(s).
-                    swap_layer = DAGCircuit()
-                    swap_layer.add_qreg(canonical_register)
+                if not adjacency[physical_q0, physical_q1]:
 
                     #compute the shortest undirected path from physical qubit 0 to physical qubit 1
                     #the list 'path' consists of the indices from qubit 0 to qubit 1
-                    path = self.coupling_map.shortest_undirected_path(physical_q0, physical_q1)
-                    #print('The routing path for the cx gate is: ')
-                    #print([idx for idx in path])
-                    for swap in range(len(path) - 2):
-                        
-                        #'connected_wire_1' is the first end and 'connected_wire_2' is the 
-                        #second end of the path between two adjacent qubits
-                        connected_wire_1 = path[swap]
-                        connected_wire_2 = path[swap + 1]
-
-                        #convert the data type from 'int' to 'qiskit.circuit.quantumregister.Qubit'
-                        qubit_1 = current_layout[connected_wire_1]
-                        qubit_2 = current_layout[connected_wire_2]
-
-                        #create the swap operation to route the qubits for the particular layer
-                        swap_layer.apply_operation_back(
-                            SwapGate(), qargs=[qubit_1, qubit_2], cargs=[]
-                        )
-
-                    # layer insertion
-                    order = current_layout.reorder_bits(new_dag.qubits)
-                    new_dag.compose(swap_layer, qubits=order)
-
-                    # update current_layout
-                    for swap in range(len(path) - 2):
-                        current_layout.swap(path[swap], path[swap + 1])
-
-                #print('The new layout is: ', current_layout)
-                #print('#######################################################################################################################################################################################')
+                    path = coupling_tables.path(physical_q0, physical_q1)
+                    self._apply_swaps(new_dag, [path], current_layout, canonical_register)
 
             # #for all the multi qubit gates in the layer
             for gate in subdag.multi_qubit_ops():
@@ -143,146 +123,140 @@ class BasicSwap_(TransformationPass):
                 assert gate.op.name == 'ccx'
 
                 #extract the physical qubits corresponding to the virtual qubits
-                physical_q0 = current_layout[gate.qargs[0]]
-                physical_q1 = current_layout[gate.qargs[1]]
-                physical_q2 = current_layout[gate.qargs[2]]
-
-                # print('qargs_0: ', gate.qargs[0], ' qargs_1: ', gate.qargs[1], ' qargs_2: ', gate.qargs[2])
-
-                #a dictioanry that defines what the final 'destination' qubit would be and what the other two 'starting' qubits would be
-                #maintains the initial 'virtual qubit-physical qubit' mapping and also tracks the order in which the 'starting' qubits are routed
-                # route_dict = {}
-                # route_dict[gate.qargs[0]] = None
-                # route_dict[gate.qargs[1]] = None
-                # route_dict[gate.qargs[2]] = None
-
-                #print('The virtual qubits for the toffoli are: ', gate.qargs[0], gate.qargs[1], gate.qargs[2])
-                #print('The physical qubits for the toffoli: ', physical_q0, physical_q1, physical_q2)
+                physical_q0 = current_layout.physical(qubit_indices[gate.qargs[0]])
+                physical_q1 = current_layout.physical(qubit_indices[gate.qargs[1]])
+                physical_q2 = current_layout.physical(qubit_indices[gate.qargs[2]])
 
                 #if the qubits are not adjacent to each other
-                if self.coupling_map.distance(physical_q0, physical_q1) != 1 or self.coupling_map.distance(physical_q0, physical_q2) != 1 or self.coupling_map.distance(physical_q1, physical_q2) != 1:
-
-                    #Insert a new layer with the SWAP(s)
-                    swap_layer = DAGCircuit()
-                    swap_layer.add_qreg(canonical_register)
+                if not (adjacency[physical_q0, physical_q1] and adjacency[physical_q0, physical_q2] and adjacency[physical_q1, physical_q2]):
 
                     #compute the convenient path
                     #the initial locations for the Toffoli
                     initial_locs = [physical_q0, physical_q1, physical_q2]
+                    min_paths = self._toffoli_paths(initial_locs, coupling_tables)
+                    self._apply_swaps(new_dag, min_paths, current_layout, canonical_register)
 
-                    #we have the minimum length and the paths leading to the minimum length
-                    min_length = float('inf')
-                    min_paths = None
-
-                    for index_, i in enumerate(initial_locs):
-                        paths = []
-
-                        for j in initial_locs:
-
-                            if i == j:
-                                continue
-
-                            paths.append(self.coupling_map.shortest_undirected_path(j, i))
-
-                        length = sum([len(path) - 2 for path in paths])
-                        #print(i, ': length of paths: ', length)
-
-                        if min_length > length:
-                            min_length = length
-                            min_paths = paths
-
-                            # if index_ == 0:
-                            #     route_dict[gate.qargs[0]] = ('destination')
-                            #     route_dict[gate.qargs[1]] = ('path-1-starting-point')
-                            #     route_dict[gate.qargs[2]] = ('path-2-starting-point')
-
-                            # elif index_ == 1:
-                            #     route_dict[gate.qargs[1]] = ('destination')
-                            #     route_dict[gate.qargs[0]] = ('path-1-starting-point')
-                            #     route_dict[gate.qargs[2]] = ('path-2-starting-point')
-
-                            # elif index_ == 2:
-                            #     route_dict[gate.qargs[2]] = ('destination')
-                            #     route_dict[gate.qargs[0]] = ('path-1-starting-point')
-                            #     route_dict[gate.qargs[1]] = ('path-2-starting-point')
-
-                        
-                    #the minimum paths chosen for each toffoli
-                    #print('The min paths are: ')
-                    #print('path 1: ', [idx for idx in min_paths[0]])
-                    #print('path 2: ', [idx for idx in min_paths[1]])
-
-                    #first path
-                    path = min_paths[0]
-                    for swap in range(len(path) - 2):
-
-                        #get the two qubits
-                        connected_wire_1 = path[swap]
-                        connected_wire_2 = path[swap + 1]
-
-                        #qubits
-                        qubit_1 = current_layout[connected_wire_1]
-                        qubit_2 = current_layout[connected_wire_2]
+            #append the gates of the layer on the physical qubits they are now laid out on
+            for node in subdag.topological_op_nodes():
+                qargs = [canonical_register[current_layout.physical(qubit_indices[qarg])] for qarg in node.qargs]
+                new_dag.apply_operation_back(node.op, qargs, node.cargs)
 
-                        #create the swap operation to route the qubits for the particular layer
-                        swap_layer.apply_operation_back(
-                            SwapGate(), qargs=[qubit_1, qubit_2], cargs=[]
-                        )
-
-                    # layer insertion
-                    # order = current_layout.reorder_bits(new_dag.qubits)
-                    # print('order: ', order)
-                    # new_dag.compose(swap_layer, qubits=order)
-
-                    # # update current_layout
-                    # for swap in range(len(min_paths[0]) - 2):
-                    #     current_layout.swap(min_paths[0][swap], min_paths[0][swap + 1])
+        return new_dag
 
-                    
+    @staticmethod
+    def _apply_swaps(new_dag, paths, current_layout, canonical_register):
+        """Append the swaps moving the first qubit of every path next to its last qubit.
 
-                    # swap_layer = DAGCircuit()
-                    # swap_layer.add_qreg(canonical_register)
-                    # path = self.coupling_map.shortest_undirected_path(current_layout[list(route_dict.keys())[list(route_dict.values()).index('path-2-starting-point')]], current_layout[list(route_dict.keys())[list(route_dict.values()).index('destination')]])
+        The swaps of all the paths act on the physical qubits of the paths as they were computed,
+        the layout is updated once all of them are appended.
 
-                    # #second path
-                    path = min_paths[1]
-                    for swap in range(len(path) - 2):
+        Args:
+            new_dag (DAGCircuit): the routed dag
+            paths (list): lists of physical qubits
+            current_layout (ArrayLayout): the layout, updated in place
+            canonical_register (QuantumRegister): the physical register
+        """
+        for path in paths:
+            for swap in range(len(path) - 2):
+                #'path[swap]' is the first end and 'path[swap + 1]' is the
+                #second end of the path between two adjacent qubits
+                new_dag.apply_operation_back(
+                    SwapGate(), qargs=[canonical_register[path[swap]], canonical_register[path[swap + 1]]], cargs=[]
+                )
+        for path in paths:
+            for swap in range(len(path) - 2):
+                current_layout.swap(path[swap], path[swap + 1])
+
+
+    @staticmethod
+    def _toffoli_paths(initial_locs, coupling_tables):
+        """Return the two paths bringing the qubits of a toffoli to a common qubit.
+
+        Every qubit of the toffoli is a candidate destination, the one needing the least
+        swaps is chosen. Both the destination and the paths are looked up in the precomputed
+        tables of the coupling map.
 
-                        #get the two qubits
-                        connected_wire_1 = path[swap]
-                        connected_wire_2 = path[swap + 1]
+        Args:
+            initial_locs (list): the physical qubits of the toffoli
+            coupling_tables (CouplingTables): the tables of the coupling map
+        Returns:
+            list: the shortest undirected paths from the two other qubits to the destination
+        """
+        min_destination, _ = coupling_tables.meeting_point(*initial_locs)
+        return [coupling_tables.path(j, min_destination) for j in initial_locs if j != min_destination]
 
-                        #qubits
-                        qubit_1 = current_layout[connected_wire_1]
-                        qubit_2 = current_layout[connected_wire_2]
+    def _run_parallel_layers(self, dag):
+        """Route `dag` over its parallel layers.
 
-                        #create the swap operation to route the qubits for the particular layer
-                        swap_layer.apply_operation_back(
-                            SwapGate(), qargs=[qubit_1, qubit_2], cargs=[]
-                        )
+        The gates of a layer act on disjoint qubits. The gates that already satisfy the coupling
+        map are emitted first, then every other gate is routed with the same swaps as in the
+        serial mode, which only move qubits of gates emitted before. Swaps and gates are
+        appended to the output dag with ``apply_operation_back`` on the physical qubits.
 
-                    # layer insertion
-                    order = current_layout.reorder_bits(new_dag.qubits)
-                    #print('order: ', order)
-                    new_dag.compose(swap_layer, qubits=order)
+        Args:
+            dag (DAGCircuit): DAG to map.
 
-                    #update current_layout
-                    for swap in range(len(min_paths[0]) - 2):
-                        current_layout.swap(min_paths[0][swap], min_paths[0][swap + 1])
+        Returns:
+            DAGCircuit: A mapped DAG.
 
-                    for swap in range(len(path) - 2):
-                        current_layout.swap(path[swap], path[swap + 1])
+        Raises:
+            TranspilerError: if the coupling map or the layout are not
+            compatible with the DAG.
+        """
+        new_dag = dag._copy_circuit_metadata()
 
-                #print('Current layout: ', current_layout)
-                #print('#######################################################################################################################################################################################')
+        if len(dag.qregs) != 1 or dag.qregs.get("q", None) is None:
+            raise TranspilerError("Basic swap runs on physical circuits only")
 
+        if len(dag.qubits) > len(self.coupling_map.physical_qubits):
+            raise TranspilerError("The layout does not match the amount of qubits in the DAG")
 
-            order = current_layout.reorder_bits(new_dag.qubits)
-            new_dag.compose(subdag, qubits=order)
+        canonical_register = dag.qregs["q"]
+        qubit_indices = {bit: index for index, bit in enumerate(canonical_register)}
+        current_layout = ArrayLayout.trivial(len(canonical_register))
+        coupling_tables = self._get_coupling_tables()
+        adjacency = coupling_tables.adjacency
+
+        def _physical(node):
+            return [current_layout.physical(qubit_indices[qarg]) for qarg in node.qargs]
+
+        def _is_mapped(physical):
+            if len(physical) == 2:
+                return adjacency[physical[0], physical[1]]
+            #a toffoli needs all three qubits adjacent to each other
+            return adjacency[physical[0], physical[1]] and adjacency[physical[0], physical[2]] and adjacency[physical[1], physical[2]]
+
+        def _apply(node):
+            qargs = [canonical_register[physical] for physical in _physical(node)]
+            new_dag.apply_operation_back(node.op, qargs, node.cargs)
+
+        for layer in dag.multigraph_layers():
+            to_route = []
+            for node in layer:
+                if node.type != "op":
+                    continue
+                if node.name == "barrier" or len(node.qargs) < 2:
+                    _apply(node)
+                    continue
+                if len(node.qargs) >= 3:
+                    #assert that the only multi qubit gate is the toffoli gate
+                    assert node.op.name == 'ccx'
+                if _is_mapped(_physical(node)):
+                    _apply(node)
+                else:
+                    to_route.append(node)
+
+            for node in to_route:
+                physical = _physical(node)
+                if len(physical) == 2:
+                    paths = [coupling_tables.path(physical[0], physical[1])]
+                else:
+                    paths = self._toffoli_paths(physical, coupling_tables)
+                self._apply_swaps(new_dag, paths, current_layout, canonical_register)
+                _apply(node)
 
         return new_dag
 
-
     def _fake_run(self, dag):
         """Do a fake run the BasicSwap pass on `dag`.
 
@@ -303,24 +277,21 @@ class BasicSwap_(TransformationPass):
             raise TranspilerError("The layout does not match the amount of qubits in the DAG")
 
         canonical_register = dag.qregs["q"]
-        trivial_layout = Layout.generate_trivial_layout(canonical_register)
-        current_layout = trivial_layout.copy()
+        qubit_indices = {bit: index for index, bit in enumerate(canonical_register)}
+        current_layout = ArrayLayout.trivial(len(canonical_register))
+        coupling_tables = get_coupling_tables(self.coupling_map)
+        adjacency = coupling_tables.adjacency
 
         for layer in dag.serial_layers():
             subdag = layer["graph"]
             for gate in subdag.two_qubit_ops():
-                physical_q0 = current_layout[gate.qargs[0]]
-                physical_q1 = current_layout[gate.qargs[1]]
-                if self.coupling_map.distance(physical_q0, physical_q1) != 1:
-                    path = self.coupling_map.shortest_undirected_path(physical_q0, physical_q1)
+                physical_q0 = current_layout.physical(qubit_indices[gate.qargs[0]])
+                physical_q1 = current_layout.physical(qubit_indices[gate.qargs[1]])
+                if not adjacency[physical_q0, physical_q1]:
+                    path = coupling_tables.path(physical_q0, physical_q1)
                     # update current_layout
                     for swap in range(len(path) - 2):
                         current_layout.swap(path[swap], path[swap + 1])
 
-        self.property_set["final_layout"] = current_layout
+        self.property_set["final_layout"] = current_layout.to_layout(canonical_register)
         return dag
-
-
-
-
-
@@ -0,0 +1,167 @@
+"""Scaling benchmark of the pending-decision bookkeeping of ``UnrollToffoliContextAware_``.
+
+The pass records the toffolis whose variant is fixed while analysing an earlier toffoli.
+Before, these were kept in plain lists, so every ``node in substituted_nodes`` and
+``substituted_tags[substituted_nodes.index(node)]`` was a linear scan and the bookkeeping
+grew quadratically with the number of Toffolis. The benchmark routes the ``trios_bench``
+CNX circuits of increasing size on a line and times the whole pass on the routed dag,
+once with the pass of the revision before the node-id keyed ``_PendingDecisions`` table
+("before", by default the parent of the first commit using it) and once with the pass of
+the revision introducing it ("after", by default that first commit). The per-gate cost of
+"after" stays flat.
+
+Every tree is timed in its own python process, on the same routed circuits. The pass of
+older revisions prints its decisions, the output of the processes is discarded.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_pending_decisions.py [--sizes 11 21 41 81 161] [--repeat 3]
+        [--before REV] [--after REV]
+"""
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _first_commit_using(text, path):
+    return subprocess.run(
+        ["git", "log", "-S" + text, "--reverse", "--format=%H", "--", path],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout.split()[0]
+
+
+def _export_tree(revision, directory):
+    archive = subprocess.run(
+        ["git", "archive", revision], cwd=ROOT, check=True, capture_output=True
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+
+
+def _routed_circuits(sizes):
+    sys.path.insert(0, ROOT)
+    from qiskit.transpiler import CouplingMap, PassManager
+
+    from apply_layout_ import ApplyLayout_
+    from basic_swap_ import BasicSwap_
+    from enlarge_with_ancilla_ import EnlargeWithAncilla_
+    from full_ancilla_allocation_ import FullAncillaAllocation_
+    from trios_bench import generate_cnx_halfdirty, generate_cnx_inplace
+    from trivial_layout_ import TrivialLayout_
+
+    routed = []
+    generators = [("cnx_halfdirty", generate_cnx_halfdirty), ("cnx_inplace", generate_cnx_inplace)]
+    for name, generator in generators:
+        for n in sizes:
+            circuit = generator(n)
+            coupling_map = CouplingMap.from_line(circuit.num_qubits)
+            pass_manager = PassManager([
+                TrivialLayout_(coupling_map),
+                FullAncillaAllocation_(coupling_map),
+                EnlargeWithAncilla_(),
+                ApplyLayout_(),
+                BasicSwap_(coupling_map),
+            ])
+            routed.append((name, n, coupling_map.get_edges(), pass_manager.run(circuit)))
+    return routed
+
+
+def _time_tree(tree, circuits_path, repeat):
+    """Time the pass of `tree` on the pickled circuits in a new process, return the timings."""
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", tree, circuits_path,
+             output.name, "--repeat", str(repeat)],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output.name) as output_file:
+            return json.load(output_file)
+
+
+def _worker(tree, circuits_path, output_path, repeat):
+    sys.path.insert(0, tree)
+    from qiskit.converters import circuit_to_dag
+    from qiskit.transpiler import CouplingMap
+    from qiskit.transpiler.passes import Collect2qBlocks
+
+    from context_aware_decompose_ import UnrollToffoliContextAware_
+
+    with open(circuits_path, "rb") as circuits_file:
+        routed = pickle.load(circuits_file)
+    timings = []
+    for _, _, edges, circuit in routed:
+        coupling_map = CouplingMap(edges)
+        best = float("inf")
+        for _ in range(repeat):
+            dag = circuit_to_dag(circuit)
+            blocks = Collect2qBlocks()
+            blocks.run(dag)
+            unroll = UnrollToffoliContextAware_(coupling_map)
+            unroll.property_set["block_list"] = blocks.property_set["block_list"]
+            start = time.perf_counter()
+            unroll.run(dag)
+            best = min(best, time.perf_counter() - start)
+        timings.append(best)
+    with open(output_path, "w") as output_file:
+        json.dump(timings, output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[11, 21, 41, 81, 161],
+                        help="odd circuit widths, as required by the half dirty generator")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--before", default=None,
+                        help="git revision timed as 'before', by default the parent of the "
+                             "first commit using _PendingDecisions")
+    parser.add_argument("--after", default=None,
+                        help="git revision timed as 'after', by default the first commit "
+                             "using _PendingDecisions")
+    parser.add_argument("--worker", nargs=3, metavar=("TREE", "CIRCUITS", "OUTPUT"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(*args.worker, args.repeat)
+        return
+
+    first_commit = _first_commit_using("_PendingDecisions", "context_aware_decompose_.py")
+    before = args.before or first_commit + "~1"
+    after = args.after or first_commit
+    routed = _routed_circuits(args.sizes)
+    with tempfile.TemporaryDirectory() as directory:
+        circuits_path = os.path.join(directory, "circuits.pickle")
+        with open(circuits_path, "wb") as circuits_file:
+            pickle.dump(routed, circuits_file)
+        timings = []
+        for label, revision in (("before", before), ("after", after)):
+            tree = os.path.join(directory, label)
+            os.mkdir(tree)
+            _export_tree(revision, tree)
+            timings.append(_time_tree(tree, circuits_path, args.repeat))
+        before_timings, after_timings = timings
+
+    print("before: %s, after: %s" % (before, after))
+    name = None
+    for (circuit_name, n, _, circuit), before_time, after_time in zip(routed, before_timings, after_timings):
+        if circuit_name != name:
+            name = circuit_name
+            print(name)
+        num_ccx = circuit.count_ops().get("ccx", 0)
+        per_gate = 1e6 / max(num_ccx, 1)
+        print(
+            "  n={:<5} ccx={:<7} before: {:9.2f} us/ccx   after: {:9.2f} us/ccx   speedup: {:6.1f}x".format(
+                n, num_ccx, before_time * per_gate, after_time * per_gate, before_time / after_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
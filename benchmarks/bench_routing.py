@@ -0,0 +1,101 @@
+"""Comparison of the Toffoli-aware routers on the ``trios_bench`` circuits.
+
+Every circuit is laid out trivially on the device and routed by ``BasicSwap_`` (gate by
+gate over the serial layers, shortest paths only) and by ``SabreSwap_`` with a line and a
+triangle Toffoli target. For every router the benchmark reports the number of swaps, the
+estimated number of cnots after the context-aware decomposition (``routing_cost(...,
+"estimated_cnots")``: 3 per swap, 6 per toffoli on a triangle, 8 on a line) and the
+routing time.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_routing.py [--sizes 11 21 41 81] [--coupling grid] [--seed 0]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qiskit.converters import circuit_to_dag
+from qiskit.transpiler import CouplingMap, PassManager
+
+from apply_layout_ import ApplyLayout_
+from basic_swap_ import BasicSwap_
+from enlarge_with_ancilla_ import EnlargeWithAncilla_
+from full_ancilla_allocation_ import FullAncillaAllocation_
+from sabre_swap_ import SabreSwap_
+from sabre_trials_ import routing_cost
+from trios_bench import generate_cnx_halfdirty, generate_cnx_inplace
+from trios_bench.cuccaro_adder import generate_cuccaro_adder
+from trios_bench.Takahashi_adder import generate_takahashi_adder
+from trivial_layout_ import TrivialLayout_
+
+
+def _coupling_map(kind, num_qubits):
+    if kind == "line":
+        return CouplingMap.from_line(num_qubits)
+    side = math.ceil(math.sqrt(num_qubits))
+    return CouplingMap.from_grid(side, side)
+
+
+def _embedded_dag(circuit, coupling_map):
+    pass_manager = PassManager([
+        TrivialLayout_(coupling_map),
+        FullAncillaAllocation_(coupling_map),
+        EnlargeWithAncilla_(),
+        ApplyLayout_(),
+    ])
+    return circuit_to_dag(pass_manager.run(circuit))
+
+
+def _routers(coupling_map, seed):
+    return [
+        ("basic", lambda: BasicSwap_(coupling_map)),
+        ("sabre_line", lambda: SabreSwap_(coupling_map, seed=seed, toffoli_target="line")),
+        ("sabre_triangle", lambda: SabreSwap_(coupling_map, seed=seed, toffoli_target="triangle")),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[11, 21, 41, 81],
+                        help="odd circuit widths, as required by the half dirty generator")
+    parser.add_argument("--coupling", choices=["grid", "line"], default="grid")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generators = [
+        ("cnx_halfdirty", generate_cnx_halfdirty),
+        ("cnx_inplace", generate_cnx_inplace),
+        #the adders need an even number of qubits
+        ("cuccaro_adder", lambda n: generate_cuccaro_adder(n + n % 2)),
+        ("takahashi_adder", lambda n: generate_takahashi_adder(n + n % 2)),
+    ]
+    for name, generator in generators:
+        print(name)
+        for n in args.sizes:
+            circuit = generator(n)
+            coupling_map = _coupling_map(args.coupling, circuit.num_qubits)
+            dag = _embedded_dag(circuit, coupling_map)
+            for router_name, make_router in _routers(coupling_map, args.seed):
+                router = make_router()
+                start = time.perf_counter()
+                mapped_dag = router.run(dag)
+                elapsed = time.perf_counter() - start
+                print(
+                    "  n={:<5} {:<15} swaps: {:7d}   cnots: {:8d}   time: {:8.3f} s".format(
+                        n,
+                        router_name,
+                        routing_cost(mapped_dag, coupling_map, "swaps"),
+                        routing_cost(mapped_dag, coupling_map, "estimated_cnots"),
+                        elapsed,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Microbenchmark of the per-lookup cost of the gate variant decomposition rules.
+
+Before the rule tables were built once at import time, every ``get_rules`` call rebuilt
+the whole ``variant_rules`` dict, i.e. it constructed the gate objects of *every* variant
+to return a single entry. The "before" timing reproduces that by materializing the full
+table per lookup, the "after" timing is the current ``get_rules`` call.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_variant_rules.py [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qiskit.circuit import QuantumRegister
+
+from gate_variants.rule_tables import materialize_rules
+from gate_variants import toffoli_variants, cx_variants
+from gate_variants.toffoli_variants import CCX_Variant_Gate
+from gate_variants.cx_variants import CX_Variant_Gate
+
+
+def _rebuild_all(table, q, gate_kinds):
+    return {tag: materialize_rules(rules, q, gate_kinds) for tag, rules in table.items()}
+
+
+def _report(name, before, after, number):
+    print(
+        "{:<22} before: {:8.2f} us/lookup   after: {:8.2f} us/lookup   speedup: {:5.1f}x".format(
+            name, 1e6 * before / number, 1e6 * after / number, before / after
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="lookups per measurement")
+    args = parser.parse_args()
+
+    q3 = QuantumRegister(3, "q")
+    ccx_gate = CCX_Variant_Gate(variant_tag=("01", "12", "f", "p"))
+    ccx_table = toffoli_variants._CCX_VARIANT_RULES
+    before = min(timeit.repeat(
+        lambda: _rebuild_all(ccx_table, q3, toffoli_variants._GATE_KINDS)[("01", "12", "f", "p")],
+        number=args.number, repeat=3,
+    ))
+    after = min(timeit.repeat(
+        lambda: ccx_gate.get_rules(q3, ("01", "12", "f", "p")), number=args.number, repeat=3
+    ))
+    _report("CCX_Variant_Gate", before, after, args.number)
+
+    q2 = QuantumRegister(2, "q")
+    cx_gate = CX_Variant_Gate(variant_tag=("00", "11", "d"))
+    cx_table = cx_variants._CX_VARIANT_RULES
+    before = min(timeit.repeat(
+        lambda: _rebuild_all(cx_table, q2, cx_variants._GATE_KINDS)[("00", "11", "d")],
+        number=args.number, repeat=3,
+    ))
+    after = min(timeit.repeat(
+        lambda: cx_gate.get_rules(q2, ("00", "11", "d")), number=args.number, repeat=3
+    ))
+    _report("CX_Variant_Gate", before, after, args.number)
+
+
+if __name__ == "__main__":
+    main()
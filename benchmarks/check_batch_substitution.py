@@ -0,0 +1,119 @@
+"""Check that the batch and in-place substitution modes of the context-aware passes agree.
+
+``UnrollToffoliContextAware_``, ``UnrollCnotContextAware_``, ``UnrollCnot_`` and
+``SWAPContextAware_`` decide the variants first and then either rebuild the dag in one
+sweep (``batch=True``, the default) or substitute every node in place (``batch=False``).
+The check routes ``trios_bench`` circuits on a line, runs every pass in both modes on the
+same input and compares the output dags. It exits with status 1 if any of them differ.
+
+Usage (from the repository root):
+
+    python benchmarks/check_batch_substitution.py [--sizes 5 11 21]
+"""
+
+import argparse
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qiskit.converters import circuit_to_dag
+from qiskit.transpiler import CouplingMap, PassManager
+from qiskit.transpiler.passes import Collect2qBlocks, Unroller
+
+from apply_layout_ import ApplyLayout_
+from basic_swap_ import BasicSwap_
+from context_aware_decompose_ import (
+    SWAPContextAware_,
+    UnrollCnot_,
+    UnrollCnotContextAware_,
+    UnrollToffoliContextAware_,
+)
+from enlarge_with_ancilla_ import EnlargeWithAncilla_
+from full_ancilla_allocation_ import FullAncillaAllocation_
+from trios_bench import generate_cnx_halfdirty, generate_cnx_inplace
+from trivial_layout_ import TrivialLayout_
+
+
+def _routed_circuit(circuit, coupling_map):
+    pass_manager = PassManager([
+        TrivialLayout_(coupling_map),
+        FullAncillaAllocation_(coupling_map),
+        EnlargeWithAncilla_(),
+        ApplyLayout_(),
+        BasicSwap_(coupling_map),
+    ])
+    return pass_manager.run(circuit)
+
+
+def _run_both_modes(make_pass, dag, block_list=None):
+    outputs = []
+    for batch in (True, False):
+        #the in-place mode modifies its input, and the block list refers to the input nodes
+        dag_copy, blocks = copy.deepcopy((dag, block_list))
+        unroll = make_pass(batch)
+        unroll.property_set["block_list"] = blocks
+        outputs.append(unroll.run(dag_copy))
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 11, 21],
+                        help="odd circuit widths, as required by the half dirty generator")
+    args = parser.parse_args()
+
+    failures = 0
+    generators = [("cnx_halfdirty", generate_cnx_halfdirty), ("cnx_inplace", generate_cnx_inplace)]
+    for name, generator in generators:
+        for n in args.sizes:
+            circuit = generator(n)
+            coupling_map = CouplingMap.from_line(circuit.num_qubits)
+            orientation_map = {tuple(edge): "f" for edge in coupling_map.get_edges()}
+            routed = _routed_circuit(circuit, coupling_map)
+
+            blocks_pass = Collect2qBlocks()
+            routed_dag = circuit_to_dag(routed)
+            blocks_pass.run(routed_dag)
+            checks = [(
+                "UnrollToffoliContextAware_",
+                lambda batch: UnrollToffoliContextAware_(coupling_map, batch=batch),
+                routed_dag,
+                blocks_pass.property_set["block_list"],
+            )]
+
+            #the swap pass only rewrites swaps, the cnot passes need a cx only circuit
+            checks.append((
+                "SWAPContextAware_",
+                lambda batch: SWAPContextAware_(coupling_map, batch=batch),
+                routed_dag,
+                None,
+            ))
+            cx_dag = circuit_to_dag(PassManager(Unroller(["u3", "cx"])).run(routed))
+            checks.append((
+                "UnrollCnotContextAware_",
+                lambda batch: UnrollCnotContextAware_(coupling_map, orientation_map, batch=batch),
+                cx_dag,
+                None,
+            ))
+            checks.append((
+                "UnrollCnot_",
+                lambda batch: UnrollCnot_(coupling_map, orientation_map, batch=batch),
+                cx_dag,
+                None,
+            ))
+
+            for pass_name, make_pass, dag, block_list in checks:
+                batch_dag, inplace_dag = _run_both_modes(make_pass, dag, block_list)
+                same = batch_dag == inplace_dag
+                failures += not same
+                print("{:<14} n={:<4} {:<27} {}".format(
+                    name, n, pass_name, "identical" if same else "DIFFERENT"
+                ))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,12 @@
 
 """Check if a DAG circuit is already mapped to a coupling map."""
 
+import numpy as np
+
 from qiskit.transpiler.basepasses import AnalysisPass
 
+from coupling_tables import get_coupling_tables
+
 
 class CheckMap_(AnalysisPass):
     """Check if a DAG circuit is already mapped to a coupling map.
@@ -21,6 +25,11 @@ class CheckMap_(AnalysisPass):
     Check if a DAGCircuit is mapped to `coupling_map` by checking that all
     2-qubit interactions are laid out to be physically close, setting the
     property ``is_swap_mapped`` to ``True`` or ``False`` accordingly.
+
+    Every gate is checked, the violating gates are reported in the property
+    ``check_map_violations`` as ``(gate name, physical qubits)`` tuples and their
+    number in ``check_map_violation_count``. ``check_map_msg`` describes the first
+    violating qubit pair.
     """
 
     def __init__(self, coupling_map):
@@ -42,70 +51,57 @@ class CheckMap_(AnalysisPass):
             dag (DAGCircuit): DAG to map.
         """
         self.property_set["is_swap_mapped"] = True
+        self.property_set["check_map_violations"] = []
+        self.property_set["check_map_violation_count"] = 0
 
         if self.coupling_map is None:
             return
 
         qubit_indices = {bit: index for index, bit in enumerate(dag.qubits)}
+        adjacency = get_coupling_tables(self.coupling_map).adjacency
 
-        #check that the qubits for two qubit gates are laid out closely
-        for gate in dag.two_qubit_ops():
-            if dag.has_calibration_for(gate):
-                continue
-            physical_q0 = qubit_indices[gate.qargs[0]]
-            physical_q1 = qubit_indices[gate.qargs[1]]
-
-            if self.coupling_map.distance(physical_q0, physical_q1) != 1:
-                self.property_set["check_map_msg"] = "{}({}, {}) failed".format(
-                    gate.name,
-                    physical_q0,
-                    physical_q1,
-                )
-                self.property_set["is_swap_mapped"] = False
-                return
-
-        #check if the qubits for three qubit gates are laid out accoring to the six-cnot expansion
-        #i.e. all qubits are adjacent to each other
-        for gate in dag.multi_qubit_ops():
+        #the qubits for two qubit gates must be laid out closely
+        two_qubit_gates = [gate for gate in dag.two_qubit_ops() if not dag.has_calibration_for(gate)]
+        pairs = np.asarray(
+            [[qubit_indices[qarg] for qarg in gate.qargs] for gate in two_qubit_gates], dtype=np.int64
+        ).reshape(-1, 2)
+        pairs_ok = adjacency[pairs[:, 0], pairs[:, 1]]
 
+        #the qubits for three qubit gates must be laid out according to the six-cnot expansion
+        #i.e. all qubits are adjacent to each other
+        toffolis = dag.multi_qubit_ops()
+        for gate in toffolis:
             #assert that toffoli is the only multi qubit gate present
             assert gate.op.name == 'ccx'
-
-            #get the physical qubits
-            physical_q0 = qubit_indices[gate.qargs[0]]
-            physical_q1 = qubit_indices[gate.qargs[1]]
-            physical_q2 = qubit_indices[gate.qargs[2]]
-
-            #check the adjacent proximity for all three pairs of qubits
-            #first for (q0, q1)
-            if self.coupling_map.distance(physical_q0, physical_q1) != 1:
-                self.property_set["check_map_msg"] = "{}({}, {}) failed".format(
-                    gate.name,
-                    physical_q0,
-                    physical_q1,
-                )
-                self.property_set["is_swap_mapped"] = False
-                return
-
-            #then for (q1, q2)
-            if self.coupling_map.distance(physical_q1, physical_q2) != 1:
-                self.property_set["check_map_msg"] = "{}({}, {}) failed".format(
-                    gate.name,
-                    physical_q1,
-                    physical_q2,
-                )
-                self.property_set["is_swap_mapped"] = False
-                return
-
-            #finally for (q0, q2)
-            if self.coupling_map.distance(physical_q0, physical_q2) != 1:
-                self.property_set["check_map_msg"] = "{}({}, {}) failed".format(
-                    gate.name,
-                    physical_q0,
-                    physical_q2,
-                )
-                self.property_set["is_swap_mapped"] = False
-                return
-
-
-
+        triples = np.asarray(
+            [[qubit_indices[qarg] for qarg in gate.qargs] for gate in toffolis], dtype=np.int64
+        ).reshape(-1, 3)
+        #the three pairs are checked in the order (q0, q1), (q1, q2), (q0, q2)
+        triple_pairs_ok = np.stack(
+            [
+                adjacency[triples[:, 0], triples[:, 1]],
+                adjacency[triples[:, 1], triples[:, 2]],
+                adjacency[triples[:, 0], triples[:, 2]],
+            ],
+            axis=1,
+        )
+
+        violations = []
+        first_pair = None
+        for index in np.flatnonzero(~pairs_ok):
+            physical_qubits = tuple(int(qubit) for qubit in pairs[index])
+            violations.append((two_qubit_gates[index].name, physical_qubits))
+            if first_pair is None:
+                first_pair = (two_qubit_gates[index].name,) + physical_qubits
+        for index in np.flatnonzero(~triple_pairs_ok.all(axis=1)):
+            physical_qubits = tuple(int(qubit) for qubit in triples[index])
+            violations.append((toffolis[index].name, physical_qubits))
+            if first_pair is None:
+                first, second = ((0, 1), (1, 2), (0, 2))[int(np.argmin(triple_pairs_ok[index]))]
+                first_pair = (toffolis[index].name, physical_qubits[first], physical_qubits[second])
+
+        if violations:
+            self.property_set["check_map_msg"] = "{}({}, {}) failed".format(*first_pair)
+            self.property_set["is_swap_mapped"] = False
+            self.property_set["check_map_violations"] = violations
+            self.property_set["check_map_violation_count"] = len(violations)
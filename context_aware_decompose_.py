@@ -24,19 +24,268 @@ from qiskit.circuit import QuantumRegister
 from qiskit.circuit.library.standard_gates.rx import RXGate
 from qiskit.circuit.library.standard_gates.ry import RYGate
 from qiskit.circuit.library.standard_gates.rz import RZGate
+from qiskit.circuit.library.standard_gates.x import CXGate
 import numpy as np
+import copy
+import logging
+from collections import Counter
 
 from gate_variants.toffoli_variants import CCX_Variant_Gate
 from gate_variants.cx_variants import CX_Variant_Gate
 from gate_variants.bridge_variants import Bridge_Variant_Gate
 from gate_variants.swap_variants import SWAP_Variant_Gate
 import qiskit_superstaq
+from gate_variants.rule_tables import freeze_rules, materialize_rules
+from coupling_tables import get_coupling_tables
+
+
+logger = logging.getLogger(__name__)
+
+_GATE_KINDS = {"acecr": qiskit_superstaq.AceCR, "cx": CXGate, "rx": RXGate, "ry": RYGate, "rz": RZGate}
+
+#The pulse level CNOT variants ('f'orward and 'b'ackward links) and the bridge gate variants,
+#built once at import time. Each rule is a (gate kind, params, qubit index) tuple.
+_CNOT_VARIANT_RULES = freeze_rules({
+    ('00', '11', 'f'): (
+        ("acecr", ("+-",), (0, 1)),
+        ("ry", (np.pi,), (0,)),
+        ("rx", (-np.pi/2,), (1,)),
+        ("rz", (-np.pi/2,), (0,)),
+    ),
+    ('11', '00', 'f'): (
+        ("rz", (np.pi/2,), (0,)),
+        ("ry", (np.pi,), (0,)),
+        ("rx", (np.pi/2,), (1,)),
+        ("acecr", ("+-",), (0, 1)),
+    ),
+    ('01', '10', 'f'): (
+        ("rz", (np.pi/2,), (0,)),
+        ("rx", (np.pi/2,), (1,)),
+        ("acecr", ("-+",), (0, 1)),
+        ("rx", (np.pi,), (0,)),
+    ),
+    ('10', '01', 'f'): (
+        ("rx", (np.pi/2,), (0,)),
+        ("acecr", ("-+",), (0, 1)),
+        ("rx", (-np.pi/2,), (1,)),
+        ("rz", (-np.pi/2,), (0,)),
+    ),
+    ('00', '11', 'b'): (
+        ("rz", (np.pi,), (0,)),
+        ("ry", (np.pi/2,), (0,)),
+        ("rz", (np.pi/2,), (1,)),
+        ("rx", (np.pi/2,), (1,)),
+        ("acecr", ("+-",), (1, 0)),
+        ("rz", (np.pi/2,), (0,)),
+        ("rx", (np.pi/2,), (0,)),
+        ("ry", (-np.pi/2,), (1,)),
+    ),
+    ('11', '00', 'b'): (
+        ("ry", (np.pi/2,), (1,)),
+        ("rx", (-np.pi/2,), (0,)),
+        ("rz", (-np.pi/2,), (0,)),
+        ("acecr", ("+-",), (1, 0)),
+        ("rx", (-np.pi/2,), (1,)),
+        ("rz", (-np.pi/2,), (1,)),
+        ("ry", (-np.pi/2,), (0,)),
+        ("rz", (-np.pi,), (0,)),
+    ),
+})
+
+_BRIDGE_VARIANT_RULES = freeze_rules({
+    ('12', '01'): (
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+    ),
+    ('01', '12'): (
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+    ),
+})
+
+
+#process-wide cache of pre-built variant dags keyed by (variant gate, variant_tag, index_order).
+#The cached dags are never handed out: every substitution receives a clone, so the entries
+#stay immutable for the lifetime of the process.
+_VARIANT_DAG_CACHE = {}
+_VARIANT_DAG_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def variant_dag_cache_info():
+    """Return the hit/miss counters and the current size of the variant dag cache."""
+    return {
+        "hits": _VARIANT_DAG_CACHE_STATS["hits"],
+        "misses": _VARIANT_DAG_CACHE_STATS["misses"],
+        "size": len(_VARIANT_DAG_CACHE),
+    }
+
+
+def clear_variant_dag_cache():
+    """Drop all cached variant dags and reset the hit/miss counters."""
+    _VARIANT_DAG_CACHE.clear()
+    _VARIANT_DAG_CACHE_STATS["hits"] = 0
+    _VARIANT_DAG_CACHE_STATS["misses"] = 0
+
+
+def _cached_variant_dag(key, build):
+    """Return the cached variant dag stored under `key`, building it with `build()` on a miss.
+
+    The returned dag is shared, callers must not modify it.
+    """
+    cached_dag = _VARIANT_DAG_CACHE.get(key)
+    if cached_dag is None:
+        _VARIANT_DAG_CACHE_STATS["misses"] += 1
+        cached_dag = build()
+        _VARIANT_DAG_CACHE[key] = cached_dag
+    else:
+        _VARIANT_DAG_CACHE_STATS["hits"] += 1
+    return cached_dag
+
+
+def _clone_variant_dag(cached_dag):
+    """Copy a cached variant dag.
+
+    The gate objects are deep copied, so a later pass modifying the definition of a gate in
+    the clone cannot alter the cached dag.
+    """
+    new_dag = DAGCircuit()
+    for qreg in cached_dag.qregs.values():
+        new_dag.add_qreg(qreg)
+    for node in cached_dag.topological_op_nodes():
+        new_dag.apply_operation_back(copy.deepcopy(node.op), node.qargs, node.cargs)
+    new_dag.global_phase = cached_dag.global_phase
+    return new_dag
+
+
+def _substitute_nodes(dag, substitutions, batch=True):
+    """Replace op nodes of `dag` by their decompositions or variant gates.
+
+    Args:
+        dag (DAGCircuit): the dag the nodes belong to
+        substitutions (list): (node, replacement) pairs, the replacement is either a DAGCircuit
+            whose qubits map to ``node.qargs`` in order, or a single Instruction. Replacement
+            dags may be shared between nodes, they are never modified.
+        batch (bool): if True, the output dag is emitted in a single topological sweep over
+            `dag`. Otherwise every node is substituted in place.
+    Returns:
+        DAGCircuit: the dag with all the substitutions applied
+    """
+    if not batch:
+        for node, replacement in substitutions:
+            if isinstance(replacement, DAGCircuit):
+                dag.substitute_node_with_dag(node, _clone_variant_dag(replacement))
+            else:
+                dag.substitute_node(node, replacement)
+        return dag
+
+    replacements = {node._node_id: replacement for node, replacement in substitutions}
+    new_dag = dag._copy_circuit_metadata()
+    for node in dag.topological_op_nodes():
+        replacement = replacements.get(node._node_id)
+        if replacement is None:
+            new_dag.apply_operation_back(node.op, node.qargs, node.cargs)
+            continue
+        condition = getattr(node.op, "condition", None)
+        if isinstance(replacement, DAGCircuit):
+            wire_map = dict(zip(replacement.qubits, node.qargs))
+            for replacement_node in replacement.topological_op_nodes():
+                #deep copied, the definition of the cached gate must not be shared with the output
+                op = copy.deepcopy(replacement_node.op)
+                if condition is not None:
+                    op.condition = condition
+                new_dag.apply_operation_back(op, [wire_map[qarg] for qarg in replacement_node.qargs], [])
+            new_dag.global_phase += replacement.global_phase
+        else:
+            if condition is not None:
+                replacement = replacement.copy()
+                replacement.condition = condition
+            new_dag.apply_operation_back(replacement, node.qargs, node.cargs)
+    return new_dag
+
+
+class _PendingDecisions:
+    """Variant decisions taken ahead of time for op nodes of a dag, keyed by the node id.
+
+    A pass records a node (and optionally its variant tag) when its variant is fixed while
+    analysing an earlier node, membership and tag lookups then take constant time.
+    """
+
+    def __init__(self):
+        self._tags = {}
+
+    def add(self, node, tag=None):
+        self._tags[node._node_id] = tag
+
+    def tag(self, node):
+        return self._tags[node._node_id]
+
+    def __contains__(self, node):
+        return node._node_id in self._tags
+
+    def __len__(self):
+        return len(self._tags)
+
+
+class _DAGNeighborhood:
+    """Lookup tables for the context analysis of a dag, built in a single topological sweep.
+
+    For every op node the previous and next op node on each of its qubit wires are stored
+    in lists aligned with ``node.qargs``, and every node of ``blocks`` is indexed to the
+    2q block it belongs to. All lookups are keyed by the node id and take constant time.
+    The quantum successors and predecessors keep the order of ``dag.quantum_successors``
+    and ``dag.quantum_predecessors``, the first matching neighbor decides a variant tag.
+    """
+
+    def __init__(self, dag, blocks=None):
+        self.dag = dag
+        self.prev_nodes = {}
+        self.next_nodes = {}
+        last_on_wire = {}
+        for node in dag.topological_op_nodes():
+            prev_nodes = []
+            for wire in node.qargs:
+                prev_node = last_on_wire.get(wire)
+                prev_nodes.append(prev_node)
+                if prev_node is not None:
+                    self.next_nodes[prev_node._node_id][prev_node.qargs.index(wire)] = node
+                last_on_wire[wire] = node
+            self.prev_nodes[node._node_id] = prev_nodes
+            self.next_nodes[node._node_id] = [None] * len(node.qargs)
+
+        self.block_of = {}
+        for block_index, block in enumerate(blocks or []):
+            for block_node in block:
+                self.block_of[block_node._node_id] = block_index
+
+    def next_node_on_wire(self, node, wire):
+        """The op node following `node` on `wire`, None if `node` is the last op on the wire."""
+        return self.next_nodes[node._node_id][node.qargs.index(wire)]
+
+    def prev_node_on_wire(self, node, wire):
+        """The op node preceding `node` on `wire`, None if `node` is the first op on the wire."""
+        return self.prev_nodes[node._node_id][node.qargs.index(wire)]
+
+    def quantum_successors(self, node):
+        """The op nodes directly following `node` on its qubit wires, in the order of the dag."""
+        return [successor for successor in self.dag.quantum_successors(node) if successor.type == "op"]
+
+    def quantum_predecessors(self, node):
+        """The op nodes directly preceding `node` on its qubit wires, in the order of the dag."""
+        return [predecessor for predecessor in self.dag.quantum_predecessors(node) if predecessor.type == "op"]
+
+    def block_index(self, node):
+        """Index of the 2q block containing `node` in the block list, None if it is in none."""
+        return self.block_of.get(node._node_id)
 
 
 class UnrollToffoliContextAware_(TransformationPass):
     """Recursively expands all toffoli gates until the circuit only contains 2q or 1q gates."""
 
-    def __init__(self, coupling_map):
+    def __init__(self, coupling_map, batch=True):
         '''
         Initialize the UnrollToffoli pass. This pass does a layout aware decomposition of the toffoli
         gate. If all three qubits of the toffoli are mapped to each other, we do a 6 qubit decomposition
@@ -44,9 +293,12 @@ class UnrollToffoliContextAware_(TransformationPass):
 
         Args:
             coupling_map(CouplingMap) : directed graph representing a coupling map
+            batch(bool) : if True, the variant of every toffoli is decided first and the output dag
+                is emitted in a single rebuild. Otherwise the toffolis are substituted in place.
         '''
         super().__init__()
         self.coupling_map = coupling_map
+        self.batch = batch
 
     def run(self, dag):
         """Run the UnrollToffoli_ pass on `dag`.
@@ -59,8 +311,23 @@ class UnrollToffoliContextAware_(TransformationPass):
             QiskitError: if a 3q+ gate is not decomposable
         """
         multi_qubit_op_list = dag.multi_qubit_ops()
-        substituted_nodes = []
-        substituted_tags = []
+        substituted_nodes = _PendingDecisions()
+        decomposition_counts = Counter()
+        #the (node, variant dag) decisions, applied to the dag after the analysis sweep
+        substitutions = []
+
+        #The layout has been applied to the dag. So we do not need that information
+        canonical_register = dag.qregs["q"]
+        current_layout = Layout.generate_trivial_layout(canonical_register)
+
+        #the neighborhood of every node and its 2q block are looked up in the tables built here,
+        #the analysis therefore sees the circuit as it was before any toffoli got substituted
+        neighborhood = _DAGNeighborhood(dag, self.property_set["block_list"])
+
+        coupling_tables = get_coupling_tables(self.coupling_map)
+        adjacency = coupling_tables.adjacency
+        distance_matrix = coupling_tables.distance_matrix
+
         for node in multi_qubit_op_list:
 
             assert node.op.name == 'ccx'
@@ -69,10 +336,6 @@ class UnrollToffoliContextAware_(TransformationPass):
                 continue
 
             # substitute the toffoli gate with its 6/8 qubit decomposition based on the layout
-            #The layout has been applied to the dag. So we do not need that information
-            canonical_register = dag.qregs["q"]
-            trivial_layout = Layout.generate_trivial_layout(canonical_register)
-            current_layout = trivial_layout.copy()
 
             #converting the datatype 'qubit' to the datatype 'int'
             control1 = current_layout[node.qargs[0]]
@@ -85,14 +348,14 @@ class UnrollToffoliContextAware_(TransformationPass):
             #print('The distances between the toffoli qubits are: ', self.coupling_map.distance(control1, target), 'between qubits 0 and 2')
 
             #now compute the distances
-            bool1 = self.coupling_map.distance(control1, control2) == 1
-            bool2 = self.coupling_map.distance(control2, target) == 1
-            bool3 = self.coupling_map.distance(control1, target) == 1
+            bool1 = adjacency[control1, control2]
+            bool2 = adjacency[control2, target]
+            bool3 = adjacency[control1, target]
 
             #distances
-            d1 = self.coupling_map.distance(control1, control2)
-            d2 = self.coupling_map.distance(control2, target)
-            d3 = self.coupling_map.distance(control1, target)
+            d1 = distance_matrix[control1, control2]
+            d2 = distance_matrix[control2, target]
+            d3 = distance_matrix[control1, target]
 
             variant_tag = ['00','00','f','p']
             variant_tag_succ = ['00','00','f','p']
@@ -100,15 +363,15 @@ class UnrollToffoliContextAware_(TransformationPass):
             if bool1 and bool2 and bool3:
 
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using a 6 cnot decomposition')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: a 6 cnot decomposition', control1, control2, target)
+                decomposition_counts['6cx'] += 1
                 index_order = [0, 1, 2]
                 #create a 6 cnot circuit
             #if physical qubit 1 is connected to both but zero and two are not connected
             elif bool1 and bool2 and (not bool3):
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - one in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - one in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
                 variant_tag[-2] = variant_tag_succ[-2] = 'l1' #+ str(actual_order.index(control2))
 #                     variant_dag = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag = ('01', '12', 'l1', 'p'), index_order = [0,1,2])
 #                     dag.substitute_node_with_dag(node, variant_dag)
@@ -116,16 +379,16 @@ class UnrollToffoliContextAware_(TransformationPass):
             #if physical qubit 0 is connected to both but one and two are not connected
             elif bool1 and (not bool2) and bool3:
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - zero in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - zero in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
                 variant_tag[-2] = variant_tag_succ[-2] = 'l0' #+ str(actual_order.index(control1))
 #                     variant_dag = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag = ('01', '12', 'l0', 'p'), index_order = [1,0,2])
 #                     dag.substitute_node_with_dag(node, variant_dag)
 
             #if physical qubit 2 is connected to both but 0 and 1 are not connected
             elif (not bool1) and bool2 and bool3:
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - two in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - two in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
                 variant_tag[-2] = variant_tag_succ[-2] = 'l2' #+ str(actual_order.index(target))
 #                     variant_dag = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag = ('01', '12', 'l2', 'p'), index_order = [0,2,1])
 #                     dag.substitute_node_with_dag(node, variant_dag)
@@ -133,20 +396,20 @@ class UnrollToffoliContextAware_(TransformationPass):
 
             else:
 
-                print('The routing pass is not correct')
+                logger.warning('The routing pass is not correct, toffoli on physical qubits %s, %s, %s is not routed', control1, control2, target)
+                decomposition_counts['unrouted'] += 1
             
             if node in substituted_nodes:
-                variant_tag = substituted_tags[substituted_nodes.index(node)]
+                variant_tag = substituted_nodes.tag(node)
                 variant_tag[-2] = variant_tag_succ[-2]
-                print("sub_tag before optimize", variant_tag)
+                logger.debug("sub_tag before optimize %s", variant_tag)
                 
-                successors = list(dag.quantum_successors(node))
-                blocks = self.property_set["block_list"]
+                successors = neighborhood.quantum_successors(node)
                 two_qubit_block = []
                 for successor in successors:
                     if successor.name in {'ccx'}:
-                        variant_tag, variant_tag_succ = UnrollToffoliContextAware_.specify_variant_succ_ccx_tag(dag, variant_tag, variant_tag_succ, node, successor, last_tag = 'p')
-                        print("calculated tags for substituted", variant_tag, variant_tag_succ)
+                        variant_tag, variant_tag_succ = UnrollToffoliContextAware_.specify_variant_succ_ccx_tag(neighborhood, variant_tag, variant_tag_succ, node, successor, last_tag = 'p')
+                        logger.debug("calculated tags for substituted %s %s", variant_tag, variant_tag_succ)
                         if variant_tag_succ[0:2] != ['00','00']:
                             #the variant_tag_succ has been specified, add the successor to the substituted nodes
 #                             substituted_nodes.append(successor)
@@ -172,9 +435,9 @@ class UnrollToffoliContextAware_(TransformationPass):
 #                         variant_tag[1] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
 #                         two_qubit_block = []
                         
-                print("the optimized substituted tag", variant_tag)
-                variant_dag = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag=tuple(variant_tag))
-                dag.substitute_node_with_dag(node, variant_dag)
+                logger.debug("the optimized substituted tag %s", variant_tag)
+                variant_dag = UnrollToffoliContextAware_._cached_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag=tuple(variant_tag))
+                substitutions.append((node, variant_dag))
                 pass
             else:
 #                 order_list = [control1, control2, target]
@@ -183,39 +446,34 @@ class UnrollToffoliContextAware_(TransformationPass):
                 
 #                 index_order = [orign_list.index(order_list[0]),orign_list.index(order_list[1]),orign_list.index(order_list[2]) ]
 #                 print("index_order",index_order)
-                predecessors = list(dag.quantum_predecessors(node))
-                successors = list(dag.quantum_successors(node))
-                blocks = self.property_set["block_list"]
+                predecessors = neighborhood.quantum_predecessors(node)
+                successors = neighborhood.quantum_successors(node)
                 #the variant_tag specifies the gate decomposition. ['predecessor', 'successor', 'linear/fullyconnected', 'heavy on predecessor/successor'] First, check all the predecessors and specify the first tag based on the predecessors. Then traverse the successors and specify the second tag 'successor'. The 'linear/fullyconnected' are specified based on the physical qubit connectivity. The last tag 'heavy' is specified while checking both predecessor. The tags are based on the order of the first CNOT gate. For example, '01' means the first cnot gate's control qubit is 0 and target qubit is 1. The initial value is '00'.
                 #first we need to consider the successors to identify the gate cancellation with inversed gates
                 two_qubit_block = []
-                for successor in successors:
+                for suc_index, successor in enumerate(successors):
                     #print(successor.name)
                     if successor.name in {'ccx'}:
-                        variant_tag, variant_tag_succ = UnrollToffoliContextAware_.specify_variant_succ_ccx_tag(dag, variant_tag, variant_tag_succ, node, successor)
-                        print("calculated tags", variant_tag, variant_tag_succ)
+                        variant_tag, variant_tag_succ = UnrollToffoliContextAware_.specify_variant_succ_ccx_tag(neighborhood, variant_tag, variant_tag_succ, node, successor)
+                        logger.debug("calculated tags %s %s", variant_tag, variant_tag_succ)
                         if variant_tag_succ[0:2] != ['00','00']:
                             #the variant_tag_succ has been specified, add the successor to the substituted nodes
-                            substituted_nodes.append(successor)
-                            substituted_tags.append(variant_tag_succ)
+                            substituted_nodes.add(successor, variant_tag_succ)
 #                             variant_dag_succ = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag=tuple(variant_tag_succ))
 #                             dag.substitute_node_with_dag(successor, variant_dag_succ)
                             variant_tag_succ = ['00','00','f','p']
                             break
                     if successor.name in {'cx', 'swap'}:
-                        variant_tag = UnrollToffoliContextAware_.specify_variant_succ_cx_tag(dag, variant_tag, node, successor)
+                        variant_tag = UnrollToffoliContextAware_.specify_variant_succ_cx_tag(neighborhood, variant_tag, node, successor)
                     #search for two qubit blocks:
-                    for block in blocks:
-                        if successor in block:
-                            suc_index = successors.index(successor)
-                            if suc_index != len(successors) - 1: #if it's not the last one
-                                for successor2 in successors[suc_index + 1:]:
-                                    if successor2 in block:
-                                        two_qubit_block = [successor, successor2]
-                                        break
+                    block_index = neighborhood.block_index(successor)
+                    if block_index is not None:
+                        for successor2 in successors[suc_index + 1:]:
+                            if neighborhood.block_index(successor2) == block_index:
+                                two_qubit_block = [successor, successor2]
+                                break
                     if len(two_qubit_block) != 0:
-                        print("identified two_qubit block for successor")
-                        print(successor.qargs, successor2.qargs)
+                        logger.debug("identified two_qubit block for successor %s %s", successor.qargs, successor2.qargs)
                         intersect = [value for value in node.qargs if value in successor.qargs or value in successor2.qargs]
                         variant_tag[1] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
                         variant_tag[-1] = 's'
@@ -223,53 +481,51 @@ class UnrollToffoliContextAware_(TransformationPass):
                 two_qubit_block = []
 
 
-                for predecessor in predecessors:
+                for pre_index, predecessor in enumerate(predecessors):
                     if predecessor.name in {'cx', 'swap'}:
-                        variant_tag = UnrollToffoliContextAware_.specify_variant_pre_cx_tag(dag, variant_tag, node, predecessor)
+                        variant_tag = UnrollToffoliContextAware_.specify_variant_pre_cx_tag(neighborhood, variant_tag, node, predecessor)
                         
                     #search for two qubit blocks:
-                    for block in blocks:
-                        if predecessor in block:
-                            pre_index = predecessors.index(predecessor)
-                            if pre_index != len(predecessors) - 1: #if it's not the last one
-                                for predecessor2 in predecessors[pre_index + 1:]:
-                                    if predecessor2 in block:
-                                        two_qubit_block = [predecessor, predecessor2]
-                                        break
+                    block_index = neighborhood.block_index(predecessor)
+                    if block_index is not None:
+                        for predecessor2 in predecessors[pre_index + 1:]:
+                            if neighborhood.block_index(predecessor2) == block_index:
+                                two_qubit_block = [predecessor, predecessor2]
+                                break
                     if len(two_qubit_block) != 0:
-                        print("identified two_qubit block for predecessor")
-                        print(predecessor.qargs, predecessor2.qargs)
+                        logger.debug("identified two_qubit block for predecessor %s %s", predecessor.qargs, predecessor2.qargs)
                         intersect = [value for value in node.qargs if value in predecessor.qargs or value in predecessor2.qargs]
                         variant_tag[0] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
                         variant_tag[-1] = 'p'
                         two_qubit_block = []
                
                 
-                variant_dag = UnrollToffoliContextAware_.get_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag=tuple(variant_tag),index_order = [0,1,2])
-                return_val = dag.substitute_node_with_dag(node, variant_dag)
+                variant_dag = UnrollToffoliContextAware_._cached_Toffoli_variant_dag(CCX_Variant_Gate, variant_tag=tuple(variant_tag),index_order = [0,1,2])
+                substitutions.append((node, variant_dag))
 
-        return dag
+        self.property_set["toffoli_decomposition_counts"] = decomposition_counts
+        return _substitute_nodes(dag, substitutions, self.batch)
     @staticmethod
-    def specify_variant_pre_cx_tag(dag, variant_tag, node, predecessor):
+    def specify_variant_pre_cx_tag(neighborhood, variant_tag, node, predecessor):
         intersect = [value for value in node.qargs if value in predecessor.qargs]
         # check length
         if len(intersect) == 2:
-            cond1 = dag.next_node_on_wire(node=predecessor, wire = intersect[0]) is node
-            cond2 = dag.next_node_on_wire(node=predecessor, wire = intersect[1]) is node
-            print("predecessor {} two intersection conditions:{}{}".format(predecessor.name, cond1, cond2))
+            cond1 = neighborhood.next_node_on_wire(node=predecessor, wire = intersect[0]) is node
+            cond2 = neighborhood.next_node_on_wire(node=predecessor, wire = intersect[1]) is node
+            logger.debug("predecessor %s two intersection conditions: %s %s", predecessor.name, cond1, cond2)
             #make sure there is no gate between the intersection qargs.
             if cond1 and cond2:
                 variant_tag[0] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
                 #don't need to set the last tag since it's already been set to 'p'
         return variant_tag
     @staticmethod
-    def specify_variant_succ_cx_tag(dag, variant_tag, node, successor, last_tag = 's'):
+    def specify_variant_succ_cx_tag(neighborhood, variant_tag, node, successor, last_tag = 's'):
         intersect = [value for value in node.qargs if value in successor.qargs]
         # check length
         if len(intersect) == 2:
-            cond1 = dag.next_node_on_wire(node=node, wire = intersect[0]) is successor
-            cond2 = dag.next_node_on_wire(node=node, wire = intersect[1]) is successor
-            print("successor {} two intersection conditions:{}{}".format(successor.name, cond1, cond2))
+            cond1 = neighborhood.next_node_on_wire(node=node, wire = intersect[0]) is successor
+            cond2 = neighborhood.next_node_on_wire(node=node, wire = intersect[1]) is successor
+            logger.debug("successor %s two intersection conditions: %s %s", successor.name, cond1, cond2)
             #make sure there is no gate between the intersection qargs.
             if cond1 and cond2:
                 variant_tag[1] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
@@ -298,13 +554,13 @@ class UnrollToffoliContextAware_(TransformationPass):
 #         return variant_tag
     
     @staticmethod
-    def specify_variant_succ_ccx_tag(dag, variant_tag, variant_tag_succ, node, successor, last_tag = 's'):
+    def specify_variant_succ_ccx_tag(neighborhood, variant_tag, variant_tag_succ, node, successor, last_tag = 's'):
         intersect = [value for value in node.qargs if value in successor.qargs]
         # check length
         if len(intersect) == 2:
-            cond1 = dag.next_node_on_wire(node=node, wire = intersect[0]) is successor
-            cond2 = dag.next_node_on_wire(node=node, wire = intersect[1]) is successor
-            print("two intersection conditions", cond1, cond2)
+            cond1 = neighborhood.next_node_on_wire(node=node, wire = intersect[0]) is successor
+            cond2 = neighborhood.next_node_on_wire(node=node, wire = intersect[1]) is successor
+            logger.debug("two intersection conditions %s %s", cond1, cond2)
             #make sure there is no gate between the intersection qargs.
             if cond1 and cond2:
                 variant_tag[1] = str(node.qargs.index(intersect[0])) + str(node.qargs.index(intersect[1]))
@@ -316,11 +572,11 @@ class UnrollToffoliContextAware_(TransformationPass):
                 return variant_tag, variant_tag_succ
         elif len(intersect) == 3:
             #make sure there is only one gate in between
-            cond1 = dag.next_node_on_wire(node=node, wire = intersect[0]) is successor
-            cond2 = dag.next_node_on_wire(node=node, wire = intersect[1]) is successor
-            cond3 = dag.next_node_on_wire(node=node, wire = intersect[2]) is successor
-            print("three intersection conditions", cond1, cond2, cond3)
-            print("three qargs", intersect[0], intersect[1], intersect[2])
+            cond1 = neighborhood.next_node_on_wire(node=node, wire = intersect[0]) is successor
+            cond2 = neighborhood.next_node_on_wire(node=node, wire = intersect[1]) is successor
+            cond3 = neighborhood.next_node_on_wire(node=node, wire = intersect[2]) is successor
+            logger.debug("three intersection conditions %s %s %s", cond1, cond2, cond3)
+            logger.debug("three qargs %s %s %s", intersect[0], intersect[1], intersect[2])
             if cond1 is True:
                 if cond2 is True:
                     #All true TTT or first two conditions are true: TTF
@@ -359,18 +615,44 @@ class UnrollToffoliContextAware_(TransformationPass):
     
     @staticmethod
     def get_Toffoli_variant_dag(variant_gate, variant_tag, index_order = [0,1,2]):
+        """Return the dag of a Toffoli variant, cloned from the process-wide variant dag cache.
+
+        Args:
+            variant_gate (type): the variant gate class, e.g. CCX_Variant_Gate
+            variant_tag (tuple): the variant tag of the decomposition
+            index_order (list): the order of the register qubits the gate is applied on
+        Returns:
+            DAGCircuit: a three qubit dag containing the variant gate
+        """
+        return _clone_variant_dag(
+            UnrollToffoliContextAware_._cached_Toffoli_variant_dag(variant_gate, variant_tag, index_order)
+        )
+
+    @staticmethod
+    def _cached_Toffoli_variant_dag(variant_gate, variant_tag, index_order = [0,1,2]):
+        key = (variant_gate, tuple(variant_tag), tuple(index_order))
+        return _cached_variant_dag(
+            key,
+            lambda: UnrollToffoliContextAware_._build_Toffoli_variant_dag(variant_gate, tuple(variant_tag), index_order),
+        )
+
+    @staticmethod
+    def _build_Toffoli_variant_dag(variant_gate, variant_tag, index_order):
         new_dag = DAGCircuit()
         reg = QuantumRegister(3)
         new_dag.add_qreg(reg)
         regList = [reg[index_order[0]], reg[index_order[1]], reg[index_order[2]]]
-        new_dag.apply_operation_back(variant_gate(variant_tag=variant_tag), regList)
+        gate = variant_gate(variant_tag=variant_tag)
+        #build the decomposition once here, the clones handed out share it
+        gate.definition
+        new_dag.apply_operation_back(gate, regList)
         return new_dag
     
     
 class UnrollCnotContextAware_(TransformationPass):
     """Recursively expands all toffoli gates until the circuit only contains 2q or 1q gates."""
 
-    def __init__(self, coupling_map, orientation_map):
+    def __init__(self, coupling_map, orientation_map, batch=True):
         '''
         Initialize the UnrollToffoli pass. This pass does a layout aware decomposition of the toffoli
         gate. If all three qubits of the toffoli are mapped to each other, we do a 6 qubit decomposition
@@ -378,10 +660,13 @@ class UnrollCnotContextAware_(TransformationPass):
 
         Args:
             coupling_map(CouplingMap) : directed graph representing a coupling map
+            batch(bool) : if True, the output dag is emitted in a single rebuild after all the
+                variants are decided. Otherwise the gates are substituted in place.
         '''
         super().__init__()
         self.coupling_map = coupling_map
         self.orientation_map = orientation_map
+        self.batch = batch
 
     def run(self, dag):
         """Run the UnrollCnotContextAware_ pass on `dag`.
@@ -398,7 +683,8 @@ class UnrollCnotContextAware_(TransformationPass):
         current_layout = trivial_layout.copy()
             
         orientation_map = self.orientation_map
-        substituted_nodes = []
+        substituted_nodes = _PendingDecisions()
+        substitutions = []
         for node in dag.two_qubit_ops():
             assert node.op.name == 'cx'
             if node in substituted_nodes:
@@ -411,13 +697,12 @@ class UnrollCnotContextAware_(TransformationPass):
                     target = current_layout[node.qargs[1]]
                     #set the orientation based on the orientation map
                     orientation = orientation_map[(control, target)]
-                    predecessors = list(dag.quantum_predecessors(node))
                     successors = list(dag.quantum_successors(node))
                     flag = True
                     for successor in successors:
-                        if successor.name in {'cx'}:
+                        if successor.name in {'cx'} and successor not in substituted_nodes:
                             intersect = [value for value in node.qargs if value in successor.qargs]
-                            print("intersect", intersect)
+                            logger.debug("intersect %s", intersect)
                             # check length
                             if len(intersect) == 2:
                                 #these two CNOTs apply to the same qubits, first check the direction of the link. Then check if two CNOTs have the same controll qubit.
@@ -428,12 +713,12 @@ class UnrollCnotContextAware_(TransformationPass):
                                 #these two CNOTs have the same direction or different direction we just need to set the orientation accordingly
                                 variant_tag = ['00', '11'] + [orientation]
                                 variant_tag_succ = ['11', '00'] + [orientation_succ]
-                                variant_dag = UnrollCnotContextAware_.get_CNOT_variant_dag(variant_tag = tuple(variant_tag))
-                                dag.substitute_node_with_dag(node, variant_dag)  
-                                variant_dag_succ = UnrollCnotContextAware_.get_CNOT_variant_dag(variant_tag = tuple(variant_tag_succ))                   
-                                dag.substitute_node_with_dag(successor, variant_dag_succ)
-                                substituted_nodes.append(successor)
-                                substituted_nodes.append(node)
+                                variant_dag = UnrollCnotContextAware_._cached_CNOT_variant_dag(variant_tag = tuple(variant_tag))
+                                substitutions.append((node, variant_dag))
+                                variant_dag_succ = UnrollCnotContextAware_._cached_CNOT_variant_dag(variant_tag = tuple(variant_tag_succ))
+                                substitutions.append((successor, variant_dag_succ))
+                                substituted_nodes.add(successor)
+                                substituted_nodes.add(node)
                                 flag = False
                                 break
                     if flag == True:
@@ -442,14 +727,26 @@ class UnrollCnotContextAware_(TransformationPass):
                         variant_tag = ['11', '00', 'f']
                         if orientation == 'b':
                             variant_tag = ['00', '11', 'b']
-                        variant_dag = UnrollCnotContextAware_.get_CNOT_variant_dag(variant_tag = tuple(variant_tag))
-                        dag.substitute_node_with_dag(node, variant_dag)
-        return dag
+                        variant_dag = UnrollCnotContextAware_._cached_CNOT_variant_dag(variant_tag = tuple(variant_tag))
+                        substitutions.append((node, variant_dag))
+        return _substitute_nodes(dag, substitutions, self.batch)
     
     
     
     @staticmethod
     def get_CNOT_variant_dag(variant_tag = ('00', '11', 'd'), index_order = [0,1]):
+        """Return the dag of a CNOT variant, cloned from the process-wide variant dag cache."""
+        return _clone_variant_dag(UnrollCnotContextAware_._cached_CNOT_variant_dag(variant_tag, index_order))
+
+    @staticmethod
+    def _cached_CNOT_variant_dag(variant_tag = ('00', '11', 'd'), index_order = [0,1]):
+        return _cached_variant_dag(
+            ("cx", tuple(variant_tag), tuple(index_order)),
+            lambda: UnrollCnotContextAware_._build_CNOT_variant_dag(tuple(variant_tag), index_order),
+        )
+
+    @staticmethod
+    def _build_CNOT_variant_dag(variant_tag = ('00', '11', 'd'), index_order = [0,1]):
         
         q = QuantumRegister(2, "q")
         qc = QuantumCircuit(q)
@@ -466,65 +763,13 @@ class UnrollCnotContextAware_(TransformationPass):
 
     @staticmethod
     def get_rules(q, variant_tag):
-        print(variant_tag)
-        variant_rules = {
-            ('00', '11', 'f'): [
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-            ('11', '00', 'f'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-            ],
-            ('01', '10', 'f'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(np.pi), [q[0]], []),
-            ],
-            ('10', '01', 'f'): [
-                (RXGate(np.pi/2), [q[0]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-            
-            
-            
-            ('00', '11', 'b'): [
-                (RZGate(np.pi), [q[0]], []),
-                (RYGate(np.pi/2), [q[0]], []),
-                (RZGate(np.pi/2), [q[1]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[1], q[0]], []),
-                (RZGate(np.pi/2), [q[0]], []),
-                (RXGate(np.pi/2), [q[0]], []),
-                (RYGate(-np.pi/2), [q[1]], []),
-            ],
-            ('11', '00', 'b'): [
-                (RYGate(np.pi/2), [q[1]], []),
-                (RXGate(-np.pi/2), [q[0]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[1], q[0]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[1]], []),
-                (RYGate(-np.pi/2), [q[0]], []),
-                (RZGate(-np.pi), [q[0]], []),
-            ],
-            
-          
-            }
-        return variant_rules[variant_tag]
+        return materialize_rules(_CNOT_VARIANT_RULES[variant_tag], q, _GATE_KINDS)
     
     
 class UnrollCnot_(TransformationPass):
     """Recursively expands all toffoli gates until the circuit only contains 2q or 1q gates."""
 
-    def __init__(self, coupling_map, orientation_map):
+    def __init__(self, coupling_map, orientation_map, batch=True):
         '''
         Initialize the UnrollToffoli pass. This pass does a layout aware decomposition of the toffoli
         gate. If all three qubits of the toffoli are mapped to each other, we do a 6 qubit decomposition
@@ -532,10 +777,13 @@ class UnrollCnot_(TransformationPass):
 
         Args:
             coupling_map(CouplingMap) : directed graph representing a coupling map
+            batch(bool) : if True, the output dag is emitted in a single rebuild after all the
+                variants are decided. Otherwise the gates are substituted in place.
         '''
         super().__init__()
         self.coupling_map = coupling_map
         self.orientation_map = orientation_map
+        self.batch = batch
 
     def run(self, dag):
         """Run the UnrollCnotContextAware_ pass on `dag`.
@@ -552,6 +800,7 @@ class UnrollCnot_(TransformationPass):
         current_layout = trivial_layout.copy()
             
         orientation_map = self.orientation_map
+        substitutions = []
         for node in dag.two_qubit_ops():
             assert node.op.name == 'cx'
 
@@ -567,87 +816,25 @@ class UnrollCnot_(TransformationPass):
                 variant_tag = ['11', '00'] + [orientation]
                 if orientation == 'b':
                     variant_tag = ['00', '11', 'b']
-                variant_dag = UnrollCnot_.get_CNOT_variant_dag(variant_tag = tuple(variant_tag))
-                dag.substitute_node_with_dag(node, variant_dag)
-        return dag
+                variant_dag = UnrollCnotContextAware_._cached_CNOT_variant_dag(variant_tag = tuple(variant_tag))
+                substitutions.append((node, variant_dag))
+        return _substitute_nodes(dag, substitutions, self.batch)
     
     
     
     @staticmethod
     def get_CNOT_variant_dag(variant_tag = ('00', '11', 'd'), index_order = [0,1]):
-        
-        q = QuantumRegister(2, "q")
-        qc = QuantumCircuit(q)
-        
-        try:
-            rules = UnrollCnotContextAware_.get_rules(q, variant_tag)
-        except:
-            raise AttributeError(f"Variant_tag({variant_tag})not defined")
-
-        for instr, qargs, cargs in rules:
-            qc._append(instr, qargs, cargs)
-        new_dag = circuit_to_dag(qc)
-        return new_dag
+        """Return the dag of a CNOT variant, cloned from the process-wide variant dag cache."""
+        return UnrollCnotContextAware_.get_CNOT_variant_dag(variant_tag, index_order)
 
     @staticmethod
     def get_rules(q, variant_tag):
-        variant_rules = {
-            ('00', '11', 'f'): [
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-            ('11', '00', 'f'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-            ],
-            ('01', '10', 'f'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(np.pi), [q[0]], []),
-            ],
-            ('10', '01', 'f'): [
-                (RXGate(np.pi/2), [q[0]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-            
-            
-            
-            ('00', '11', 'b'): [
-                (RZGate(np.pi), [q[0]], []),
-                (RYGate(np.pi/2), [q[0]], []),
-                (RZGate(np.pi/2), [q[1]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[1], q[0]], []),
-                (RZGate(np.pi/2), [q[0]], []),
-                (RXGate(np.pi/2), [q[0]], []),
-                (RYGate(-np.pi/2), [q[1]], []),
-            ],
-            ('11', '00', 'b'): [
-                (RYGate(np.pi/2), [q[1]], []),
-                (RXGate(-np.pi/2), [q[0]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[1], q[0]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[1]], []),
-                (RYGate(-np.pi/2), [q[0]], []),
-                (RZGate(-np.pi), [q[0]], []),
-            ],
-            
-          
-            }
-        return variant_rules[variant_tag]
+        return materialize_rules(_CNOT_VARIANT_RULES[variant_tag], q, _GATE_KINDS)
     
 class SWAPContextAware_(TransformationPass):
     """change SWAP to bridge gate and perform context-aware decompose"""
 
-    def __init__(self, coupling_map):
+    def __init__(self, coupling_map, batch=True):
         '''
         Initialize the UnrollToffoli pass. This pass does a layout aware decomposition of the toffoli
         gate. If all three qubits of the toffoli are mapped to each other, we do a 6 qubit decomposition
@@ -655,9 +842,12 @@ class SWAPContextAware_(TransformationPass):
 
         Args:
             coupling_map(CouplingMap) : directed graph representing a coupling map
+            batch(bool) : if True, the output dag is emitted in a single rebuild after all the
+                bridge variants are decided. Otherwise the swaps are substituted in place.
         '''
         super().__init__()
         self.coupling_map = coupling_map
+        self.batch = batch
 
     def run(self, dag):
         """Run the UnrollCnotContextAware_ pass on `dag`.
@@ -674,7 +864,9 @@ class SWAPContextAware_(TransformationPass):
         current_layout = trivial_layout.copy()
             
 #        orientation_map = self.orientation_map
-        substituted_nodes = []
+        substituted_nodes = _PendingDecisions()
+        substitutions = []
+        bridge_counts = Counter()
         for node in dag.two_qubit_ops():
             #assert node.op.name == 'cx'
             if node in substituted_nodes:
@@ -685,61 +877,68 @@ class SWAPContextAware_(TransformationPass):
                     successors = list(dag.quantum_successors(node))
                     flag = True
                     for successor in successors:
-                        if successor.name in {'swap', 'cx'}:
+                        if successor.name in {'swap', 'cx'} and successor not in substituted_nodes:
                             intersect = [value for value in node.qargs if value in successor.qargs]
-                            print("intersect", intersect)
+                            logger.debug("intersect %s", intersect)
                             # check length
                             if len(intersect) == 2:
                                 next_node_wire0 = dag.next_node_on_wire(node=node, wire = intersect[0])
                                 next_node_wire1 = dag.next_node_on_wire(node=node, wire = intersect[1])
                                 cond0 = next_node_wire0 is successor
                                 cond1 = next_node_wire1 is successor
-                                print("two intersection conditions", cond0, cond1)
+                                logger.debug("two intersection conditions %s %s", cond0, cond1)
                                 #make sure there is only one CX between the intersection qargs.
                                 if cond0 and next_node_wire1.op.name == 'cx' and dag.next_node_on_wire(node=next_node_wire1, wire = intersect[1]) is successor and next_node_wire1.qargs[0] == intersect[1]:
-                                    print("bridge Gate10")
-                                    dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('10')))
-                                    dag.substitute_node(successor, SWAP_Variant_Gate(variant_tag = ('10')))
-                                    substituted_nodes += [node, successor]
+                                    logger.debug("bridge Gate10")
+                                    bridge_counts['bridge'] += 1
+                                    substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('10'))))
+                                    substitutions.append((successor, SWAP_Variant_Gate(variant_tag = ('10'))))
+                                    substituted_nodes.add(node)
+                                    substituted_nodes.add(successor)
                                 elif cond1 and next_node_wire0.op.name == 'cx' and dag.next_node_on_wire(node=next_node_wire0, wire = intersect[0]) is successor and next_node_wire1.qargs[0] == intersect[0]:
-                                    print("bridge Gate01")
-                                    dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('01')))
-                                    dag.substitute_node(successor, SWAP_Variant_Gate(variant_tag = ('01')))
-                                    substituted_nodes += [node, successor]
+                                    logger.debug("bridge Gate01")
+                                    bridge_counts['bridge'] += 1
+                                    substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('01'))))
+                                    substitutions.append((successor, SWAP_Variant_Gate(variant_tag = ('01'))))
+                                    substituted_nodes.add(node)
+                                    substituted_nodes.add(successor)
                                 elif cond0 and cond1 and successor.name in {'cx'}:
                                     if intersect[0] == successor.qargs[0]:
-                                        dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('01')))
-                                        substituted_nodes += [node]
+                                        substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('01'))))
+                                        substituted_nodes.add(node)
                                     elif intersect[0] == successor.qargs[1]:
-                                        dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('10')))
-                                        substituted_nodes += [node]
+                                        substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('10'))))
+                                        substituted_nodes.add(node)
                                     else:
                                         raise AttributeError(f"incorrect qargs")
                     if node in substituted_nodes:
                         pass
                     else:
                         for predecessor in predecessors:
-                            if predecessor.name in {'cx'}:
+                            if predecessor.name in {'cx'} and predecessor not in substituted_nodes:
                                 intersect = [value for value in node.qargs if value in predecessor.qargs]
-                                print("intersect", intersect)
+                                logger.debug("intersect %s", intersect)
                                 # check length
                                 if len(intersect) == 2:
                                     next_node_wire0 = dag.next_node_on_wire(node=predecessor, wire = intersect[0])
                                     next_node_wire1 = dag.next_node_on_wire(node=predecessor, wire = intersect[1])
                                     cond0 = next_node_wire0 is node
                                     cond1 = next_node_wire1 is node
-                                    print("two intersection conditions", cond0, cond1)
+                                    logger.debug("two intersection conditions %s %s", cond0, cond1)
                                     if cond0 and cond1:
                                         if intersect[0] == predecessor.qargs[0]:
-                                            dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('01')))
-                                            substituted_nodes += [node]
+                                            substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('01'))))
+                                            substituted_nodes.add(node)
                                         elif intersect[0] == predecessor.qargs[1]:
-                                            dag.substitute_node(node, SWAP_Variant_Gate(variant_tag = ('10')))
-                                            substituted_nodes += [node]
+                                            substitutions.append((node, SWAP_Variant_Gate(variant_tag = ('10'))))
+                                            substituted_nodes.add(node)
                                         else:
                                             raise AttributeError(f"incorrect qargs")
                                     
-        return dag
+        #every swap that is not part of a bridge pair got an oriented swap variant
+        bridge_counts['oriented_swap'] = len(substituted_nodes) - 2 * bridge_counts['bridge']
+        self.property_set["bridge_substitution_counts"] = bridge_counts
+        return _substitute_nodes(dag, substitutions, self.batch)
     
     @staticmethod
     def get_bridge_variant_dag(variant_tag = ('12', '01'), index_order = [0,1]):
@@ -759,20 +958,5 @@ class SWAPContextAware_(TransformationPass):
 
     @staticmethod
     def get_rules(q, variant_tag):
-        variant_rules = {
-            ('12', '01'): [
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-            ],
-            ('01', '12'): [
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-            ],
-          
-            }
-        return variant_rules[variant_tag]
+        return materialize_rules(_BRIDGE_VARIANT_RULES[variant_tag], q, _GATE_KINDS)
     
\ No newline at end of file
@@ -0,0 +1,200 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2018.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""Distance and adjacency tables of a coupling map, shared by the layout, check and routing passes."""
+
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as cs
+
+
+#the tables are built once per coupling map and reused by every pass of a pipeline, the least
+#recently used coupling maps are dropped past COUPLING_TABLES_CACHE_SIZE
+COUPLING_TABLES_CACHE_SIZE = 64
+_COUPLING_TABLES_CACHE = OrderedDict()
+
+#the meeting point of every physical qubit triple takes n^3 bytes, only built for small devices
+MEETING_TABLE_MAX_QUBITS = 64
+
+
+def coupling_map_fingerprint(coupling_map):
+    """Return a hashable key identifying the connectivity of `coupling_map`.
+
+    The fingerprint is memoised on the coupling map. A CouplingMap only grows (edges and
+    qubits are added, never removed), so it is recomputed when its size or edge count changed.
+
+    Args:
+        coupling_map (CouplingMap): directed graph representing a coupling map
+    Returns:
+        tuple: the number of physical qubits and the frozen set of directed edges
+    """
+    shape = (coupling_map.size(), coupling_map.graph.num_edges())
+    memo = getattr(coupling_map, "_fingerprint_memo", None)
+    if memo is not None and memo[0] == shape:
+        return memo[1]
+    fingerprint = (coupling_map.size(), frozenset(coupling_map.get_edges()))
+    coupling_map._fingerprint_memo = (shape, fingerprint)
+    return fingerprint
+
+
+def get_coupling_tables(coupling_map):
+    """Return the (shared) CouplingTables of `coupling_map`, building them on the first call.
+
+    Args:
+        coupling_map (CouplingMap): directed graph representing a coupling map
+    Returns:
+        CouplingTables: the tables of the coupling map
+    """
+    key = coupling_map_fingerprint(coupling_map)
+    tables = _COUPLING_TABLES_CACHE.get(key)
+    if tables is None:
+        tables = CouplingTables(coupling_map)
+        _COUPLING_TABLES_CACHE[key] = tables
+        if len(_COUPLING_TABLES_CACHE) > COUPLING_TABLES_CACHE_SIZE:
+            _COUPLING_TABLES_CACHE.popitem(last=False)
+    else:
+        _COUPLING_TABLES_CACHE.move_to_end(key)
+    return tables
+
+
+def clear_coupling_tables_cache():
+    """Drop all the cached coupling tables."""
+    _COUPLING_TABLES_CACHE.clear()
+
+
+class CouplingTables:
+    """NumPy tables of a coupling map.
+
+    Attributes:
+        num_qubits (int): number of physical qubits
+        distance_matrix (ndarray): undirected all-pairs distances, shape (n, n)
+        adjacency (ndarray): bool matrix, True where two physical qubits are coupled in either direction
+        directed_adjacency (ndarray): bool matrix, True where (i, j) is an edge of the coupling map
+        neighbors (list): for every physical qubit, the list of the qubits it is coupled to
+        has_triangle (bool): True if three physical qubits are pairwise coupled somewhere on the device
+        predecessors (ndarray): all-pairs BFS tree, ``predecessors[i, j]`` is the qubit before j on
+            a shortest path from i to j
+    """
+
+    def __init__(self, coupling_map):
+        """Build the tables of `coupling_map`.
+
+        Args:
+            coupling_map (CouplingMap): directed graph representing a coupling map
+        Raises:
+            CouplingError: if the coupling map is not connected
+        """
+        self.num_qubits = coupling_map.size()
+        #CouplingMap computes the undirected distance matrix with retworkx
+        self.distance_matrix = np.asarray(coupling_map.distance_matrix, dtype=np.int64)
+        self.adjacency = self.distance_matrix == 1
+        self.directed_adjacency = np.zeros((self.num_qubits, self.num_qubits), dtype=bool)
+        edges = np.asarray(list(coupling_map.get_edges()), dtype=np.int64).reshape(-1, 2)
+        self.directed_adjacency[edges[:, 0], edges[:, 1]] = True
+        for table in (self.distance_matrix, self.adjacency, self.directed_adjacency):
+            table.setflags(write=False)
+        self.neighbors = [np.flatnonzero(row).tolist() for row in self.adjacency]
+        #(A @ A)[i, j] counts the common neighbors of i and j, a triangle is a coupled pair with one
+        adjacency_int = self.adjacency.astype(np.int64)
+        self.has_triangle = bool(np.any((adjacency_int @ adjacency_int)[self.adjacency] > 0))
+        _, self.predecessors = cs.shortest_path(
+            sp.csr_matrix(self.adjacency), directed=False, unweighted=True, return_predecessors=True
+        )
+        self.predecessors.setflags(write=False)
+        self._meeting_table = None
+
+    def distance(self, physical_qubit1, physical_qubit2):
+        """Return the undirected distance between two physical qubits."""
+        return int(self.distance_matrix[physical_qubit1, physical_qubit2])
+
+    def is_adjacent(self, physical_qubit1, physical_qubit2):
+        """Return True if the two physical qubits are coupled in either direction."""
+        return bool(self.adjacency[physical_qubit1, physical_qubit2])
+
+    def pair_distances(self, pairs):
+        """Return the distances of an (n, 2) integer array of physical qubit pairs."""
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        return self.distance_matrix[pairs[:, 0], pairs[:, 1]]
+
+    def pairs_adjacent(self, pairs):
+        """Return a bool array telling, for each pair of an (n, 2) array, if it is coupled."""
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        return self.adjacency[pairs[:, 0], pairs[:, 1]]
+
+    def triple_distances(self, triples):
+        """Return the (n, 3) distances of the (q0, q1), (q1, q2) and (q0, q2) pairs of (n, 3) triples."""
+        triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+        q0, q1, q2 = triples[:, 0], triples[:, 1], triples[:, 2]
+        return np.stack(
+            [self.distance_matrix[q0, q1], self.distance_matrix[q1, q2], self.distance_matrix[q0, q2]],
+            axis=1,
+        )
+
+    def triples_adjacent(self, triples):
+        """Return the (n, 3) adjacency of the (q0, q1), (q1, q2) and (q0, q2) pairs of (n, 3) triples."""
+        return self.triple_distances(triples) == 1
+
+    def path(self, source, target):
+        """Return a shortest undirected path from `source` to `target`, both ends included."""
+        predecessors = self.predecessors[source]
+        path = [int(target)]
+        while path[-1] != source:
+            path.append(int(predecessors[path[-1]]))
+        path.reverse()
+        return path
+
+    def meeting_point(self, physical_qubit0, physical_qubit1, physical_qubit2):
+        """Return the qubit of a toffoli the two others are cheapest to bring next to.
+
+        The cost of a meeting qubit is the number of swaps, sum of ``distance - 1``, moving the two
+        other qubits next to it. Ties go to the earlier argument.
+
+        Returns:
+            tuple(int, int): the meeting qubit and its swap count
+        """
+        triple = (physical_qubit0, physical_qubit1, physical_qubit2)
+        distance = self.distance_matrix
+        if self._meeting_table is not None:
+            meeting = triple[self._meeting_table[triple]]
+        else:
+            costs = [
+                distance[physical_qubit0, physical_qubit1] + distance[physical_qubit0, physical_qubit2],
+                distance[physical_qubit1, physical_qubit0] + distance[physical_qubit1, physical_qubit2],
+                distance[physical_qubit2, physical_qubit0] + distance[physical_qubit2, physical_qubit1],
+            ]
+            meeting = triple[costs.index(min(costs))]
+        return int(meeting), int(sum(distance[other, meeting] - 1 for other in triple if other != meeting))
+
+    def build_meeting_point_table(self, max_qubits=MEETING_TABLE_MAX_QUBITS):
+        """Precompute the meeting point of every physical qubit triple.
+
+        Args:
+            max_qubits (int): the table is not built for devices with more qubits
+        Returns:
+            bool: True if the table is available
+        """
+        if self._meeting_table is None and self.num_qubits <= max_qubits:
+            distance = self.distance_matrix
+            #costs[a, b, c, k] is the cost of the k-th qubit of the triple (a, b, c)
+            costs = np.stack(
+                [
+                    distance[:, :, None] + distance[:, None, :],
+                    distance[:, :, None] + distance[None, :, :],
+                    distance[:, None, :] + distance[None, :, :],
+                ],
+                axis=-1,
+            )
+            self._meeting_table = np.argmin(costs, axis=-1).astype(np.int8)
+            self._meeting_table.setflags(write=False)
+        return self._meeting_table is not None
@@ -15,16 +15,106 @@ Constraint Satisfaction Problem. It tries to find a solution that fully
 satisfy the circuit, i.e. no further swap is needed. If no solution is
 found, no ``property_set['layout']`` is set.
 """
+import hashlib
+import json
+import logging
+import os
 import random
+from collections import OrderedDict
 from time import time
-from constraint import Problem, RecursiveBacktrackingSolver, AllDifferentConstraint
 
 from qiskit.transpiler.layout import Layout
 from qiskit.transpiler.basepasses import AnalysisPass
 
-
-class CustomSolver(RecursiveBacktrackingSolver):
-    """A wrap to RecursiveBacktrackingSolver to support ``call_limit``"""
+from device_context import get_device_context
+
+logger = logging.getLogger(__name__)
+
+#the clock is only read once every this many calls of the search
+TIME_CHECK_INTERVAL = 256
+
+#process-wide LRU of CSP results keyed by the interaction graph, the coupling map and the
+#solver settings. An entry is (stop reason, physical qubit of every virtual qubit or None).
+CSP_RESULT_CACHE_SIZE = 1024
+_CSP_RESULT_CACHE = OrderedDict()
+_CSP_RESULT_CACHE_STATS = {"hits": 0, "disk_hits": 0, "misses": 0}
+#the stop reasons that do not depend on the machine load, only these results are cached
+_CACHED_STOP_REASONS = ("solution found", "nonexistent solution", "call limit reached")
+
+
+def csp_result_cache_info():
+    """Return the hit/miss counters and the current size of the CSP result cache."""
+    return {
+        "hits": _CSP_RESULT_CACHE_STATS["hits"],
+        "disk_hits": _CSP_RESULT_CACHE_STATS["disk_hits"],
+        "misses": _CSP_RESULT_CACHE_STATS["misses"],
+        "size": len(_CSP_RESULT_CACHE),
+    }
+
+
+def clear_csp_result_cache():
+    """Drop all cached CSP results (not the disk store) and reset the counters."""
+    _CSP_RESULT_CACHE.clear()
+    for counter in _CSP_RESULT_CACHE_STATS:
+        _CSP_RESULT_CACHE_STATS[counter] = 0
+
+
+def canonical_qubit_order(num_qubits, cxs, ccx_triangles):
+    """Order the virtual qubits of an interaction graph independently of their labels.
+
+    The qubits are colored by their in and out degrees and their number of toffolis, and the
+    colors are refined with the colors of their neighbors until the number of colors stops
+    growing. Qubits are sorted by color, the qubits of the same color keep their relative
+    order. Relabelling the qubits in this order maps two interaction graphs that differ by a
+    relabelling onto the same graph, unless two such qubits are only told apart by their labels.
+
+    Args:
+        num_qubits (int): number of virtual qubits
+        cxs (set): (control, target) pairs of qubit indices
+        ccx_triangles (set): sorted triples of qubit indices of the toffolis
+    Returns:
+        list: the qubit indices in canonical order
+    """
+    successors = [[] for _ in range(num_qubits)]
+    predecessors = [[] for _ in range(num_qubits)]
+    for control, target in cxs:
+        successors[control].append(target)
+        predecessors[target].append(control)
+    toffoli_partners = [[] for _ in range(num_qubits)]
+    for triangle in ccx_triangles:
+        for qubit in triangle:
+            toffoli_partners[qubit].extend(other for other in triangle if other != qubit)
+
+    signatures = [
+        (len(successors[q]), len(predecessors[q]), len(toffoli_partners[q])) for q in range(num_qubits)
+    ]
+    num_colors = 0
+    while True:
+        ranks = {signature: rank for rank, signature in enumerate(sorted(set(signatures)))}
+        colors = [ranks[signature] for signature in signatures]
+        if len(ranks) == num_colors:
+            break
+        num_colors = len(ranks)
+        signatures = [
+            (
+                colors[q],
+                tuple(sorted(colors[n] for n in successors[q])),
+                tuple(sorted(colors[n] for n in predecessors[q])),
+                tuple(sorted(colors[n] for n in toffoli_partners[q])),
+            )
+            for q in range(num_qubits)
+        ]
+    return sorted(range(num_qubits), key=lambda q: colors[q])
+
+
+class BitsetSolver:
+    """A backtracking search for an injective mapping of variables onto physical qubits.
+
+    The domain of every variable is a bitset (a python int) of the physical qubits it can be
+    mapped to. Assigning a variable intersects the domains of its constrained neighbors with
+    the adjacency bitset of the chosen qubit (forward checking), and a qubit in use is masked
+    out of every domain. The search is limited in calls and time.
+    """
 
     def __init__(self, call_limit=None, time_limit=None):
         self.call_limit = call_limit
@@ -32,45 +122,134 @@ class CustomSolver(RecursiveBacktrackingSolver):
         self.call_current = None
         self.time_start = None
         self.time_current = None
-        super().__init__()
+        self.stop_reason = None
 
     def limit_reached(self):
-        """Checks if a limit is reached."""
-        if self.call_current is not None:
-            self.call_current += 1
-            if self.call_current > self.call_limit:
-                return True
-        if self.time_start is not None:
+        """Checks if a limit is reached, the clock is read every ``TIME_CHECK_INTERVAL`` calls."""
+        self.call_current += 1
+        if self.call_limit is not None and self.call_current > self.call_limit:
+            self.stop_reason = "call limit reached"
+            return True
+        if self.time_limit is not None and self.call_current % TIME_CHECK_INTERVAL == 0:
             self.time_current = time() - self.time_start
             if self.time_current > self.time_limit:
+                self.stop_reason = "time limit reached"
                 return True
         return False
 
-    def getSolution(self, domains, constraints, vconstraints):
-        """Wrap RecursiveBacktrackingSolver.getSolution to add the limits."""
-        if self.call_limit is not None:
-            self.call_current = 0
-        if self.time_limit is not None:
-            self.time_start = time()
-        return super().getSolution(domains, constraints, vconstraints)
-
-    def recursiveBacktracking(self, solutions, domains, vconstraints, assignments, single):
-        """Like ``constraint.RecursiveBacktrackingSolver.recursiveBacktracking`` but
-        limited in the amount of calls by ``self.call_limit``"""
-        
-        #self.limit_reached() returns true if any one of the call limit or time limit are reached. Returns false otherwise
-        if self.limit_reached():
-            return None
+    def get_solution(self, domains, targets, controls, successors, predecessors, value_order):
+        """Return an assignment satisfying all the constraints.
 
-        #call the recursiveBacktracking function of the parent class if none of the limits have been reached
-        return super().recursiveBacktracking(solutions, domains, vconstraints, assignments, single)
+        A constraint (control, target) requires the physical qubit of the target to be in
+        the successors of the physical qubit of the control.
+
+        Args:
+            domains (list): for every variable, the bitset of the qubits it can be mapped to
+            targets (list): for every variable, the variables it is the control of
+            controls (list): for every variable, the variables it is the target of
+            successors (list): for every physical qubit p, the bitset of the qubits q a
+                (p, q) constraint allows
+            predecessors (list): for every physical qubit p, the bitset of the qubits q a
+                (q, p) constraint allows
+            value_order (list): the order the physical qubits are tried in
+
+        Returns:
+            dict: the physical qubit of every variable, None if no solution was found.
+                ``stop_reason`` then tells if a limit was reached.
+        """
+        self.call_current = 0
+        self.time_start = time()
+        self.time_current = None
+        self.stop_reason = None
+        self._targets = targets
+        self._controls = controls
+        self._successors = successors
+        self._predecessors = predecessors
+        self._value_order = value_order
+        order = self._variable_order(domains, targets, controls)
+        assignment = {}
+        if self._backtrack(order, 0, list(domains), 0, assignment):
+            return assignment
+        return None
+
+    @staticmethod
+    def _variable_order(domains, targets, controls):
+        """Order the variables like VF2: the most connected first, then always the variable
+        with the most neighbors already placed, ties going to the higher degree and smaller
+        domain. Unconstrained variables come last."""
+        neighbors = [set(targets[var]) | set(controls[var]) for var in range(len(domains))]
+        placed_neighbors = [0] * len(domains)
+        domain_sizes = [bin(domain).count("1") for domain in domains]
+        remaining = set(range(len(domains)))
+        order = []
+        while remaining:
+            var = max(
+                remaining,
+                key=lambda var: (placed_neighbors[var], len(neighbors[var]), -domain_sizes[var], -var),
+            )
+            remaining.remove(var)
+            order.append(var)
+            for neighbor in neighbors[var]:
+                placed_neighbors[neighbor] += 1
+        return order
+
+    def _restrict(self, neighbors, allowed, used, domains, assignment, saved):
+        #forward checking, returns False if an unassigned neighbor is left without a qubit
+        for neighbor in neighbors:
+            if neighbor in assignment:
+                continue
+            saved.append((neighbor, domains[neighbor]))
+            domains[neighbor] &= allowed
+            if not domains[neighbor] & ~used:
+                return False
+        return True
+
+    def _backtrack(self, order, depth, domains, used, assignment):
+        if depth == len(order):
+            return True
+        if self.limit_reached():
+            return False
+
+        var = order[depth]
+        candidates = domains[var] & ~used
+        for physical in self._value_order:
+            if not (candidates >> physical) & 1:
+                continue
+            new_used = used | (1 << physical)
+            saved = []
+            if self._restrict(
+                self._targets[var], self._successors[physical], new_used, domains, assignment, saved
+            ) and self._restrict(
+                self._controls[var], self._predecessors[physical], new_used, domains, assignment, saved
+            ):
+                assignment[var] = physical
+                if self._backtrack(order, depth + 1, domains, new_used, assignment):
+                    return True
+                del assignment[var]
+            for neighbor, domain in reversed(saved):
+                domains[neighbor] = domain
+            if self.stop_reason is not None:
+                return False
+        return False
 
 
 class CSPLayout_(AnalysisPass):
-    """If possible, chooses a Layout as a CSP, using backtracking."""
+    """If possible, chooses a Layout as a CSP, using backtracking.
+
+    The search is a subgraph matching of the circuit interaction graph onto the coupling
+    map, run by ``BitsetSolver``. The domains start pruned by degree, and the qubits of a
+    ``ccx`` can only go to physical qubits which are part of a triangle.
+    """
 
     def __init__(
-        self, coupling_map, strict_direction=False, seed=None, call_limit=1000, time_limit=10
+        self,
+        coupling_map,
+        strict_direction=False,
+        seed=None,
+        call_limit=1000,
+        time_limit=10,
+        use_cache=True,
+        cache_dir=None,
     ):
         """If possible, chooses a Layout as a CSP, using backtracking.
 
@@ -88,11 +267,17 @@ class CSPLayout_(AnalysisPass):
             strict_direction (bool): If True, considers the direction of the coupling map.
                                      Default is False.
             seed (int): Sets the seed of the PRNG.
-            call_limit (int): Amount of times that
-                ``constraint.RecursiveBacktrackingSolver.recursiveBacktracking`` will be called.
+            call_limit (int): Amount of times that ``BitsetSolver._backtrack`` will be called.
                 None means no call limit. Default: 1000.
             time_limit (int): Amount of seconds that the pass will try to find a solution.
                 None means no time limit. Default: 10 seconds.
+            use_cache (bool): If True, the results (the stop reasons included) are cached by
+                interaction graph (up to a relabelling of its qubits, see
+                ``canonical_qubit_order``), coupling map and solver settings, and a circuit with
+                the same interaction graph as an earlier one skips the solver. A result that
+                hit the time limit is not cached. Default: True.
+            cache_dir (str): If set, the results are also stored as json files in this
+                directory, to be shared between processes and runs. Default: None.
         """
         super().__init__()
         self.coupling_map = coupling_map    #the Coupling Map object defining the topology
@@ -100,6 +285,8 @@ class CSPLayout_(AnalysisPass):
         self.call_limit = call_limit    #the maximum number of calls to the 'recursive backtracking function'
         self.time_limit = time_limit    #the time limit for the 'recursive backtracking' function
         self.seed = seed
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
 
     def run(self, dag):
         """run the layout method"""
@@ -108,6 +295,9 @@ class CSPLayout_(AnalysisPass):
         #this is the set of all cnots
         cxs = set()
 
+        #the qubits of the toffolis, they need a triangle of the coupling map
+        ccx_triangles = set()
+
         #counting all the cnots
         for gate in dag.two_qubit_ops():
             cxs.add((qubits.index(gate.qargs[0]), qubits.index(gate.qargs[1])))
@@ -121,57 +311,166 @@ class CSPLayout_(AnalysisPass):
             cxs.add((qubits.index(gate.qargs[0]), qubits.index(gate.qargs[1])))
             cxs.add((qubits.index(gate.qargs[0]), qubits.index(gate.qargs[2])))
             cxs.add((qubits.index(gate.qargs[1]), qubits.index(gate.qargs[2])))
-
-        #the set of all edges of the coupling map
-        edges = set(self.coupling_map.get_edges())
-
-        #creating the solver object
-        if self.time_limit is None and self.call_limit is None:
-            solver = RecursiveBacktrackingSolver()
+            ccx_triangles.add(tuple(sorted(qubits.index(qarg) for qarg in gate.qargs)))
+
+        if self.use_cache:
+            #the problem is solved (and cached) on the canonically relabelled interaction graph,
+            #so circuits that only differ by the labels of their qubits share a cache entry
+            order = canonical_qubit_order(len(qubits), cxs, ccx_triangles)
+            label = {qubit: position for position, qubit in enumerate(order)}
+            cxs = {(label[control], label[target]) for control, target in cxs}
+            ccx_triangles = {tuple(sorted(label[q] for q in triangle)) for triangle in ccx_triangles}
+            key = self._cache_key(len(qubits), cxs, ccx_triangles)
+            solution, stop_reason = self._cached_solve(key, len(qubits), cxs, ccx_triangles)
+            if solution is not None:
+                solution = [solution[label[qubit]] for qubit in range(len(qubits))]
         else:
-            solver = CustomSolver(call_limit=self.call_limit, time_limit=self.time_limit)
-
-        variables = list(range(len(qubits)))
-        variable_domains = list(self.coupling_map.physical_qubits)
-        random.Random(self.seed).shuffle(variable_domains)
-
-        problem = Problem(solver)
-        problem.addVariables(variables, variable_domains)
-        problem.addConstraint(AllDifferentConstraint())  # each wire is map to a single qubit
-
-        if self.strict_direction:
-
-            def constraint(control, target):
-                return (control, target) in edges
-
-        else:
-
-            def constraint(control, target):
-                return (control, target) in edges or (target, control) in edges
-
-        for pair in cxs:
-            problem.addConstraint(constraint, [pair[0], pair[1]])
-
-        solution = problem.getSolution()
+            solution, stop_reason = self._solve(len(qubits), cxs, ccx_triangles)
 
         #actions to take if no solution is found
         if solution is None:
-            stop_reason = "nonexistent solution"
-            if isinstance(solver, CustomSolver):
-                if solver.time_current is not None and solver.time_current >= self.time_limit:
-                    stop_reason = "time limit reached"
-                elif solver.call_current is not None and solver.call_current >= self.call_limit:
-                    stop_reason = "call limit reached"
-
-            print('No solution found: ', stop_reason)
-        
-        #actions to take if a solution is found 
+            logger.info("CSPLayout_ found no solution: %s", stop_reason)
+
+        #actions to take if a solution is found
         else:
-            stop_reason = "solution found"
-            self.property_set["layout"] = Layout({v: qubits[k] for k, v in solution.items()})
+            self.property_set["layout"] = Layout({v: qubits[k] for k, v in enumerate(solution)})
             for reg in dag.qregs.values():
                 self.property_set["layout"].add_register(reg)
 
-            print(self.property_set['layout'])
+            logger.debug("CSPLayout_ selected layout %s", self.property_set["layout"])
+
+        self.property_set["CSPLayout_stop_reason"] = stop_reason
+
+    def _cache_key(self, num_qubits, cxs, ccx_triangles):
+        """Return the sha256 of the interaction graph, the coupling map and the solver settings."""
+        canonical = [
+            num_qubits,
+            sorted(cxs),
+            sorted(ccx_triangles),
+            self.coupling_map.size(),
+            sorted(get_device_context(self.coupling_map).edge_set),
+            self.strict_direction,
+            self.seed,
+            self.call_limit,
+            self.time_limit,
+        ]
+        return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+    def _cached_solve(self, key, num_qubits, cxs, ccx_triangles):
+        """Return the cached result under `key`, from memory then from disk, solving on a miss."""
+        if key in _CSP_RESULT_CACHE:
+            _CSP_RESULT_CACHE.move_to_end(key)
+            _CSP_RESULT_CACHE_STATS["hits"] += 1
+            stop_reason, solution = _CSP_RESULT_CACHE[key]
+            return solution, stop_reason
+
+        path = os.path.join(self.cache_dir, key + ".json") if self.cache_dir else None
+        if path is not None and os.path.exists(path):
+            with open(path) as cache_file:
+                entry = json.load(cache_file)
+            _CSP_RESULT_CACHE_STATS["disk_hits"] += 1
+            solution, stop_reason = entry["solution"], entry["stop_reason"]
+        else:
+            _CSP_RESULT_CACHE_STATS["misses"] += 1
+            solution, stop_reason = self._solve(num_qubits, cxs, ccx_triangles)
+            if stop_reason not in _CACHED_STOP_REASONS:
+                #hitting the time limit depends on the machine load, another run may succeed
+                return solution, stop_reason
+            if path is not None:
+                self._write_cache_file(path, stop_reason, solution)
+
+        _CSP_RESULT_CACHE[key] = (stop_reason, solution)
+        if len(_CSP_RESULT_CACHE) > CSP_RESULT_CACHE_SIZE:
+            _CSP_RESULT_CACHE.popitem(last=False)
+        return solution, stop_reason
+
+    def _write_cache_file(self, path, stop_reason, solution):
+        """Store a result in the disk cache, a cache directory that cannot be written is skipped."""
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            #write then rename, so a concurrent reader never sees a partial file
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"stop_reason": stop_reason, "solution": solution}, cache_file)
+            os.replace(tmp_path, path)
+        except OSError as error:
+            logger.warning("CSPLayout_ could not write the cache file %s: %s", path, error)
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _solve(self, num_qubits, cxs, ccx_triangles):
+        """Solve the CSP of the interaction graph `cxs` on the coupling map.
+
+        Returns:
+            tuple(list, str): the physical qubit of every virtual qubit (None if no solution
+                was found) and the stop reason
+        """
+        ccx_qubits = {qubit for triangle in ccx_triangles for qubit in triangle}
+
+        #the adjacency bitsets of the coupling map
+        successors, predecessors, triangle_qubits = get_device_context(self.coupling_map).get(
+            "csp_bitsets", self._device_bitsets
+        )
+        if not self.strict_direction:
+            successors = predecessors = [
+                succ | pred for succ, pred in zip(successors, predecessors)
+            ]
+
+        targets = [[] for _ in range(num_qubits)]
+        controls = [[] for _ in range(num_qubits)]
+        for control, target in cxs:
+            if self.strict_direction:
+                targets[control].append(target)
+                controls[target].append(control)
+            else:
+                targets[control].append(target)
+                targets[target].append(control)
+
+        #a virtual qubit can only go to a physical qubit with at least as many neighbors
+        num_physical = self.coupling_map.size()
+        domains = []
+        for var in range(num_qubits):
+            domain = 0
+            num_targets = len(set(targets[var]))
+            num_controls = len(set(controls[var]))
+            for physical in range(num_physical):
+                if (
+                    bin(successors[physical]).count("1") >= num_targets
+                    and bin(predecessors[physical]).count("1") >= num_controls
+                ):
+                    domain |= 1 << physical
+            if var in ccx_qubits:
+                domain &= triangle_qubits
+            domains.append(domain)
+
+        solver = BitsetSolver(call_limit=self.call_limit, time_limit=self.time_limit)
+        value_order = list(self.coupling_map.physical_qubits)
+        random.Random(self.seed).shuffle(value_order)
+
+        if num_qubits > num_physical or not all(domains):
+            solution = None
+        else:
+            solution = solver.get_solution(
+                domains, targets, controls, successors, predecessors, value_order
+            )
 
-        self.property_set["CSPLayout_stop_reason"] = stop_reason
\ No newline at end of file
+        if solution is None:
+            return None, solver.stop_reason or "nonexistent solution"
+        return [solution[var] for var in range(num_qubits)], "solution found"
+
+    def _device_bitsets(self):
+        """Return the successor and predecessor bitsets of every physical qubit, and the
+        bitset of the physical qubits that are part of a triangle."""
+        device_context = get_device_context(self.coupling_map)
+        successors = [0] * self.coupling_map.size()
+        predecessors = [0] * self.coupling_map.size()
+        for source, target in device_context.edge_set:
+            successors[source] |= 1 << target
+            predecessors[target] |= 1 << source
+        triangle_qubits = 0
+        for physical in device_context.triangles.ravel().tolist():
+            triangle_qubits |= 1 << physical
+        return successors, predecessors, triangle_qubits
\ No newline at end of file
@@ -12,6 +12,7 @@
 
 """Choose a Layout by finding the most connected subset of qubits."""
 
+import logging
 
 import numpy as np
 import scipy.sparse as sp
@@ -21,6 +22,16 @@ from qiskit.transpiler.layout import Layout
 from qiskit.transpiler.basepasses import AnalysisPass
 from qiskit.transpiler.exceptions import TranspilerError
 
+from device_context import get_device_context
+
+logger = logging.getLogger(__name__)
+
+#cnots of the context-aware toffoli decompositions, on a triangle and on a line of three qubits
+TOFFOLI_TRIANGLE_CNOTS = 6
+TOFFOLI_LINE_CNOTS = 8
+#a toffoli left without a line of its own needs at least one swap (3 cnots) to get one
+TOFFOLI_UNPLACED_CNOTS = TOFFOLI_LINE_CNOTS + 3
+
 
 class DenseLayout_(AnalysisPass):
     """Choose a Layout by finding the most connected subset of qubits.
@@ -28,6 +39,12 @@ class DenseLayout_(AnalysisPass):
     This pass associates a physical qubit (int) to each virtual qubit
     of the circuit (Qubit).
 
+    A toffoli costs 6 CNOTs on a triangle of qubits and 8 on a line (on heavy-hex devices
+    there are no triangles). The cnot count of a candidate subset places the toffolis of
+    the circuit on the triangles of the subset first, then on its other lines, and the
+    toffolis left over are priced as a line plus one swap. Subsets with the same
+    connectivity are ranked by that count.
+
     Note:
         Even though a 'layout' is not strictly a property of the DAG,
         in the transpiler architecture it is best passed around between passes
@@ -47,6 +64,7 @@ class DenseLayout_(AnalysisPass):
         self.cx_mat = None
         self.meas_arr = None
         self.num_cx = 0
+        self.num_ccx = 0
         self.num_meas = 0
 
     def run(self, dag):
@@ -67,52 +85,18 @@ class DenseLayout_(AnalysisPass):
 
         # Get avg number of cx and meas per qubit
         ops = dag.count_ops()
-        if "cx" in ops.keys():
-            self.num_cx = ops["cx"]
-        
-        #adding these extra lines to the compiler. lines 73-76
-        #We consider the toffoli gates equivalent to their six-qubit decomposition.
-        if "ccx" in ops.keys():
-            self.num_cx += 6*ops["ccx"]
-        if "measure" in ops.keys():
-            self.num_meas = ops["measure"]
-
-        # Compute the sparse cx_err matrix and meas array
-        device_qubits = self.coupling_map.size()
+        self.num_cx = ops.get("cx", 0)
+
+        #the toffolis are counted apart, their cnot count depends on the subset they land on
+        self.num_ccx = ops.get("ccx", 0)
+        self.num_meas = ops.get("measure", 0)
+
+        # The sparse cx_err matrix and meas array only depend on the device, they are
+        # built once from the indexed backend properties and shared
         if self.backend_prop:
-            rows = []
-            cols = []
-            cx_err = []
-
-            for edge in self.coupling_map.get_edges():
-                for gate in self.backend_prop.gates:
-                    #gate.qubit is a list of all the qubits that the gate acts on.
-                    #edge is an edge in the coupling map. It also occurs as a list of qubit
-                    #which have an edge connected between them.
-                    if gate.qubits == edge:
-                        rows.append(edge[0])
-                        cols.append(edge[1])
-
-                        #gate.parameters contains two values - The gate error (idx = 0) and the gate lenght (idx = 1)
-                        cx_err.append(gate.parameters[0].value)
-                        break
-                else:
-                    continue
-
-            self.cx_mat = sp.coo_matrix(
-                (cx_err, (rows, cols)), shape=(device_qubits, device_qubits)
-            ).tocsr()
-
-            # Set measurement array
-            meas_err = []
-            for qubit_data in self.backend_prop.qubits:
-                for item in qubit_data:
-                    if item.name == "readout_error":
-                        meas_err.append(item.value)
-                        break
-                else:
-                    continue
-            self.meas_arr = np.asarray(meas_err)
+            device_context = get_device_context(self.coupling_map, self.backend_prop)
+            self.cx_mat = device_context.get("dense_cx_mat", lambda: self._build_cx_mat(device_context))
+            self.meas_arr = device_context.readout_errors
 
         best_sub = self._best_subset(num_dag_qubits)
         layout = Layout()
@@ -123,8 +107,57 @@ class DenseLayout_(AnalysisPass):
                 map_iter += 1
             layout.add_register(qreg)
         self.property_set["layout"] = layout
-        print(layout)
+        logger.debug("DenseLayout_ selected layout %s", layout)
+
+
+    def _build_cx_mat(self, device_context):
+        """Return the sparse matrix of the errors of the gates on the coupling map edges."""
+        device_qubits = self.coupling_map.size()
+        gate_errors = device_context.gate_errors
+        rows = []
+        cols = []
+        cx_err = []
+        for edge in self.coupling_map.get_edges():
+            error = gate_errors.get(tuple(edge))
+            if error is not None:
+                rows.append(edge[0])
+                cols.append(edge[1])
+                cx_err.append(error)
+        return sp.coo_matrix(
+            (cx_err, (rows, cols)), shape=(device_qubits, device_qubits)
+        ).tocsr()
+
+    @staticmethod
+    def _triple_counts(device_context, membership):
+        """Count the lines and triangles of three qubits in every candidate subset.
 
+        Args:
+            device_context (DeviceContext): the context of the device
+            membership (csr_matrix): (subsets, device qubits) membership matrix
+        Returns:
+            tuple(ndarray, ndarray): the number of lines (paths of two coupled pairs, the paths
+                of a triangle included) and of triangles in every subset
+        """
+        adjacency = device_context.get(
+            "sparse_adjacency", lambda: sp.csr_matrix(device_context.coupling_tables.adjacency, dtype=np.int64)
+        )
+        # a qubit of degree d in the subgraph is the middle of d * (d - 1) / 2 lines
+        degrees = (membership @ adjacency).multiply(membership).tocsr()
+        degrees.data = degrees.data * (degrees.data - 1) / 2
+        line_counts = np.rint(np.asarray(degrees.sum(axis=1)).ravel()).astype(np.int64)
+
+        triangles = device_context.triangles
+        if len(triangles) == 0:
+            return line_counts, np.zeros(membership.shape[0], dtype=np.int64)
+        # a triangle is in a subset when its three qubits are
+        incidence = sp.csr_matrix(
+            (np.ones(triangles.size), (triangles.ravel(), np.repeat(np.arange(len(triangles)), 3))),
+            shape=(membership.shape[1], len(triangles)),
+        )
+        qubits_in_subset = (membership @ incidence).tocsr()
+        qubits_in_subset.data = (np.rint(qubits_in_subset.data) == 3).astype(np.float64)
+        triangle_counts = np.asarray(qubits_in_subset.sum(axis=1)).ravel().astype(np.int64)
+        return line_counts, triangle_counts
 
     def _best_subset(self, num_qubits):
         """Computes the qubit mapping with the best connectivity.
@@ -140,68 +173,71 @@ class DenseLayout_(AnalysisPass):
         if num_qubits == 0:
             return []
 
-        device_qubits = self.coupling_map.size()
+        #the adjacency matrix and the bfs orders only depend on the device, they are shared
+        device_context = get_device_context(self.coupling_map, self.backend_prop)
+        sp_cmap = device_context.sparse_cmap
+        # the candidate subsets are the first qubits of a bfs from each node
+        subsets = [bfs[0:num_qubits] for bfs in device_context.bfs_orders]
+        subset_sizes = np.array([len(subset) for subset in subsets])
+
+        # membership[k, q] is 1 if the physical qubit q is in the k-th subset. The entry (k, j)
+        # of membership @ sp_cmap counts the edges from the k-th subset to j, keeping the
+        # entries where j is in the subset too leaves the edges of the subgraph
+        rows = np.repeat(np.arange(len(subsets)), subset_sizes)
+        membership = sp.csr_matrix(
+            (np.ones(len(rows)), (rows, np.concatenate(subsets))),
+            shape=(len(subsets), sp_cmap.shape[0]),
+        )
+        connection_counts = np.rint(
+            np.asarray((membership @ sp_cmap).multiply(membership).sum(axis=1)).ravel()
+        ).astype(np.int64)
+
+        # the cnot count of the circuit on every subset, the toffolis take the triangles
+        # first, then the lines that are not part of a triangle, the rest needs a swap
+        line_counts, triangle_counts = self._triple_counts(device_context, membership)
+        on_triangles = np.minimum(self.num_ccx, triangle_counts)
+        on_lines = np.minimum(self.num_ccx - on_triangles, line_counts - 3 * triangle_counts)
+        unplaced = self.num_ccx - on_triangles - on_lines
+        cnot_counts = (
+            self.num_cx
+            + on_triangles * TOFFOLI_TRIANGLE_CNOTS
+            + on_lines * TOFFOLI_LINE_CNOTS
+            + unplaced * TOFFOLI_UNPLACED_CNOTS
+        )
 
-        cmap = np.asarray(self.coupling_map.get_edges())
-        data = np.ones_like(cmap[:, 0])
-        sp_cmap = sp.coo_matrix(
-            (data, (cmap[:, 0], cmap[:, 1])), shape=(device_qubits, device_qubits)
-        ).tocsr()
-        best = 0
-        best_map = None
+        if self.backend_prop:
+            # compute meas error for every subset
+            avg_meas_err = np.mean(self.meas_arr)
+            meas_diff = (membership @ self.meas_arr) / subset_sizes - avg_meas_err
+            errors = self.num_meas * np.maximum(meas_diff, 0)
+
+            # mean cx error over the edges of every subset
+            cx_err_sums = np.asarray((membership @ self.cx_mat).multiply(membership).sum(axis=1)).ravel()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cx_err = cx_err_sums / connection_counts
+            if self.coupling_map.is_symmetric:
+                cx_err /= 2
+            errors = errors + cnot_counts * cx_err
+
+        best = (0,)
         best_error = np.inf
-        best_sub = None
-        # do bfs with each node as starting point
-        for k in range(sp_cmap.shape[0]):
-            bfs = cs.breadth_first_order(
-                sp_cmap, i_start=k, directed=False, return_predecessors=False
-            )
-
-            connection_count = 0
-            sub_graph = []
-            for i in range(num_qubits):
-                node_idx = bfs[i]
-                for j in range(sp_cmap.indptr[node_idx], sp_cmap.indptr[node_idx + 1]):
-                    node = sp_cmap.indices[j]
-                    for counter in range(num_qubits):
-                        if node == bfs[counter]:
-                            connection_count += 1
-                            sub_graph.append([node_idx, node])
-                            break
-
+        best_k = None
+        for k in range(len(subsets)):
             if self.backend_prop:
-                curr_error = 0
-                # compute meas error for subset
-                avg_meas_err = np.mean(self.meas_arr)
-                meas_diff = np.mean(self.meas_arr[bfs[0:num_qubits]]) - avg_meas_err
-                if meas_diff > 0:
-                    curr_error += self.num_meas * meas_diff
-
-                cx_err = np.mean([self.cx_mat[edge[0], edge[1]] for edge in sub_graph])
-                if self.coupling_map.is_symmetric:
-                    cx_err /= 2
-                curr_error += self.num_cx * cx_err
-                if connection_count >= best and curr_error < best_error:
-                    best = connection_count
-                    best_error = curr_error
-                    best_map = bfs[0:num_qubits]
-                    best_sub = sub_graph
-
+                if connection_counts[k] >= best[0] and errors[k] < best_error:
+                    best = (connection_counts[k],)
+                    best_error = errors[k]
+                    best_k = k
             else:
-                if connection_count > best:
-                    best = connection_count
-                    best_map = bfs[0:num_qubits]
-                    best_sub = sub_graph
-
-        # Return a best mapping that has reduced bandwidth
-        mapping = {}
-        for edge in range(best_map.shape[0]):
-            mapping[best_map[edge]] = edge
-        new_cmap = [[mapping[c[0]], mapping[c[1]]] for c in best_sub]
-        rows = [edge[0] for edge in new_cmap]
-        cols = [edge[1] for edge in new_cmap]
-        data = [1] * len(rows)
-        sp_sub_graph = sp.coo_matrix((data, (rows, cols)), shape=(num_qubits, num_qubits)).tocsr()
+                score = (connection_counts[k], -cnot_counts[k])
+                if score > best:
+                    best = score
+                    best_k = k
+
+        # Return a best mapping that has reduced bandwidth, the subgraph is indexed by the
+        # position of the qubits in best_map
+        best_map = subsets[best_k]
+        sp_sub_graph = sp_cmap[best_map][:, best_map]
         perm = cs.reverse_cuthill_mckee(sp_sub_graph)
         best_map = best_map[perm]
         return best_map
\ No newline at end of file
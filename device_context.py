@@ -0,0 +1,201 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2018.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""Device data derived from a coupling map and backend properties, shared by the layout passes.
+
+When many circuits are compiled for the same device, the layout passes keep deriving the
+same tables from the coupling map and the calibration data. A DeviceContext is identified
+by the fingerprint of both, computes every table once, on first use, and is shared by all
+the passes (and all the circuits) of a process.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as cs
+
+from coupling_tables import coupling_map_fingerprint, get_coupling_tables
+
+
+#the least recently used contexts are dropped past DEVICE_CONTEXT_CACHE_SIZE, so long runs
+#over many backends or calibrations do not keep them all
+DEVICE_CONTEXT_CACHE_SIZE = 64
+_DEVICE_CONTEXT_CACHE = OrderedDict()
+
+
+def backend_properties_fingerprint(backend_prop):
+    """Return a hashable key identifying the calibration data of `backend_prop`.
+
+    A calibration snapshot is identified by its ``last_update_date``, the gate and qubit
+    properties are only hashed when the date is missing.
+
+    Args:
+        backend_prop (BackendProperties): backend properties object, or None
+    Returns:
+        tuple: the backend name and version and the last update date, or the backend name
+            and the hash of the gate and qubit properties, None if there are no properties
+    """
+    if backend_prop is None:
+        return None
+    last_update_date = getattr(backend_prop, "last_update_date", None)
+    if last_update_date is not None:
+        return (backend_prop.backend_name, backend_prop.backend_version, str(last_update_date))
+    gates = tuple(
+        (gate.gate, tuple(gate.qubits), tuple((item.name, item.value) for item in gate.parameters))
+        for gate in backend_prop.gates
+    )
+    qubits = tuple(tuple((item.name, item.value) for item in qubit) for qubit in backend_prop.qubits)
+    return (backend_prop.backend_name, hash((gates, qubits)))
+
+
+def get_device_context(coupling_map=None, backend_prop=None):
+    """Return the (shared) DeviceContext of a coupling map and backend properties.
+
+    Args:
+        coupling_map (CouplingMap): directed graph representing a coupling map, or None
+        backend_prop (BackendProperties): backend properties object, or None
+    Returns:
+        DeviceContext: the context of the device
+    """
+    key = (
+        coupling_map_fingerprint(coupling_map) if coupling_map is not None else None,
+        backend_properties_fingerprint(backend_prop),
+    )
+    context = _DEVICE_CONTEXT_CACHE.get(key)
+    if context is None:
+        context = DeviceContext(coupling_map, backend_prop)
+        _DEVICE_CONTEXT_CACHE[key] = context
+        if len(_DEVICE_CONTEXT_CACHE) > DEVICE_CONTEXT_CACHE_SIZE:
+            _DEVICE_CONTEXT_CACHE.popitem(last=False)
+    else:
+        _DEVICE_CONTEXT_CACHE.move_to_end(key)
+    return context
+
+
+def clear_device_context_cache():
+    """Drop all the cached device contexts."""
+    _DEVICE_CONTEXT_CACHE.clear()
+
+
+class DeviceContext:
+    """Tables derived from a coupling map and backend properties, computed on first use.
+
+    The common tables of the coupling map are attributes, a pass can store its own derived
+    data with ``get``. The tables are shared, the passes must not modify them.
+
+    Attributes:
+        coupling_map (CouplingMap): the coupling map, or None
+        backend_prop (BackendProperties): the backend properties, or None
+    """
+
+    def __init__(self, coupling_map=None, backend_prop=None):
+        """Create the (empty) context of a device.
+
+        Args:
+            coupling_map (CouplingMap): directed graph representing a coupling map, or None
+            backend_prop (BackendProperties): backend properties object, or None
+        """
+        self.coupling_map = coupling_map
+        self.backend_prop = backend_prop
+        self._tables = {}
+
+    def get(self, name, build):
+        """Return the table `name`, calling `build()` to compute it the first time."""
+        if name not in self._tables:
+            self._tables[name] = build()
+        return self._tables[name]
+
+    @property
+    def coupling_tables(self):
+        """CouplingTables: the distance and adjacency tables of the coupling map."""
+        return self.get("coupling_tables", lambda: get_coupling_tables(self.coupling_map))
+
+    @property
+    def edge_set(self):
+        """frozenset: the directed edges of the coupling map."""
+        return self.get("edge_set", lambda: frozenset(self.coupling_map.get_edges()))
+
+    @property
+    def sparse_cmap(self):
+        """csr_matrix: the directed adjacency matrix of the coupling map."""
+        return self.get("sparse_cmap", self._build_sparse_cmap)
+
+    @property
+    def bfs_orders(self):
+        """list: for every physical qubit, the undirected breadth first order starting from it."""
+        return self.get("bfs_orders", self._build_bfs_orders)
+
+    @property
+    def triangles(self):
+        """ndarray: the (t, 3) sorted triples of pairwise coupled physical qubits."""
+        return self.get("triangles", self._build_triangles)
+
+    @property
+    def gate_errors(self):
+        """dict: the error (first parameter) of the first gate on every tuple of physical qubits."""
+        return self.get("gate_errors", self._build_gate_errors)
+
+    @property
+    def readout_errors(self):
+        """ndarray: the readout errors of the qubits that report one, in qubit order."""
+        return self.get("readout_errors", self._build_readout_errors)
+
+    def _build_gate_errors(self):
+        gate_errors = {}
+        for gate in self.backend_prop.gates:
+            gate_errors.setdefault(tuple(gate.qubits), gate.parameters[0].value)
+        return gate_errors
+
+    def _build_readout_errors(self):
+        readout_errors = []
+        for qubit_data in self.backend_prop.qubits:
+            for item in qubit_data:
+                if item.name == "readout_error":
+                    readout_errors.append(item.value)
+                    break
+        readout_errors = np.asarray(readout_errors)
+        readout_errors.setflags(write=False)
+        return readout_errors
+
+    def _build_triangles(self):
+        coupling_tables = self.coupling_tables
+        neighbors = coupling_tables.neighbors
+        triangles = []
+        for i, neighbors_i in enumerate(neighbors):
+            for j in neighbors_i:
+                if j > i:
+                    triangles.extend(
+                        (i, j, k) for k in neighbors[j] if k > j and coupling_tables.adjacency[i, k]
+                    )
+        triangles = np.array(triangles, dtype=np.int64).reshape(-1, 3)
+        triangles.setflags(write=False)
+        return triangles
+
+    def _build_sparse_cmap(self):
+        device_qubits = self.coupling_map.size()
+        cmap = np.asarray(self.coupling_map.get_edges())
+        data = np.ones_like(cmap[:, 0])
+        sparse_cmap = sp.coo_matrix(
+            (data, (cmap[:, 0], cmap[:, 1])), shape=(device_qubits, device_qubits)
+        ).tocsr()
+        for array in (sparse_cmap.data, sparse_cmap.indices, sparse_cmap.indptr):
+            array.setflags(write=False)
+        return sparse_cmap
+
+    def _build_bfs_orders(self):
+        #csgraph may need writable index arrays, the shared matrix is read-only
+        sp_cmap = self.sparse_cmap.copy()
+        return [
+            cs.breadth_first_order(sp_cmap, i_start=k, directed=False, return_predecessors=False)
+            for k in range(sp_cmap.shape[0])
+        ]
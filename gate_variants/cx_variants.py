@@ -11,10 +11,45 @@ from qiskit.circuit.library.standard_gates.h import HGate
 from qiskit.circuit.library.standard_gates.t import TGate, TdgGate
 
 import numpy as np
+import logging
 
 from qiskit.circuit._utils import _compute_control_matrix, _ctrl_state_to_int
 import qiskit_superstaq
 
+from gate_variants.rule_tables import freeze_rules, materialize_rules
+
+logger = logging.getLogger(__name__)
+
+_GATE_KINDS = {"acecr": qiskit_superstaq.AceCR, "rx": RXGate, "ry": RYGate, "rz": RZGate}
+
+#The decomposition rules of all CX variants, built once at import time.
+_CX_VARIANT_RULES = freeze_rules({
+    ('00', '11', 'd'): (
+        ("acecr", ("+-",), (0, 1)),
+        ("ry", (np.pi,), (0,)),
+        ("rx", (-np.pi/2,), (1,)),
+        ("rz", (-np.pi/2,), (0,)),
+    ),
+    ('11', '00', 'd'): (
+        ("rz", (np.pi/2,), (0,)),
+        ("ry", (np.pi,), (0,)),
+        ("rx", (np.pi/2,), (1,)),
+        ("acecr", ("+-",), (0, 1)),
+    ),
+    ('01', '10', 'd'): (
+        ("rz", (np.pi/2,), (0,)),
+        ("rx", (np.pi/2,), (1,)),
+        ("acecr", ("-+",), (0, 1)),
+        ("rx", (np.pi,), (0,)),
+    ),
+    ('10', '01', 'd'): (
+        ("rx", (np.pi/2,), (0,)),
+        ("acecr", ("-+",), (0, 1)),
+        ("rx", (-np.pi/2,), (1,)),
+        ("rz", (-np.pi/2,), (0,)),
+    ),
+})
+
 
 class CX_Variant_Gate(ControlledGate):
     r"""Controlled-X gate.
@@ -80,7 +115,7 @@ class CX_Variant_Gate(ControlledGate):
         super().__init__(
             "cx_variant", 2, [], num_ctrl_qubits=1, label=label, ctrl_state=ctrl_state, base_gate=XGate()
         )
-        print(variant_tag)
+        logger.debug("initialized variant_tag: %s", variant_tag)
         self.variant_tag = variant_tag
         
     def _define(self):
@@ -105,34 +140,7 @@ class CX_Variant_Gate(ControlledGate):
 
 
     def get_rules(self, q, variant_tag):
-        variant_rules = {
-            ('00', '11', 'd'): [
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-            ('11', '00', 'd'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RYGate(np.pi), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("+-"), [q[0], q[1]], []),
-            ],
-            ('01', '10', 'd'): [
-                (RZGate(np.pi/2), [q[0]], []),
-                (RXGate(np.pi/2), [q[1]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(np.pi), [q[0]], []),
-            ],
-            ('10', '01', 'd'): [
-                (RXGate(np.pi/2), [q[0]], []),
-                (qiskit_superstaq.AceCR("-+"), [q[0], q[1]], []),
-                (RXGate(-np.pi/2), [q[1]], []),
-                (RZGate(-np.pi/2), [q[0]], []),
-            ],
-          
-            }
-        return variant_rules[variant_tag]
+        return materialize_rules(_CX_VARIANT_RULES[variant_tag], q, _GATE_KINDS)
 
     def control(self, num_ctrl_qubits=1, label=None, ctrl_state=None):
         """Return a controlled-X gate with more control lines.
@@ -0,0 +1,28 @@
+"""Helpers for the compact decomposition rule tables of the gate variants.
+
+A rule table maps a variant tag to a tuple of ``(gate kind, params, qubit indices)`` entries.
+The tables are built and frozen once at import time, and only the entry that is asked for
+is turned into gate objects.
+"""
+
+from types import MappingProxyType
+
+
+def freeze_rules(variant_rules):
+    """Freeze a ``{variant_tag: ((kind, params, qubit_indices), ...)}`` dict into a read-only table."""
+    return MappingProxyType(
+        {tag: tuple(tuple(rule) for rule in rules) for tag, rules in variant_rules.items()}
+    )
+
+
+def materialize_rules(rules, q, gate_kinds):
+    """Build the ``(instruction, qargs, cargs)`` list of one rule table entry.
+
+    Args:
+        rules (tuple): the ``(kind, params, qubit_indices)`` entries of a variant
+        q (QuantumRegister): the register the qubit indices refer to
+        gate_kinds (dict): maps each gate kind to the gate class that implements it
+    Returns:
+        list: the decomposition rules in the ``(instruction, qargs, cargs)`` format
+    """
+    return [(gate_kinds[kind](*params), [q[i] for i in qubits], []) for kind, params, qubits in rules]
@@ -1,5 +1,6 @@
 #define different Toffoli variants. There should be 9 combinations. The canonical ccx is CCX_12_01
 import numpy
+import logging
 from typing import Optional, Union
 from qiskit.circuit.quantumregister import QuantumRegister
 from qiskit.circuit.gate import Gate
@@ -10,6 +11,378 @@ from qiskit.circuit.library.standard_gates.t import TGate, TdgGate
 
 from qiskit.circuit._utils import _compute_control_matrix, _ctrl_state_to_int
 
+from gate_variants.rule_tables import freeze_rules, materialize_rules
+
+logger = logging.getLogger(__name__)
+
+_GATE_KINDS = {"cx": CXGate, "h": HGate, "t": TGate, "tdg": TdgGate}
+
+#The decomposition rules of all Toffoli variants, built once at import time.
+#Each rule is a (gate kind, params, qubit index) tuple, the qubit index refers to the 3 qubit register.
+_CCX_VARIANT_RULES = freeze_rules({
+    ('10', '02', 'f', 'p'): (
+        ("cx", (), (1, 0)),
+        ("tdg", (), (1,)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("h", (), (2,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("h", (), (2,)),
+    ),
+    ('01', '20', 'f', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (0,)),
+        ("t", (), (1,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (2,)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("h", (), (2,)),
+    ),
+    ('01', '12', 'f', 'p'): (
+        ("cx", (), (0, 1)),
+        ("tdg", (), (0,)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("h", (), (2,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("h", (), (2,)),
+    ),
+    ('20', '01', 'f', 'p'): (
+        ("h", (), (2,)),
+        ("cx", (), (2, 0)),
+        ("tdg", (), (2,)),
+        ("t", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 1)),
+        ("h", (), (2,)),
+    ),
+    ('02', '10', 'f', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("t", (), (0,)),
+        ("t", (), (2,)),
+        ("h", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("t", (), (1,)),
+        ("tdg", (), (0,)),
+        ("cx", (), (1, 0)),
+    ),
+    ('12', '01', 'f', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("t", (), (1,)),
+        ("t", (), (2,)),
+        ("h", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("t", (), (0,)),
+        ("tdg", (), (1,)),
+        ("cx", (), (0, 1)),
+    ),
+   ('10', '21', 'f', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (1,)),
+        ("t", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (2,)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("h", (), (2,)),
+    ),
+    ('21', '10', 'f', 'p'): (
+        ("h", (), (2,)),
+        ("cx", (), (2, 1)),
+        ("tdg", (), (2,)),
+        ("t", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 0)),
+        ("h", (), (2,)),
+    ),
+    ('01', '01', 'f', 's'): (
+        ("h", (), (2,)),
+        ("t", (), (1,)),
+        ("t", (), (0,)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (0,)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (0,)),
+        ("t", (), (2,)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("h", (), (2,)),
+    ),
+    ('10', '10', 'f', 's'): (
+        ("h", (), (2,)),
+        ("t", (), (0,)),
+        ("t", (), (1,)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (1,)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("t", (), (2,)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (1, 0)),
+        ("h", (), (2,)),
+    ),
+    ('10', '10', 'f', 'p'): (
+        ("h", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("tdg", (), (2,)),
+        ("t", (), (1,)),
+        ("t", (), (0,)),
+        ("cx", (), (0, 1)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+    ('01', '01', 'f', 'p'): (
+        ("h", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("tdg", (), (2,)),
+        ("t", (), (0,)),
+        ("t", (), (1,)),
+        ("cx", (), (1, 0)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+    ('10', '02', 'l0', 'p'): (
+        ("h", (), (2,)),
+        ("t", (), (1,)),
+        ("t", (), (0,)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (1, 0)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("h", (), (2,)),
+    ),
+    ('02', '10', 'l0', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (0, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (0, 2)),
+        ("t", (), (0,)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 0)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (1, 0)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+    ('01', '12', 'l1', 'p'): (
+        ("h", (), (2,)),
+        ("t", (), (0,)),
+        ("t", (), (1,)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("t", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("h", (), (2,)),
+    ),
+    ('12', '01', 'l1', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (1, 2)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("t", (), (1,)),
+        ("t", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (2,)),
+        ("cx", (), (0, 1)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (0, 1)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+    ('02', '21', 'l2', 'p'): (
+        ("h", (), (2,)),
+        ("t", (), (2,)),
+        ("t", (), (1,)),
+        ("t", (), (0,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("t", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (1,)),
+        ("cx", (), (2, 1)),
+        ("h", (), (2,)),
+    ),
+    ('21', '02', 'l2', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (2, 1)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("t", (), (2,)),
+        ("t", (), (1,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("tdg", (), (1,)),
+        ("cx", (), (0, 2)),
+        ("cx", (), (2, 1)),
+        ("cx", (), (0, 2)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+    ('12', '20', 'l2', 'p'): (
+        ("h", (), (2,)),
+        ("t", (), (2,)),
+        ("t", (), (1,)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("t", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (2,)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (0,)),
+        ("cx", (), (2, 0)),
+        ("h", (), (2,)),
+    ),
+    ('20', '12', 'l2', 's'): (
+        ("h", (), (2,)),
+        ("cx", (), (2, 0)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("t", (), (2,)),
+        ("t", (), (0,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("tdg", (), (0,)),
+        ("cx", (), (1, 2)),
+        ("cx", (), (2, 0)),
+        ("cx", (), (1, 2)),
+        ("tdg", (), (0,)),
+        ("tdg", (), (1,)),
+        ("tdg", (), (2,)),
+        ("h", (), (2,)),
+    ),
+})
+
+
 class CCX_Variant_Gate(ControlledGate):
     r"""This equals to the inverse of CCX gate, also known as Toffoli gate.
 
@@ -73,7 +446,7 @@ class CCX_Variant_Gate(ControlledGate):
         super().__init__(
             "ccx_variant", 3, [], num_ctrl_qubits=2, label=label, ctrl_state=ctrl_state, base_gate=XGate()
         )
-        print("initialized variant_tag:", variant_tag)
+        logger.debug("initialized variant_tag: %s", variant_tag)
         self.variant_tag = variant_tag
         #self._define_variant(variant_tag)
 
@@ -119,371 +492,9 @@ class CCX_Variant_Gate(ControlledGate):
         # switch control 0 and target 2:
         # 10, 21, s
         # 21, 10, p
-        variant_rules = {
-            ('10', '02', 'f', 'p'): [
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (HGate(), [q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('01', '20', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('01', '12', 'f', 'p'): [
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (HGate(), [q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('20', '01', 'f', 'p'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('02', '10', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TGate(), [q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-            ],
-            ('12', '01', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-            ],
-           ('10', '21', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[2]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('21', '10', 'f', 'p'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('01', '01', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('10', '10', 'f', 's'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('10', '10', 'f', 'p'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('01', '01', 'f', 'p'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('10', '02', 'l0', 'p'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('02', '10', 'l0', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[1], q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('01', '12', 'l1', 'p'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[0]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('12', '01', 'l1', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[0], q[1]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('02', '21', 'l2', 'p'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('21', '02', 'l2', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (TdgGate(), [q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (CXGate(), [q[2], q[1]], []),
-                (CXGate(), [q[0], q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('12', '20', 'l2', 'p'): [
-                (HGate(), [q[2]], []),
-                (TGate(), [q[2]], []),
-                (TGate(), [q[1]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (HGate(), [q[2]], []),
-            ],
-            ('20', '12', 'l2', 's'): [
-                (HGate(), [q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TGate(), [q[2]], []),
-                (TGate(), [q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (TdgGate(), [q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (CXGate(), [q[2], q[0]], []),
-                (CXGate(), [q[1], q[2]], []),
-                (TdgGate(), [q[0]], []),
-                (TdgGate(), [q[1]], []),
-                (TdgGate(), [q[2]], []),
-                (HGate(), [q[2]], []),
-            ],
-            }
+        variant_rules = _CCX_VARIANT_RULES
         try:
-            print("look for variant_rules", variant_tag)
-            return variant_rules[variant_tag]
+            return materialize_rules(variant_rules[variant_tag], q, _GATE_KINDS)
         except:
             variant_tag = list(variant_tag)
             pre_tag = variant_tag[0]
@@ -500,8 +511,8 @@ class CCX_Variant_Gate(ControlledGate):
                         if tag[1] == suc_tag or tag[1] == suc_tag_inv:
                             if tag[-1] == variant_tag[-1]:
                                 #found three match tag, return the value
-                                print("final tag, three match", tag)
-                                return variant_rules[tuple(tag)]
+                                logger.debug("final tag, three match %s", tag)
+                                return materialize_rules(variant_rules[tuple(tag)], q, _GATE_KINDS)
                             else:
                                 #found two match tag, record it
                                 two_match_tags.append(tag)
@@ -516,11 +527,11 @@ class CCX_Variant_Gate(ControlledGate):
                     #the topology flags are different, pass
                     pass
             if len(two_match_tags) != 0:
-                print("final tag, two match", two_match_tags[0])
-                return variant_rules[tuple(two_match_tags[0])]
+                logger.debug("final tag, two match %s", two_match_tags[0])
+                return materialize_rules(variant_rules[tuple(two_match_tags[0])], q, _GATE_KINDS)
             elif len(one_match_tags) != 0:
-                print("final tag, one match", one_match_tags[0])
-                return variant_rules[tuple(one_match_tags[0])]
+                logger.debug("final tag, one match %s", one_match_tags[0])
+                return materialize_rules(variant_rules[tuple(one_match_tags[0])], q, _GATE_KINDS)
                 
               
             
@@ -583,18 +594,15 @@ class CCX_Variant_Gate(ControlledGate):
 #                 raise AttributeError(f"Unexpcted tag value{variant_tag[-1]}")
 
         #if both of them are not found:
-        print("didn't find match tag")
+        logger.debug("didn't find match tag for %s", variant_tag)
         if variant_tag[-2] == 'f':
-            return variant_rules[('01', '12', 'f', 'p')]
+            return materialize_rules(variant_rules[('01', '12', 'f', 'p')], q, _GATE_KINDS)
         elif variant_tag[-2] == 'l0':
-            print("l0", variant_tag)
-            return variant_rules[('02', '10', 'l0', 's')]
+            return materialize_rules(variant_rules[('02', '10', 'l0', 's')], q, _GATE_KINDS)
         elif variant_tag[-2] == 'l1':
-            print("l1", variant_tag)
-            return variant_rules[('01', '12', 'l1', 'p')]
+            return materialize_rules(variant_rules[('01', '12', 'l1', 'p')], q, _GATE_KINDS)
         elif variant_tag[-2] == 'l2':
-            print("l2", variant_tag)
-            return variant_rules[('12', '20', 'l2', 'p')]
+            return materialize_rules(variant_rules[('12', '20', 'l2', 'p')], q, _GATE_KINDS)
                                              
                                              
                 
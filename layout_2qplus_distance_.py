@@ -18,8 +18,88 @@ The lower the number, the better the selection.
 Therefore, 0 is a perfect layout selection.
 """
 
+import numpy as np
+
 from qiskit.transpiler.basepasses import AnalysisPass
 
+from coupling_tables import get_coupling_tables
+
+
+def gate_qarg_arrays(dag):
+    """Extract the qubit indices of the 2q and toffoli gates of `dag`.
+
+    Args:
+        dag (DAGCircuit): DAG to evaluate.
+    Returns:
+        tuple(ndarray, ndarray): integer arrays of shape (n_2q, 2) and (n_ccx, 3) holding the
+            indices (in ``dag.qubits``) of the qargs of every 2q gate and every toffoli.
+    """
+    qubit_indices = {bit: index for index, bit in enumerate(dag.qubits)}
+
+    pairs = [[qubit_indices[qarg] for qarg in gate.qargs] for gate in dag.two_qubit_ops()]
+
+    triples = []
+    for gate in dag.multi_qubit_ops():
+        #make sure that the only multi qubit gate that stays in the circuit is a ccx gate
+        assert gate.op.name == 'ccx'
+        triples.append([qubit_indices[qarg] for qarg in gate.qargs])
+
+    return (
+        np.asarray(pairs, dtype=np.int64).reshape(-1, 2),
+        np.asarray(triples, dtype=np.int64).reshape(-1, 3),
+    )
+
+
+def layout_to_array(layout, qubits, used=None):
+    """Return the physical qubit of every qubit in `qubits` as an integer array.
+
+    Only the qubits at the indices `used` (by default all of them) are looked up in `layout`,
+    the others are set to -1, so a layout may leave the idle qubits unassigned.
+    """
+    if used is None:
+        return np.fromiter((layout[qubit] for qubit in qubits), dtype=np.int64, count=len(qubits))
+    physical = np.full(len(qubits), -1, dtype=np.int64)
+    for index in used:
+        physical[index] = layout[qubits[index]]
+    return physical
+
+
+def gate_qubits(pairs, triples):
+    """Return the sorted indices of the qubits used by the gates in `pairs` and `triples`."""
+    return np.union1d(pairs.ravel(), triples.ravel())
+
+
+def score_layouts(distance_matrix, pairs, triples, layouts):
+    """Score one or many layouts at once.
+
+    The score of a layout is the sum of ``distance - 1`` over every 2q gate and over the three
+    qubit pairs of every toffoli, 0 is a perfect layout.
+
+    Args:
+        distance_matrix (ndarray): (n_physical, n_physical) undirected distance matrix
+        pairs (ndarray): (n_2q, 2) qubit indices of the 2q gates, see :func:`gate_qarg_arrays`
+        triples (ndarray): (n_ccx, 3) qubit indices of the toffolis
+        layouts (ndarray): (n_qubits,) physical qubit of every qubit, or (n_layouts, n_qubits)
+            for a batch of candidate layouts
+    Returns:
+        int or ndarray: the score, or the (n_layouts,) scores of a batch
+    """
+    layouts = np.asarray(layouts, dtype=np.int64)
+    batch = np.atleast_2d(layouts)
+
+    physical_pairs = batch[:, pairs]
+    physical_triples = batch[:, triples]
+    scores = distance_matrix[physical_pairs[..., 0], physical_pairs[..., 1]].sum(axis=1)
+    #the trios paper prescribes treating the toffoli as its 6-cnot decomposition,
+    #i.e. all three pairs of physical qubits are scored
+    for first, second in ((0, 1), (1, 2), (0, 2)):
+        scores += distance_matrix[physical_triples[..., first], physical_triples[..., second]].sum(axis=1)
+    scores -= len(pairs) + 3 * len(triples)
+
+    if layouts.ndim == 1:
+        return int(scores[0])
+    return scores
+
 
 class Layout2qPlusDistance_(AnalysisPass):
     """Evaluate how good the layout selection was.
@@ -52,38 +132,12 @@ class Layout2qPlusDistance_(AnalysisPass):
         if layout is None:
             return
 
-        sum_distance = 0
-
-        for gate in dag.two_qubit_ops():
-            physical_q0 = layout[gate.qargs[0]]
-            physical_q1 = layout[gate.qargs[1]]
-
-            #the distance being returned is the undirected distance between physical 
-            #qubits q0 and q1.
-            sum_distance += self.coupling_map.distance(physical_q0, physical_q1) - 1
-
-        #evaluting the distance for toffoli gates
-        for gate in dag.multi_qubit_ops():
-
-            #make sure that the only multi qubit gate that stays in the circuit is a ccx gate
-            assert gate.op.name == 'ccx'
-
-            #get the physical qubits corresponding to the virtual qubits from the layout
-            physical_q0 = layout[gate.qargs[0]]
-            physical_q1 = layout[gate.qargs[1]]
-            physical_q2 = layout[gate.qargs[2]]
-
-            #find the total distance cost for implementing the toffoli gate
-
-            #the trios paper prescribes treating the toffoli as its 6-cnot decomposition
-            #for determining the best mapping. If the 6 cnot decomposition is to work, then all 
-            #three physical qubits need to be near to each other.
-
-            #Note that a topology aware mapping scheme would have performed better (i.e. find out
-            #the topology of the device and based on that treat the toffoli as its 6/8 cnot decomposition)
-            sum_distance += self.coupling_map.distance(physical_q0, physical_q1) - 1
-            sum_distance += self.coupling_map.distance(physical_q1, physical_q2) - 1
-            sum_distance += self.coupling_map.distance(physical_q0, physical_q2) - 1 
+        distance_matrix = get_coupling_tables(self.coupling_map).distance_matrix
+        pairs, triples = gate_qarg_arrays(dag)
 
+        #Note that a topology aware mapping scheme would have performed better (i.e. find out
+        #the topology of the device and based on that treat the toffoli as its 6/8 cnot decomposition)
+        physical = layout_to_array(layout, dag.qubits, gate_qubits(pairs, triples))
+        sum_distance = score_layouts(distance_matrix, pairs, triples, physical)
 
         self.property_set[self.property_name] = sum_distance
\ No newline at end of file
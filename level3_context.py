@@ -1,3 +1,7 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import qiskit
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister, Aer, execute, transpile
@@ -7,6 +11,7 @@ from qiskit.transpiler import PassManager
 from qiskit.converters import circuit_to_dag
 from qiskit.visualization import dag_drawer, plot_histogram
 from qiskit.compiler import assemble
+from qiskit.compiler.transpiler import _remap_circuit_faulty_backend, _remap_layout_faulty_backend
 from qiskit.tools.monitor import job_monitor
 
 from qiskit import IBMQ
@@ -79,14 +84,18 @@ from layout_2qplus_distance_ import Layout2qPlusDistance_
 from csp_layout_ import CSPLayout_
 from dense_layout_ import DenseLayout_
 from noise_adaptive_layout_ import NoiseAdaptiveLayout_
+from portfolio_layout_ import PortfolioLayout_
 from full_ancilla_allocation_ import FullAncillaAllocation_
 from enlarge_with_ancilla_ import EnlargeWithAncilla_
 from apply_layout_ import ApplyLayout_
 from check_map_ import CheckMap_
 from barrier_before_final_measurements_ import BarrierBeforeFinalMeasurements_
 from basic_swap_ import BasicSwap_
+from sabre_swap_ import SabreSwap_
+from sabre_trials_ import SabreTrials_
 from unroll_toffoli_ import UnrollToffoli_
 from context_aware_decompose_ import UnrollToffoliContextAware_
+from device_context import get_device_context
 
 from typing import List, Union, Dict, Callable, Any, Optional, Tuple
 
@@ -640,6 +649,11 @@ def level_3_context_pass_manager(pass_manager_config: PassManagerConfig) -> Pass
         _choose_layout_2 = NoiseAdaptiveLayout_(backend_properties)
     elif layout_method == "sabre":
         _choose_layout_2 = SabreLayout(coupling_map, max_iterations=4, seed=seed_transpiler)
+    elif layout_method == "portfolio":
+        #trivial, csp, dense, noise adaptive and sabre run concurrently, bounded by one deadline
+        _choose_layout_2 = PortfolioLayout_(
+            coupling_map, backend_properties, seed=seed_transpiler, deadline=60
+        )
     else:
         raise TranspilerError("Invalid layout method %s." % layout_method)
 
@@ -655,12 +669,30 @@ def level_3_context_pass_manager(pass_manager_config: PassManagerConfig) -> Pass
     _swap = [BarrierBeforeFinalMeasurements_()]
     if routing_method == "basic":
         _swap += [BasicSwap_(coupling_map)]
+    elif routing_method == "basic_parallel":
+        _swap += [BasicSwap_(coupling_map, parallel_layers=True)]
     elif routing_method == "stochastic":
         _swap += [StochasticSwap(coupling_map, trials=200, seed=seed_transpiler)]
     elif routing_method == "lookahead":
         _swap += [LookaheadSwap(coupling_map, search_depth=5, search_width=6)]
     elif routing_method == "sabre":
         _swap += [SabreSwap(coupling_map, heuristic="decay", seed=seed_transpiler)]
+    elif routing_method == "toffoli_sabre":
+        #routes toffolis natively onto lines (8-cnot decomposition)
+        _swap += [SabreSwap_(coupling_map, heuristic="decay", seed=seed_transpiler)]
+    elif routing_method == "toffoli_sabre_triangle":
+        #routes toffolis natively onto triangles (6-cnot decomposition) where the device has them
+        _swap += [
+            SabreSwap_(coupling_map, heuristic="decay", seed=seed_transpiler, toffoli_target="triangle")
+        ]
+    elif routing_method == "toffoli_sabre_trials":
+        #best of several seeded toffoli_sabre_triangle trials, scored by the estimated cnot count
+        _swap += [
+            SabreTrials_(
+                coupling_map, trials=8, seed=seed_transpiler, toffoli_target="triangle",
+                cost="estimated_cnots",
+            )
+        ]
     elif routing_method == "none":
         _swap += [
             Error(
@@ -772,3 +804,216 @@ def level_3_context_pass_manager(pass_manager_config: PassManagerConfig) -> Pass
     pm3.append(_alignments)
 
     return pm3
+
+
+#the level 3 pass manager of every pipeline, the pulse ones are imported lazily as they need qiskit_superstaq
+_PIPELINES = {
+    "context": ("level3_context", "level_3_context_pass_manager"),
+    "context_pulse": ("level3_context_pulse", "level_3_context_pulse_pass_manager"),
+    "swap_pulse": ("level3_context_pulse", "level_3_swap_pulse_pass_manager"),
+    "pulse": ("level3_context_pulse", "level_3_pulse_pass_manager"),
+}
+
+#the pipeline and the configurations of a worker process of transpile_context, set by
+#_init_transpile_worker, and the pass managers built from them, on first use
+_WORKER_PIPELINE = None
+_WORKER_CONFIGS = []
+_WORKER_PASS_MANAGERS = {}
+
+
+def _pipeline_pass_manager(pipeline):
+    if pipeline not in _PIPELINES:
+        raise TranspilerError("Invalid pipeline %s." % pipeline)
+    module_name, function_name = _PIPELINES[pipeline]
+    if module_name == __name__:
+        return globals()[function_name]
+    module = __import__(module_name)
+    return getattr(module, function_name)
+
+
+def _config_key(pass_manager_config):
+    #the _parse_* helpers repeat the same object for an argument shared by all the circuits,
+    #but build the instruction durations and the initial layout for every circuit, so these
+    #two are compared by value
+    key = []
+    for value in vars(pass_manager_config).values():
+        if isinstance(value, InstructionDurations):
+            key.append((
+                value.dt,
+                frozenset(value.duration_by_name.items()),
+                frozenset(value.duration_by_name_qubits.items()),
+            ))
+        elif isinstance(value, Layout):
+            key.append(frozenset(value.get_physical_bits().items()))
+        elif value is None or isinstance(value, (str, int, float)):
+            key.append(value)
+        else:
+            key.append(("id", id(value)))
+    return tuple(key)
+
+
+def _init_transpile_worker(pipeline, pass_manager_configs):
+    """Keep the pipeline and the configurations of the worker process."""
+    global _WORKER_PIPELINE, _WORKER_CONFIGS, _WORKER_PASS_MANAGERS
+    #parallel_map only starts a pool when this flag is unset, the passes run in a worker
+    #(e.g. SabreTrials_) must not start one of their own
+    os.environ["QISKIT_IN_PARALLEL"] = "TRUE"
+    _WORKER_PIPELINE = pipeline
+    _WORKER_CONFIGS = pass_manager_configs
+    _WORKER_PASS_MANAGERS = {}
+
+
+def _build_pass_manager(pipeline, config):
+    """Build the pass manager of a configuration, and the device context it uses."""
+    pass_manager = _pipeline_pass_manager(pipeline)(config)
+    if config.coupling_map is not None:
+        get_device_context(config.coupling_map, config.backend_properties).coupling_tables
+    return pass_manager
+
+
+def _run_transpile_task(pass_manager, config, task):
+    circuit, _, output_name, faulty_qubits_map, backend_num_qubits = task
+    result = pass_manager.run(circuit, output_name=output_name)
+    if faulty_qubits_map:
+        #as transpile(), map the circuit on the working qubits back onto the full backend
+        result = _remap_circuit_faulty_backend(
+            result, backend_num_qubits, config.backend_properties, faulty_qubits_map
+        )
+    return result
+
+
+def _transpile_context_task(task):
+    #runs in a worker process, the pass manager of a configuration is built once, on first use
+    config_index = task[1]
+    pass_manager = _WORKER_PASS_MANAGERS.get(config_index)
+    if pass_manager is None:
+        pass_manager = _build_pass_manager(_WORKER_PIPELINE, _WORKER_CONFIGS[config_index])
+        _WORKER_PASS_MANAGERS[config_index] = pass_manager
+    return _run_transpile_task(pass_manager, _WORKER_CONFIGS[config_index], task)
+
+
+def transpile_context(
+    circuits,
+    backend=None,
+    basis_gates=None,
+    coupling_map=None,
+    orientation_map=None,
+    backend_properties=None,
+    initial_layout=None,
+    layout_method=None,
+    routing_method=None,
+    translation_method=None,
+    scheduling_method=None,
+    instruction_durations=None,
+    dt=None,
+    approximation_degree=None,
+    seed_transpiler=None,
+    output_name=None,
+    timing_constraints=None,
+    pipeline="context",
+    num_processes=None,
+    chunk_size=1,
+):
+    """Transpile one or more circuits with a level 3 context-aware pipeline.
+
+    The arguments are resolved by ``_parse_transpile_args`` as in ``transpile()``. The circuits
+    are then fanned out over a process pool, every worker builds the pass manager of each
+    distinct configuration (and the device context) once, when it first runs a circuit with
+    that configuration, and reuses them for all the circuits it runs. As in ``transpile()``,
+    on a backend with faulty qubits the circuits are compiled for the working qubits and
+    mapped back onto the full backend.
+
+    Args:
+        circuits (QuantumCircuit or list[QuantumCircuit]): the circuits to transpile
+        backend (Backend): the target backend
+        pipeline (str): ``"context"``, ``"context_pulse"``, ``"swap_pulse"`` or ``"pulse"``,
+            the level 3 pass manager to run
+        num_processes (int): number of worker processes, defaults to the number of CPUs.
+            With one process (or one circuit) the circuits are transpiled in this process.
+        chunk_size (int): number of circuits sent to a worker at a time
+        other args: see ``transpile()``
+
+    Returns:
+        QuantumCircuit or list[QuantumCircuit]: the transpiled circuit(s)
+
+    Raises:
+        TranspilerError: if the pipeline is not known
+    """
+    if pipeline not in _PIPELINES:
+        raise TranspilerError("Invalid pipeline %s." % pipeline)
+    arg_circuits_list = isinstance(circuits, list)
+    circuits = circuits if arg_circuits_list else [circuits]
+
+    transpile_args = _parse_transpile_args(
+        circuits,
+        backend,
+        basis_gates,
+        coupling_map,
+        orientation_map,
+        backend_properties,
+        initial_layout,
+        layout_method,
+        routing_method,
+        translation_method,
+        scheduling_method,
+        instruction_durations,
+        dt,
+        approximation_degree,
+        seed_transpiler,
+        3,
+        None,
+        output_name,
+        timing_constraints,
+    )
+
+    #circuits sharing their arguments share a pass manager
+    config_indices = {}
+    pass_manager_configs = []
+    tasks = []
+    for circuit, args in zip(circuits, transpile_args):
+        config = args["pass_manager_config"]
+        faulty_qubits_map = args["faulty_qubits_map"]
+        if faulty_qubits_map:
+            #as transpile(), the layout is given on the working qubits of the backend
+            config.initial_layout = _remap_layout_faulty_backend(
+                config.initial_layout, faulty_qubits_map
+            )
+        key = _config_key(config)
+        if key not in config_indices:
+            config_indices[key] = len(pass_manager_configs)
+            pass_manager_configs.append(config)
+        tasks.append((
+            circuit,
+            config_indices[key],
+            args["output_name"],
+            faulty_qubits_map,
+            args["backend_num_qubits"],
+        ))
+
+    num_processes = num_processes or os.cpu_count() or 1
+    num_processes = min(num_processes, len(tasks))
+    if num_processes <= 1:
+        pass_managers = {}
+        transpiled = []
+        for task in tasks:
+            config_index = task[1]
+            if config_index not in pass_managers:
+                pass_managers[config_index] = _build_pass_manager(
+                    pipeline, pass_manager_configs[config_index]
+                )
+            transpiled.append(
+                _run_transpile_task(
+                    pass_managers[config_index], pass_manager_configs[config_index], task
+                )
+            )
+    else:
+        with ProcessPoolExecutor(
+            max_workers=num_processes,
+            initializer=_init_transpile_worker,
+            initargs=(pipeline, pass_manager_configs),
+        ) as executor:
+            transpiled = list(executor.map(_transpile_context_task, tasks, chunksize=chunk_size))
+
+    if arg_circuits_list:
+        return transpiled
+    return transpiled[0]
@@ -12,14 +12,22 @@
 
 """Choose a noise-adaptive Layout based on current calibration data for the backend."""
 
+import heapq
+import logging
 import math
+from collections import Counter
 
+import numpy as np
 import retworkx as rx
 
 from qiskit.transpiler.layout import Layout
 from qiskit.transpiler.basepasses import AnalysisPass
 from qiskit.transpiler.exceptions import TranspilerError
 
+from device_context import get_device_context
+
+logger = logging.getLogger(__name__)
+
 
 class NoiseAdaptiveLayout_(AnalysisPass):
     """Choose a noise-adaptive Layout based on current calibration data for the backend.
@@ -72,13 +80,14 @@ class NoiseAdaptiveLayout_(AnalysisPass):
         self.swap_graph = rx.PyDiGraph()
         self.cx_reliability = {}
         self.readout_reliability = {}
-        self.available_hw_qubits = []
+        self.available_hw_qubits = set()
         
         #the gate list maintains a list of hardware links in the form of (q0, q1)
         #Here a link is defined by the qubits which form the corners of the link
         self.gate_list = []
         self.gate_reliability = {}
-        self.swap_reliabs = {}
+        self.swap_reliabs = None
+        self.readout_reliabs = None
         self.prog_graph = rx.PyGraph()
         self.prog_neighbors = {}
         self.qarg_to_id = {}
@@ -86,8 +95,44 @@ class NoiseAdaptiveLayout_(AnalysisPass):
         self.prog2hw = {}
 
     def _initialize_backend_prop(self):
-        """Extract readout and CNOT errors and compute swap costs."""
-        backend_prop = self.backend_prop
+        """Extract readout and CNOT errors and compute swap costs.
+
+        The tables only depend on the backend properties, they are computed once and shared
+        through the device context (per calibration date). The available qubits are copied as
+        run consumes them.
+        """
+        tables = get_device_context(backend_prop=self.backend_prop).get(
+            "noise_adaptive_tables", lambda: self._compute_backend_tables(self.backend_prop)
+        )
+        self.swap_graph = tables["swap_graph"]
+        self.cx_reliability = tables["cx_reliability"]
+        self.readout_reliability = tables["readout_reliability"]
+        self.available_hw_qubits = set(tables["available_hw_qubits"])
+        self.gate_list = tables["gate_list"]
+        self.gate_reliability = tables["gate_reliability"]
+        self.swap_reliabs = tables["swap_reliabs"]
+        self.readout_reliabs = tables["readout_reliabs"]
+
+    @staticmethod
+    def _compute_backend_tables(backend_prop):
+        """Compute the reliability tables of `backend_prop`.
+
+        ``swap_reliabs[i, j]`` is the reliability of a cnot between the hardware qubits i and j:
+        the cnot reliability if they are coupled, else the best over the neighbors n of j of
+        the reliability of the swaps moving i next to n times the (n, j) cnot reliability.
+        The swap paths come from a Floyd-Warshall on the -log swap reliabilities.
+
+        Returns:
+            dict: the swap graph, the cx, readout and gate reliabilities, the hardware links,
+                the qubits with a readout error, the (n, n) swap reliability matrix and the
+                (n,) readout reliability array
+        """
+        swap_graph = rx.PyDiGraph()
+        cx_reliability = {}
+        readout_reliability = {}
+        available_hw_qubits = []
+        gate_list = []
+        gate_reliability = {}
         edge_list = []
         for ginfo in backend_prop.gates:
 
@@ -104,43 +149,70 @@ class NoiseAdaptiveLayout_(AnalysisPass):
                 swap_cost = -math.log(swap_reliab) if swap_reliab != 0 else math.inf
                 edge_list.append((ginfo.qubits[0], ginfo.qubits[1], swap_cost))
                 edge_list.append((ginfo.qubits[1], ginfo.qubits[0], swap_cost))
-                self.cx_reliability[(ginfo.qubits[0], ginfo.qubits[1])] = g_reliab
+                cx_reliability[(ginfo.qubits[0], ginfo.qubits[1])] = g_reliab
                 
                 #maintains a list of all the hardware links in the form of (q0, q1)
-                self.gate_list.append((ginfo.qubits[0], ginfo.qubits[1]))
-        self.swap_graph.extend_from_weighted_edge_list(edge_list)
+                gate_list.append((ginfo.qubits[0], ginfo.qubits[1]))
+        swap_graph.extend_from_weighted_edge_list(edge_list)
         idx = 0
         for q in backend_prop.qubits:
             for nduv in q:
                 if nduv.name == "readout_error":
-                    self.readout_reliability[idx] = 1.0 - nduv.value
-                    self.available_hw_qubits.append(idx)
+                    readout_reliability[idx] = 1.0 - nduv.value
+                    available_hw_qubits.append(idx)
             idx += 1
-        for edge in self.cx_reliability:
-            self.gate_reliability[edge] = (
-                self.cx_reliability[edge]
-                * self.readout_reliability[edge[0]]
-                * self.readout_reliability[edge[1]]
+        for edge in cx_reliability:
+            gate_reliability[edge] = (
+                cx_reliability[edge]
+                * readout_reliability[edge[0]]
+                * readout_reliability[edge[1]]
             )
 
-        swap_reliabs_ro = rx.digraph_floyd_warshall_numpy(self.swap_graph, lambda weight: weight)
-        for i in range(swap_reliabs_ro.shape[0]):
-            self.swap_reliabs[i] = {}
-            for j in range(swap_reliabs_ro.shape[1]):
-                if (i, j) in self.cx_reliability:
-                    self.swap_reliabs[i][j] = self.cx_reliability[(i, j)]
-                elif (j, i) in self.cx_reliability:
-                    self.swap_reliabs[i][j] = self.cx_reliability[(j, i)]
-                else:
-                    best_reliab = 0.0
-                    for n in self.swap_graph.neighbors(j):
-                        if (n, j) in self.cx_reliability:
-                            reliab = math.exp(-swap_reliabs_ro[i][n]) * self.cx_reliability[(n, j)]
-                        else:
-                            reliab = math.exp(-swap_reliabs_ro[i][n]) * self.cx_reliability[(j, n)]
-                        if reliab > best_reliab:
-                            best_reliab = reliab
-                    self.swap_reliabs[i][j] = best_reliab
+        num_hw_qubits = max(len(backend_prop.qubits), len(swap_graph))
+        readout_reliabs = np.zeros(num_hw_qubits)
+        for idx, reliab in readout_reliability.items():
+            readout_reliabs[idx] = reliab
+        readout_reliabs.setflags(write=False)
+
+        #the reliability of the cnot on every link, in either direction
+        links = np.zeros((num_hw_qubits, num_hw_qubits), dtype=bool)
+        link_reliabs = np.zeros((num_hw_qubits, num_hw_qubits))
+        for (q0, q1), reliab in cx_reliability.items():
+            links[q0, q1] = links[q1, q0] = True
+            link_reliabs[q0, q1] = reliab
+            if (q1, q0) not in cx_reliability:
+                link_reliabs[q1, q0] = reliab
+
+        #Floyd-Warshall on the swap costs, vectorized over the rows and columns for every k
+        swap_costs = np.full((num_hw_qubits, num_hw_qubits), np.inf)
+        np.fill_diagonal(swap_costs, 0.0)
+        for q0, q1, swap_cost in edge_list:
+            swap_costs[q0, q1] = min(swap_costs[q0, q1], swap_cost)
+        for k in range(num_hw_qubits):
+            np.minimum(swap_costs, swap_costs[:, k, None] + swap_costs[None, k, :], out=swap_costs)
+        swap_path_reliabs = np.exp(-swap_costs)
+
+        #best over the neighbors n of j of swap_path_reliabs[i, n] * link_reliabs[n, j]
+        swap_reliabs = np.zeros((num_hw_qubits, num_hw_qubits))
+        for neighbor, target in zip(*np.nonzero(links)):
+            np.maximum(
+                swap_reliabs[:, target],
+                swap_path_reliabs[:, neighbor] * link_reliabs[neighbor, target],
+                out=swap_reliabs[:, target],
+            )
+        swap_reliabs = np.where(links, link_reliabs, swap_reliabs)
+        swap_reliabs.setflags(write=False)
+
+        return {
+            "swap_graph": swap_graph,
+            "cx_reliability": cx_reliability,
+            "readout_reliability": readout_reliability,
+            "available_hw_qubits": available_hw_qubits,
+            "gate_list": gate_list,
+            "gate_reliability": gate_reliability,
+            "swap_reliabs": swap_reliabs,
+            "readout_reliabs": readout_reliabs,
+        }
 
     def _qarg_to_id(self, qubit):
         """Convert qarg with name and value to an integer id."""
@@ -151,32 +223,23 @@ class NoiseAdaptiveLayout_(AnalysisPass):
 
         Two nodes have an edge if the corresponding virtual qubits
         participate in a 2-qubit gate. The edge is weighted by the
-        number of CNOTs between the pair.
+        number of CNOTs between the pair, a toffoli counting as its six-cnot
+        decomposition (two cnots on each of its three pairs). The weights are
+        accumulated in a Counter and the graph is built once, one edge per pair.
         """
-        
+
         #set an index for each qubit. The key is the qiskit qubit object and the id is simply an integer
-        idx = 0
-        for q in dag.qubits:
-            self.qarg_to_id[q] = idx
-            idx += 1
-        
-        #list of all the edges in the program graph
-        edge_list = []
+        self.qarg_to_id = {qubit: idx for idx, qubit in enumerate(dag.qubits)}
+        qarg_to_id = self.qarg_to_id
+
+        #the weight of every program edge (min_q, max_q)
+        edge_weights = Counter()
 
         #edges added from two qubit gates
         for gate in dag.two_qubit_ops():
-            qid1 = self._qarg_to_id(gate.qargs[0])
-            qid2 = self._qarg_to_id(gate.qargs[1])
-            min_q = min(qid1, qid2)
-            max_q = max(qid1, qid2)
-
-            #setting the degault edge weight equal to one
-            edge_weight = 1
-
-            #if the progarm graph already has the given edge in it, we simply increase its weight by one (since there is an extra cnot between them)
-            if self.prog_graph.has_edge(min_q, max_q):
-                edge_weight = self.prog_graph[min_q][max_q]["weight"] + 1
-            edge_list.append((min_q, max_q, edge_weight))
+            qid1 = qarg_to_id[gate.qargs[0]]
+            qid2 = qarg_to_id[gate.qargs[1]]
+            edge_weights[(min(qid1, qid2), max(qid1, qid2))] += 1
 
         #edges added from treating toffoli gates as their equivalent six-cnot representation
         for gate in dag.multi_qubit_ops():
@@ -184,127 +247,119 @@ class NoiseAdaptiveLayout_(AnalysisPass):
             #make sure that the only multi qubit operation is the toffoli gate
             assert gate.op.name == 'ccx'
 
-            qid1 = self._qarg_to_id(gate.qargs[0])
-            qid2 = self._qarg_to_id(gate.qargs[1])
-            qid3 = self._qarg_to_id(gate.qargs[2])
-
-            #consider the pair (qid1, qid2) first
-            min_q = min(qid1, qid2)
-            max_q = max(qid1, qid2)
-
-            #set the default edge weight equal to one
-            edge_weight = 1
-
-            #if the progarm graph already has the given edge in it, we simply increase its weight by one (since there is an extra cnot between them)
-            if self.prog_graph.has_edge(min_q, max_q):
-                edge_weight = self.prog_graph[min_q][max_q]["weight"] + 2
-            edge_list.append((min_q, max_q, edge_weight))
-
-            #consider the pair (qid2, qid3) second
-            min_q = min(qid2, qid3)
-            max_q = max(qid2, qid3)
-
-            #set the default edge weight equal to one
-            edge_weight = 1
+            qids = [qarg_to_id[qarg] for qarg in gate.qargs]
+            for first, second in ((0, 1), (1, 2), (0, 2)):
+                edge_weights[(min(qids[first], qids[second]), max(qids[first], qids[second]))] += 2
 
-            #if the progarm graph already has the given edge in it, we simply increase its weight by one (since there is an extra cnot between them)
-            if self.prog_graph.has_edge(min_q, max_q):
-                edge_weight = self.prog_graph[min_q][max_q]["weight"] + 2
-            edge_list.append((min_q, max_q, edge_weight))
-
-            #at last consider the pair (qid1, qid3)
-            min_q = min(qid1, qid3)
-            max_q = max(qid1, qid3)
-
-            #set the default edge weight equal to one
-            edge_weight = 1
+        self.prog_graph.extend_from_weighted_edge_list(
+            [(min_q, max_q, weight) for (min_q, max_q), weight in edge_weights.items()]
+        )
+        return len(qarg_to_id)
 
-            #if the progarm graph already has the given edge in it, we simply increase its weight by one (since there is an extra cnot between them)
-            if self.prog_graph.has_edge(min_q, max_q):
-                edge_weight = self.prog_graph[min_q][max_q]["weight"] + 2
-            edge_list.append((min_q, max_q, edge_weight))
+    def _init_queues(self):
+        """Build the priority queues of the mapper.
 
+        The pending program edges are ranked by their position in ``pending_program_edges``.
+        The edges with no qubit mapped and the edges with one qubit mapped are kept in two
+        heaps of ranks, and the hardware cnots in a heap of (-reliability, position in
+        ``gate_list``). Entries that became stale (an edge with both qubits mapped, a cnot on
+        a qubit in use) are only dropped when they reach the top of their heap.
+        """
+        self._unmapped_edges = [(rank, edge) for rank, edge in enumerate(self.pending_program_edges)]
+        self._frontier_edges = []
+        self._incident_edges = {}
+        for rank, edge in self._unmapped_edges:
+            self._incident_edges.setdefault(edge[0], []).append((rank, edge))
+            self._incident_edges.setdefault(edge[1], []).append((rank, edge))
+
+        self._cx_queue = [
+            (-self.gate_reliability[gate], index, gate) for index, gate in enumerate(self.gate_list)
+        ]
+        heapq.heapify(self._cx_queue)
+
+        #the product of the swap reliabilities from the mapped neighbors of every program
+        #qubit, a row over the hardware qubits. It is updated each time a neighbor is mapped
+        self._neighbor_reliabs = {}
+        self._available_mask = np.zeros(len(self.readout_reliabs), dtype=bool)
+        self._available_mask[list(self.available_hw_qubits)] = True
+
+    def _map_qubit(self, prog_qubit, hw_qubit):
+        """Map `prog_qubit` onto `hw_qubit` and update the queues and the reliabilities."""
+        self.prog2hw[prog_qubit] = hw_qubit
+        self.available_hw_qubits.remove(hw_qubit)
+        self._available_mask[hw_qubit] = False
+
+        #the pending edges of the qubit now have one (or both) qubits mapped
+        for rank, edge in self._incident_edges.get(prog_qubit, []):
+            if not (edge[0] in self.prog2hw and edge[1] in self.prog2hw):
+                heapq.heappush(self._frontier_edges, (rank, edge))
 
-        self.prog_graph.extend_from_weighted_edge_list(edge_list)
-        return idx
+        if prog_qubit not in self.prog_neighbors:
+            self.prog_neighbors[prog_qubit] = self.prog_graph.neighbors(prog_qubit)
+        for neighbor in self.prog_neighbors[prog_qubit]:
+            if neighbor in self.prog2hw:
+                continue
+            if neighbor in self._neighbor_reliabs:
+                self._neighbor_reliabs[neighbor] *= self.swap_reliabs[hw_qubit]
+            else:
+                self._neighbor_reliabs[neighbor] = self.swap_reliabs[hw_qubit].copy()
 
     def _select_next_edge(self):
         """Select the next edge.
 
-        If there is an edge with one endpoint mapped, return it.
-        Else return in the first edge
+        If there is an edge with one endpoint mapped, return the first of them.
+        Else return in the first edge, None if no edge is pending.
         """
-        for edge in self.pending_program_edges:
-
-            #if both qubits corresponding to the program edge are already
-            #mapped to the device, then both these booleans are true
-            q1_mapped = edge[0] in self.prog2hw
-            q2_mapped = edge[1] in self.prog2hw
-
-            #if both qubits are already mapped then the edge is not longer pending
-            #this is an error
-            assert not (q1_mapped and q2_mapped)
-
-            #if one qubit of the edge has been mapped and the other qubit 
-            #is hanging, then we give priority to this edge
-            if q1_mapped or q2_mapped:
-                return edge
-        
-        #if none of the edges are hanging, simply return the first edge
-        return self.pending_program_edges[0]
+        #drop the edges whose qubits are both mapped, they are no longer pending
+        frontier = self._frontier_edges
+        while frontier and frontier[0][1][0] in self.prog2hw and frontier[0][1][1] in self.prog2hw:
+            heapq.heappop(frontier)
+
+        #if one qubit of the edge has been mapped and the other qubit
+        #is hanging, then we give priority to this edge
+        if frontier:
+            return frontier[0][1]
+
+        #the edges with a mapped qubit are all in the frontier
+        unmapped = self._unmapped_edges
+        while unmapped and (unmapped[0][1][0] in self.prog2hw or unmapped[0][1][1] in self.prog2hw):
+            heapq.heappop(unmapped)
+        if unmapped:
+            return unmapped[0][1]
+        return None
 
     def _select_best_remaining_cx(self):
         """Select best remaining CNOT in the hardware for the next program edge."""
-        
-        """This function is used to map only those program cnots 
+
+        """This function is used to map only those program cnots
         which have none of the edges mapped to the hardware already"""
 
-        #choose set of possible candidate cnot coupling 
-        #in the hardware
-        candidates = []
-        for gate in self.gate_list:
-            chk1 = gate[0] in self.available_hw_qubits
-            chk2 = gate[1] in self.available_hw_qubits
-            if chk1 and chk2:
-                candidates.append(gate)
-        
-        #choose the candidate with the maximum reliability
-        best_reliab = 0
-        best_item = None
-        for item in candidates:
-            if self.gate_reliability[item] > best_reliab:
-                best_reliab = self.gate_reliability[item]
-                best_item = item
-        return best_item
+        #the hardware qubits only become unavailable, so a cnot on a qubit in use is dropped
+        #for good. Ties go to the first cnot of gate_list
+        while self._cx_queue:
+            neg_reliab, _, gate = self._cx_queue[0]
+            if gate[0] in self.available_hw_qubits and gate[1] in self.available_hw_qubits:
+                return gate if -neg_reliab > 0 else None
+            heapq.heappop(self._cx_queue)
+        return None
 
     def _select_best_remaining_qubit(self, prog_qubit):
         """Select the best remaining hardware qubit for the next program qubit."""
 
-        """This function is called when one qubit of a program edge is not mapped 
+        """This function is called when one qubit of a program edge is not mapped
         to the hardware while the other qubit of the edge has been mapped to the hardware"""
 
-        reliab_store = {}
-
-        #checking if the given program qubit is one of the keys of the prog_neighbors dictionary
-        #this dictionary maps a program qubit to a dictionary of its keys 
-        if prog_qubit not in self.prog_neighbors:
-            self.prog_neighbors[prog_qubit] = self.prog_graph.neighbors(prog_qubit)
-        for hw_qubit in self.available_hw_qubits:
-            reliab = 1
-            for n in self.prog_neighbors[prog_qubit]:
-                if n in self.prog2hw:
-                    reliab *= self.swap_reliabs[self.prog2hw[n]][hw_qubit]
-            reliab *= self.readout_reliability[hw_qubit]
-            reliab_store[hw_qubit] = reliab
-        
-        #choosing the best hardware qubits out of the contenders that we stored in the dictionary
-        #reliab_store
-        max_reliab = 0
-        best_hw_qubit = None
-        for hw_qubit in reliab_store:
-            if reliab_store[hw_qubit] > max_reliab:
-                max_reliab = reliab_store[hw_qubit]
-                best_hw_qubit = hw_qubit
+        reliabs = self._neighbor_reliabs.get(prog_qubit)
+        if reliabs is None:
+            reliabs = self.readout_reliabs
+        else:
+            reliabs = reliabs * self.readout_reliabs
+
+        #masked argmax over the available hardware qubits, ties going to the lowest index
+        reliabs = np.where(self._available_mask, reliabs, 0.0)
+        best_hw_qubit = int(np.argmax(reliabs))
+        if reliabs[best_hw_qubit] <= 0:
+            return None
         return best_hw_qubit
 
     def run(self, dag):
@@ -312,10 +367,11 @@ class NoiseAdaptiveLayout_(AnalysisPass):
         self.swap_graph = rx.PyDiGraph()
         self.cx_reliability = {}
         self.readout_reliability = {}
-        self.available_hw_qubits = []
+        self.available_hw_qubits = set()
         self.gate_list = []
         self.gate_reliability = {}
-        self.swap_reliabs = {}
+        self.swap_reliabs = None
+        self.readout_reliabs = None
         self.prog_graph = rx.PyGraph()
         self.prog_neighbors = {}
         self.qarg_to_id = {}
@@ -346,11 +402,15 @@ class NoiseAdaptiveLayout_(AnalysisPass):
             self.prog_graph.weighted_edge_list(), key=lambda x: [x[2], -x[0], -x[1]], reverse=True
         )
 
+        self._init_queues()
+
         #check if there are still any pending edges in the program graph (pending edges are those which we have not considered)
-        while self.pending_program_edges:
+        while True:
 
             #get the next pending program edge
             edge = self._select_next_edge()
+            if edge is None:
+                break
 
             q1_mapped = edge[0] in self.prog2hw
             q2_mapped = edge[1] in self.prog2hw
@@ -363,10 +423,8 @@ class NoiseAdaptiveLayout_(AnalysisPass):
                         "CNOT({}, {}) could not be placed "
                         "in selected device.".format(edge[0], edge[1])
                     )
-                self.prog2hw[edge[0]] = best_hw_edge[0]
-                self.prog2hw[edge[1]] = best_hw_edge[1]
-                self.available_hw_qubits.remove(best_hw_edge[0])
-                self.available_hw_qubits.remove(best_hw_edge[1])
+                self._map_qubit(edge[0], best_hw_edge[0])
+                self._map_qubit(edge[1], best_hw_edge[1])
             
             #if only q1 is not mapped
             elif not q1_mapped:
@@ -376,8 +434,7 @@ class NoiseAdaptiveLayout_(AnalysisPass):
                         "CNOT({}, {}) could not be placed in selected device. "
                         "No qubit near qr[{}] available".format(edge[0], edge[1], edge[0])
                     )
-                self.prog2hw[edge[0]] = best_hw_qubit
-                self.available_hw_qubits.remove(best_hw_qubit)
+                self._map_qubit(edge[0], best_hw_qubit)
             
             #if only q2 is not mapped
             else:
@@ -387,23 +444,15 @@ class NoiseAdaptiveLayout_(AnalysisPass):
                         "CNOT({}, {}) could not be placed in selected device. "
                         "No qubit near qr[{}] available".format(edge[0], edge[1], edge[1])
                     )
-                self.prog2hw[edge[1]] = best_hw_qubit
-                self.available_hw_qubits.remove(best_hw_qubit)
-            
-            #now collect all the remaining unmapped program edges
-            new_edges = [
-                x
-                for x in self.pending_program_edges
-                if not (x[0] in self.prog2hw and x[1] in self.prog2hw)
-            ]
-            self.pending_program_edges = new_edges
+                self._map_qubit(edge[1], best_hw_qubit)
 
         #just map the othe remaining qubits (which do not encounter any multi-qubit gates)
-        #to remaining hardware qubits.
+        #to remaining hardware qubits, in increasing order.
+        remaining_hw_qubits = iter(sorted(self.available_hw_qubits))
         for qid in self.qarg_to_id.values():
             if qid not in self.prog2hw:
-                self.prog2hw[qid] = self.available_hw_qubits[0]
-                self.available_hw_qubits.remove(self.prog2hw[qid])
+                self.prog2hw[qid] = next(remaining_hw_qubits)
+        self.available_hw_qubits.difference_update(self.prog2hw.values())
         
         layout = Layout()
         for q in dag.qubits:
@@ -414,4 +463,4 @@ class NoiseAdaptiveLayout_(AnalysisPass):
             layout.add_register(qreg)
         self.property_set["layout"] = layout
 
-        print('The layout is: ', layout)
\ No newline at end of file
+        logger.debug("The layout is: %s", layout)
\ No newline at end of file
@@ -0,0 +1,223 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2019.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""Choose a Layout by running several layout passes concurrently and keeping the best one."""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from qiskit.transpiler.basepasses import AnalysisPass
+from qiskit.transpiler.exceptions import TranspilerError
+from qiskit.transpiler.passes import SabreLayout
+
+from coupling_tables import get_coupling_tables
+from csp_layout_ import CSPLayout_
+from dense_layout_ import DenseLayout_
+from layout_2qplus_distance_ import gate_qarg_arrays, gate_qubits, layout_to_array, score_layouts
+from noise_adaptive_layout_ import NoiseAdaptiveLayout_
+from trivial_layout_ import TrivialLayout_
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_CANDIDATES = ("trivial", "csp", "dense", "noise_adaptive", "sabre")
+
+#the worker pool shared by the runs of PortfolioLayout_, rebuilt when candidates had to be stopped
+_POOL = None
+_POOL_SIZE = 0
+
+
+def _get_pool(num_processes):
+    global _POOL, _POOL_SIZE
+    if _POOL is not None and _POOL_SIZE != num_processes:
+        _terminate_pool()
+    if _POOL is None:
+        _POOL = multiprocessing.Pool(num_processes)
+        _POOL_SIZE = num_processes
+    return _POOL
+
+
+def _terminate_pool():
+    global _POOL, _POOL_SIZE
+    if _POOL is not None:
+        _POOL.terminate()
+        _POOL.join()
+    _POOL = None
+    _POOL_SIZE = 0
+
+
+#the idle workers of the shared pool are stopped when the interpreter exits
+atexit.register(_terminate_pool)
+
+
+def _layout_pass(name, coupling_map, backend_prop, seed, time_limit):
+    if name == "trivial":
+        return TrivialLayout_(coupling_map)
+    if name == "csp":
+        return CSPLayout_(coupling_map, call_limit=None, time_limit=time_limit, seed=seed)
+    if name == "dense":
+        return DenseLayout_(coupling_map, backend_prop)
+    if name == "noise_adaptive":
+        return NoiseAdaptiveLayout_(backend_prop)
+    if name == "sabre":
+        return SabreLayout(coupling_map, max_iterations=4, seed=seed)
+    raise TranspilerError("Invalid layout method %s." % name)
+
+
+def _run_candidate(name, dag, coupling_map, backend_prop, seed, time_limit):
+    """Run the layout pass `name` on `dag` and score its layout with ``score_layouts``.
+
+    Returns:
+        tuple(Layout, int): the layout and its score, (None, None) if no layout was found
+    """
+    layout_pass = _layout_pass(name, coupling_map, backend_prop, seed, time_limit)
+    layout_pass.run(dag)
+    layout = layout_pass.property_set["layout"]
+    if layout is None:
+        return None, None
+    pairs, triples = gate_qarg_arrays(dag)
+    distance_matrix = get_coupling_tables(coupling_map).distance_matrix
+    physical = layout_to_array(layout, dag.qubits, gate_qubits(pairs, triples))
+    return layout, score_layouts(distance_matrix, pairs, triples, physical)
+
+
+class PortfolioLayout_(AnalysisPass):
+    """Choose a Layout by running several layout passes concurrently.
+
+    Every candidate layout pass runs in a worker process of a pool shared by all the runs of
+    the pass, the candidates still running when the pass returns are terminated with the
+    pool. Inside a worker process the candidates run in turn. The layouts are scored with
+    the same distance metric as ``Layout2qPlusDistance_`` (a toffoli counts its three qubit
+    pairs), and the first perfect layout (score 0) is kept as soon as it is found. Otherwise
+    the best layout found before the deadline is kept, ties going to the earlier candidate.
+
+    The scores are stored in ``property_set["portfolio_layout_scores"]`` and the name of the
+    chosen candidate in ``property_set["portfolio_layout_method"]``. The candidates that
+    fail are left out, and if no candidate returns a layout in time the trivial layout is
+    used.
+    """
+
+    def __init__(self, coupling_map, backend_prop=None, seed=None, deadline=60,
+                 candidates=LAYOUT_CANDIDATES, num_processes=None):
+        """PortfolioLayout_ initializer.
+
+        Args:
+            coupling_map (CouplingMap): Directed graph representing a coupling map.
+            backend_prop (BackendProperties): backend properties object, the noise adaptive
+                candidate is skipped without it.
+            seed (int): seed of the randomized candidates.
+            deadline (float): seconds after which the best layout found so far is kept. It is
+                also the time limit of the CSP candidate.
+            candidates (tuple): names of the layout passes to run, among ``LAYOUT_CANDIDATES``.
+            num_processes (int): number of worker processes, defaults to one per candidate
+                (at most the number of CPUs).
+                With one process the candidates run in turn in this process.
+
+        Raises:
+            TranspilerError: if a candidate is not known.
+        """
+        super().__init__()
+        for name in candidates:
+            if name not in LAYOUT_CANDIDATES:
+                raise TranspilerError("Invalid layout method %s." % name)
+        self.coupling_map = coupling_map
+        self.backend_prop = backend_prop
+        self.seed = seed
+        self.deadline = deadline
+        self.candidates = [
+            name for name in candidates if name != "noise_adaptive" or backend_prop is not None
+        ]
+        self.num_processes = num_processes
+
+    def run(self, dag):
+        """Run the PortfolioLayout_ pass on `dag`.
+
+        Args:
+            dag (DAGCircuit): DAG to find layout for.
+        """
+        args = (dag, self.coupling_map, self.backend_prop, self.seed, self.deadline)
+        num_processes = min(self.num_processes or os.cpu_count() or 1, len(self.candidates))
+        if num_processes <= 1 or multiprocessing.parent_process() is not None:
+            #in a worker process (e.g. of transpile_context) the candidates run in turn
+            results = self._run_serial(args)
+        else:
+            results = self._run_parallel(args, num_processes)
+
+        scores = {name: score for name, (_, score) in results.items()}
+        self.property_set["portfolio_layout_scores"] = scores
+        found = [name for name in self.candidates if scores.get(name) is not None]
+        if not found:
+            #the later stages need a layout, fall back on the trivial one
+            logger.warning(
+                "PortfolioLayout_ found no layout before the deadline, using the trivial layout"
+            )
+            trivial = TrivialLayout_(self.coupling_map)
+            trivial.run(dag)
+            self.property_set["layout"] = trivial.property_set["layout"]
+            self.property_set["portfolio_layout_method"] = "trivial"
+            return
+        best = min(found, key=lambda name: (scores[name], self.candidates.index(name)))
+        logger.debug("PortfolioLayout_ scores %s, keeping %s", scores, best)
+        self.property_set["layout"] = results[best][0]
+        self.property_set["portfolio_layout_method"] = best
+
+    def _run_serial(self, args):
+        results = {}
+        start = time.time()
+        for name in self.candidates:
+            if time.time() - start > self.deadline:
+                break
+            try:
+                results[name] = _run_candidate(name, *args)
+            except Exception as error:  # pylint: disable=broad-except
+                #a failing candidate (e.g. a pass not supporting toffolis) does not stop the others
+                logger.info("PortfolioLayout_ candidate %s failed: %s", name, error)
+                continue
+            if results[name][1] == 0:
+                break
+        return results
+
+    def _run_parallel(self, args, num_processes):
+        results = {}
+        finished = queue.Queue()
+        pool = _get_pool(num_processes)
+        for name in self.candidates:
+            pool.apply_async(
+                _run_candidate,
+                (name,) + args,
+                callback=lambda result, name=name: finished.put((name, result, None)),
+                error_callback=lambda error, name=name: finished.put((name, None, error)),
+            )
+        end = time.time() + self.deadline
+        running = len(self.candidates)
+        try:
+            while running:
+                try:
+                    name, result, error = finished.get(timeout=max(end - time.time(), 0))
+                except queue.Empty:
+                    break
+                running -= 1
+                if error is not None:
+                    logger.info("PortfolioLayout_ candidate %s failed: %s", name, error)
+                    continue
+                results[name] = result
+                if result[1] == 0:
+                    break
+        finally:
+            if running:
+                #the candidates still running are stopped with their workers, the next run
+                #starts a new pool
+                _terminate_pool()
+        return results
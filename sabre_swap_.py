@@ -0,0 +1,388 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2020.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""Routing via SWAP insertion using the SABRE method, extended to toffoli gates."""
+
+import logging
+import warnings
+from collections import defaultdict
+
+import numpy as np
+
+from qiskit.circuit.library.standard_gates import SwapGate
+from qiskit.circuit.quantumregister import Qubit
+from qiskit.transpiler.basepasses import TransformationPass
+from qiskit.transpiler.exceptions import TranspilerError
+
+from array_layout import ArrayLayout
+from coupling_tables import get_coupling_tables
+
+logger = logging.getLogger(__name__)
+
+EXTENDED_SET_SIZE = 20  # Size of lookahead window.
+EXTENDED_SET_WEIGHT = 0.5  # Weight of lookahead window compared to front_layer.
+
+DECAY_RATE = 0.001  # Decay coefficient for penalizing serial swaps.
+DECAY_RESET_INTERVAL = 5  # How often to reset all decay rates to 1.
+
+
+class SabreSwap_(TransformationPass):
+    r"""Map input circuit onto a backend topology via insertion of SWAPs.
+
+    Implementation of the SWAP-based heuristic search from the SABRE qubit
+    mapping paper [1] (Algorithm 1), extended to route toffoli gates natively.
+
+    The heuristic keeps a front layer of gates whose predecessors are all
+    executed. Gates of the front layer that satisfy the coupling map are
+    executed, otherwise the SWAP minimizing the cost of the front layer and of
+    an extended (lookahead) set, weighted by the decay of the swapped qubits, is
+    inserted.
+
+    A 2q gate is executable when its qubits are coupled. For a ``ccx`` the
+    ``toffoli_target`` decides:
+
+        ``"line"``: two of the three pairs must be coupled, the toffoli is then
+        decomposed into 8 CNOTs around the middle qubit.
+
+        ``"triangle"``: all three pairs must be coupled, which allows the 6 CNOT
+        decomposition. On devices without a triangle this falls back to ``"line"``.
+
+    If no gate gets executed for ``10 * num_qubits`` SWAPs, the release valve
+    routes the closest gate of the front layer along shortest paths (a toffoli
+    onto a line) so the search always terminates.
+
+    The pass expects the dag to be mapped onto the physical qubits
+    (``ApplyLayout_``) and sets ``property_set["final_layout"]``.
+
+    **References:**
+
+    [1] Li, Gushu, Yufei Ding, and Yuan Xie. "Tackling the qubit mapping problem
+    for NISQ-era quantum devices." ASPLOS 2019.
+    `arXiv:1809.02573 <https://arxiv.org/pdf/1809.02573.pdf>`_
+    """
+
+    def __init__(self, coupling_map, heuristic="decay", seed=None, toffoli_target="line"):
+        r"""SabreSwap_ initializer.
+
+        Args:
+            coupling_map (CouplingMap): CouplingMap of the target backend.
+            heuristic (str): The type of heuristic to use when deciding best
+                swap strategy ('basic' or 'lookahead' or 'decay').
+            seed (int): random seed used to tie-break among candidate swaps.
+            toffoli_target (str): ``"line"`` or ``"triangle"``, the qubit
+                connectivity a toffoli needs to be executed.
+
+        Raises:
+            TranspilerError: if the heuristic or the toffoli target is not known.
+        """
+        super().__init__()
+        if heuristic not in ("basic", "lookahead", "decay"):
+            raise TranspilerError("Heuristic %s not recognized." % heuristic)
+        if toffoli_target not in ("line", "triangle"):
+            raise TranspilerError("Toffoli target %s not recognized." % toffoli_target)
+        self.coupling_map = coupling_map
+        self.heuristic = heuristic
+        self.seed = seed
+        self.toffoli_target = toffoli_target
+
+    def run(self, dag):
+        """Run the SabreSwap_ pass on `dag`.
+
+        Args:
+            dag (DAGCircuit): the directed acyclic graph to be mapped.
+        Returns:
+            DAGCircuit: A dag mapped to be compatible with the coupling_map.
+        Raises:
+            TranspilerError: if the coupling map or the layout are not
+            compatible with the DAG, or if a 3q+ gate other than ccx is found.
+        """
+        if len(dag.qregs) != 1 or dag.qregs.get("q", None) is None:
+            raise TranspilerError("Sabre swap runs on physical circuits only.")
+
+        if len(dag.qubits) != self.coupling_map.size():
+            raise TranspilerError(
+                "Sabre swap needs the dag to span all the physical qubits, run the ancilla allocation first."
+            )
+
+        coupling_tables = get_coupling_tables(self.coupling_map)
+        self._coupling_tables = coupling_tables
+        self._distance = coupling_tables.distance_matrix.tolist()
+        self._neighbors = coupling_tables.neighbors
+        self._triangle = self.toffoli_target == "triangle"
+        if self._triangle and not coupling_tables.has_triangle:
+            warnings.warn(
+                "The coupling map has no triangle, toffolis are routed onto lines instead.",
+                UserWarning,
+            )
+            self._triangle = False
+
+        rng = np.random.default_rng(self.seed)
+
+        canonical_register = dag.qregs["q"]
+        num_qubits = len(canonical_register)
+        self._qubit_indices = {bit: index for index, bit in enumerate(canonical_register)}
+        #the dag is physical, so virtual qubit i starts on physical qubit i. v2p and p2v are
+        #views of the layout arrays, they follow the swaps applied to current_layout
+        current_layout = ArrayLayout.trivial(num_qubits)
+        v2p = current_layout.v2p
+        p2v = current_layout.p2v
+
+        mapped_dag = dag._copy_circuit_metadata()
+
+        #a decay factor for each virtual qubit, to discourage serial swaps
+        self.qubits_decay = [1.0] * num_qubits
+        #the nodes routed by the release valve are executable as soon as they form a line
+        self._released = set()
+
+        self.applied_predecessors = defaultdict(int)
+        for input_node in dag.input_map.values():
+            for successor in self._successors(input_node, dag):
+                self.applied_predecessors[successor._node_id] += 1
+
+        front_layer = dag.front_layer()
+        max_swaps_without_progress = 10 * num_qubits
+        swaps_since_progress = 0
+        num_search_steps = 0
+        num_swaps = 0
+
+        while front_layer:
+            execute_gate_list = [node for node in front_layer if self._is_executable(node, v2p)]
+
+            if execute_gate_list:
+                for node in execute_gate_list:
+                    self._apply_gate(mapped_dag, node, v2p, canonical_register)
+                    front_layer.remove(node)
+                    for successor in self._successors(node, dag):
+                        self.applied_predecessors[successor._node_id] += 1
+                        if self._is_resolved(successor):
+                            front_layer.append(successor)
+                self.qubits_decay = [1.0] * num_qubits
+                swaps_since_progress = 0
+                continue
+
+            if swaps_since_progress >= max_swaps_without_progress:
+                #release valve, route the closest gate of the front layer along shortest paths
+                node = min(front_layer, key=lambda node: self._gate_cost(node, v2p))
+                logger.debug("release valve for %s after %d swaps", node.name, swaps_since_progress)
+                for swap in self._release_valve_swaps(node, v2p):
+                    self._apply_swap(mapped_dag, swap, current_layout, canonical_register)
+                    num_swaps += 1
+                self._released.add(node._node_id)
+                self.qubits_decay = [1.0] * num_qubits
+                swaps_since_progress = 0
+                continue
+
+            extended_set = self._obtain_extended_set(dag, front_layer)
+            swap_scores = {}
+            for swap in self._obtain_swaps(front_layer, v2p):
+                swap_scores[swap] = self._score_heuristic(front_layer, extended_set, v2p, p2v, swap)
+            min_score = min(swap_scores.values())
+            best_swaps = sorted(swap for swap, score in swap_scores.items() if score == min_score)
+            best_swap = best_swaps[rng.integers(len(best_swaps))]
+
+            self._apply_swap(mapped_dag, best_swap, current_layout, canonical_register)
+            num_swaps += 1
+            swaps_since_progress += 1
+            num_search_steps += 1
+            if num_search_steps % DECAY_RESET_INTERVAL == 0:
+                self.qubits_decay = [1.0] * num_qubits
+            else:
+                self.qubits_decay[p2v[best_swap[0]]] += DECAY_RATE
+                self.qubits_decay[p2v[best_swap[1]]] += DECAY_RATE
+
+        logger.debug("SabreSwap_ inserted %d swaps", num_swaps)
+        self.property_set["final_layout"] = current_layout.to_layout(canonical_register)
+        return mapped_dag
+
+    def _apply_gate(self, mapped_dag, node, v2p, canonical_register):
+        qargs = [canonical_register[int(v2p[self._qubit_indices[qarg]])] for qarg in node.qargs]
+        mapped_dag.apply_operation_back(node.op, qargs, node.cargs)
+
+    @staticmethod
+    def _apply_swap(mapped_dag, swap, current_layout, canonical_register):
+        physical0, physical1 = swap
+        mapped_dag.apply_operation_back(
+            SwapGate(), [canonical_register[physical0], canonical_register[physical1]], []
+        )
+        current_layout.swap(physical0, physical1)
+
+    @staticmethod
+    def _successors(node, dag):
+        """Return the op successors of `node`, once per qubit wire they share with it."""
+        for _, successor, edge_data in dag.edges(node):
+            if successor.type != "op":
+                continue
+            if isinstance(edge_data, Qubit):
+                yield successor
+
+    def _is_resolved(self, node):
+        """Return True if all the qubit predecessors of `node` are executed."""
+        return self.applied_predecessors[node._node_id] == len(node.qargs)
+
+    def _routed_qubits(self, node):
+        """Return the qubit indices of `node` if it has to be routed, None otherwise."""
+        if node.type != "op" or node.name == "barrier":
+            return None
+        num_qargs = len(node.qargs)
+        if num_qargs == 2 or (num_qargs == 3 and node.name == "ccx"):
+            return [self._qubit_indices[qarg] for qarg in node.qargs]
+        if num_qargs > 2:
+            raise TranspilerError(
+                "SabreSwap_ can only route 2q gates and toffolis, found %s." % node.name
+            )
+        return None
+
+    def _is_executable(self, node, v2p):
+        qubits = self._routed_qubits(node)
+        if qubits is None:
+            return True
+        return self._gate_cost(node, v2p, qubits, released=node._node_id in self._released) == 0
+
+    def _gate_cost(self, node, v2p, qubits=None, swap=None, released=False):
+        """Return the lower bound of the number of swaps `node` still needs.
+
+        Args:
+            node (DAGNode): a 2q gate or a toffoli
+            v2p (ndarray): the physical qubit of every virtual qubit
+            qubits (list): the virtual qubit indices of the node, looked up if None
+            swap (tuple): a pair of physical qubits to consider as swapped
+            released (bool): if True a toffoli only needs a line, whatever the target
+        Returns:
+            int: 0 if the gate is executable
+        """
+        if qubits is None:
+            qubits = self._routed_qubits(node)
+            if qubits is None:
+                return 0
+        physical = [v2p[qubit] for qubit in qubits]
+        if swap is not None:
+            physical = [
+                swap[1] if qubit == swap[0] else swap[0] if qubit == swap[1] else qubit
+                for qubit in physical
+            ]
+        distance = self._distance
+        if len(physical) == 2:
+            return distance[physical[0]][physical[1]] - 1
+        d01 = distance[physical[0]][physical[1]]
+        d12 = distance[physical[1]][physical[2]]
+        d02 = distance[physical[0]][physical[2]]
+        if self._triangle and not released:
+            return d01 + d12 + d02 - 3
+        #a line needs one of the qubits to be adjacent to the two others
+        return min(d01 + d02, d01 + d12, d02 + d12) - 2
+
+    def _obtain_extended_set(self, dag, front_layer):
+        """Populate extended_set by looking ahead a fixed number of gates.
+        For each existing element add a successor until reaching limit.
+        """
+        extended_set = []
+        incremented = []
+        tmp_front_layer = front_layer
+        done = False
+        while tmp_front_layer and not done:
+            new_tmp_front_layer = []
+            for node in tmp_front_layer:
+                for successor in self._successors(node, dag):
+                    incremented.append(successor)
+                    self.applied_predecessors[successor._node_id] += 1
+                    if self._is_resolved(successor):
+                        new_tmp_front_layer.append(successor)
+                        if self._routed_qubits(successor) is not None:
+                            extended_set.append(successor)
+                if len(extended_set) >= EXTENDED_SET_SIZE:
+                    done = True
+                    break
+            tmp_front_layer = new_tmp_front_layer
+        for node in incremented:
+            self.applied_predecessors[node._node_id] -= 1
+        return extended_set
+
+    def _obtain_swaps(self, front_layer, v2p):
+        """Return the swaps of a qubit of the front layer with one of its neighbors."""
+        candidate_swaps = set()
+        for node in front_layer:
+            qubits = self._routed_qubits(node)
+            if qubits is None:
+                continue
+            for qubit in qubits:
+                physical = int(v2p[qubit])
+                for neighbor in self._neighbors[physical]:
+                    candidate_swaps.add((min(physical, neighbor), max(physical, neighbor)))
+        return candidate_swaps
+
+    def _score_heuristic(self, front_layer, extended_set, v2p, p2v, swap):
+        """Return the cost of the front layer (and extended set) once `swap` is applied."""
+        first_cost = 0
+        num_front = 0
+        for node in front_layer:
+            qubits = self._routed_qubits(node)
+            if qubits is None:
+                continue
+            first_cost += self._gate_cost(node, v2p, qubits, swap, node._node_id in self._released)
+            num_front += 1
+        if self.heuristic == "basic":
+            return first_cost
+
+        first_cost /= max(num_front, 1)
+        second_cost = 0
+        if extended_set:
+            for node in extended_set:
+                second_cost += self._gate_cost(node, v2p, swap=swap)
+            second_cost /= len(extended_set)
+        total_cost = first_cost + EXTENDED_SET_WEIGHT * second_cost
+        if self.heuristic == "lookahead":
+            return total_cost
+
+        return total_cost * max(self.qubits_decay[p2v[swap[0]]], self.qubits_decay[p2v[swap[1]]])
+
+    def _release_valve_swaps(self, node, v2p):
+        """Return the swaps routing `node` along shortest paths.
+
+        A 2q gate is routed by moving its first qubit next to the second one. A toffoli is
+        routed onto a line: the qubit minimizing the total distance is the meeting point, the
+        closest other qubit is moved next to it, then the last qubit is moved next to the
+        closer of the two. A shortest path to the closer end never passes through the other
+        end, so the pair already in place is not broken.
+        """
+        qubits = self._routed_qubits(node)
+        physical = [int(v2p[qubit]) for qubit in qubits]
+        distance = self._distance
+        swaps = []
+
+        def _move_next_to(source, destination):
+            #moves the qubit on `source` next to `destination` and tracks where the gate qubits end up
+            path = self._coupling_tables.path(source, destination)
+            for index in range(len(path) - 2):
+                swap = (path[index], path[index + 1])
+                swaps.append((min(swap), max(swap)))
+                for position, qubit in enumerate(physical):
+                    if qubit == swap[0]:
+                        physical[position] = swap[1]
+                    elif qubit == swap[1]:
+                        physical[position] = swap[0]
+
+        if len(physical) == 2:
+            _move_next_to(physical[0], physical[1])
+            return swaps
+
+        meeting = physical.index(self._coupling_tables.meeting_point(*physical)[0])
+        first, last = sorted(
+            (index for index in range(3) if index != meeting),
+            key=lambda index: distance[physical[index]][physical[meeting]],
+        )
+        _move_next_to(physical[first], physical[meeting])
+        #the last qubit joins the line at whichever end of the (meeting, first) pair is closer
+        if distance[physical[last]][physical[meeting]] <= distance[physical[last]][physical[first]]:
+            _move_next_to(physical[last], physical[meeting])
+        else:
+            _move_next_to(physical[last], physical[first])
+        return swaps
@@ -0,0 +1,146 @@
+# This code is part of Qiskit.
+#
+# (C) Copyright IBM 2017, 2020.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+"""Run several seeded trials of SabreSwap_ in parallel and keep the best routed circuit."""
+
+import logging
+import multiprocessing
+
+import numpy as np
+
+from qiskit.tools.parallel import parallel_map
+from qiskit.transpiler.basepasses import TransformationPass
+from qiskit.transpiler.exceptions import TranspilerError
+
+from coupling_tables import get_coupling_tables
+from sabre_swap_ import SabreSwap_
+
+logger = logging.getLogger(__name__)
+
+#cnots of the context-aware decompositions, a toffoli on a triangle takes 6 cnots, on a line 8
+SWAP_CNOTS = 3
+TOFFOLI_TRIANGLE_CNOTS = 6
+TOFFOLI_LINE_CNOTS = 8
+
+
+def routing_cost(dag, coupling_map, cost="swaps"):
+    """Return the cost of a routed `dag`.
+
+    Args:
+        dag (DAGCircuit): a dag routed on the physical qubits of `coupling_map`
+        coupling_map (CouplingMap): the coupling map the dag is routed on
+        cost (str): ``"swaps"`` counts the swaps, ``"estimated_cnots"`` estimates the cnots
+            after the context-aware decomposition from fixed gate costs (3 per swap, 1 per
+            other 2q gate, 6 per toffoli on a triangle and 8 per toffoli on a line). The
+            estimate ignores the cnots saved by the bridge, swap and cnot variants.
+    Returns:
+        int: the cost
+    Raises:
+        TranspilerError: if the cost is not known
+    """
+    if cost == "swaps":
+        return dag.count_ops().get("swap", 0)
+    if cost != "estimated_cnots":
+        raise TranspilerError("Routing cost %s not recognized." % cost)
+
+    adjacency = get_coupling_tables(coupling_map).adjacency
+    qubit_indices = {bit: index for index, bit in enumerate(dag.qubits)}
+    total = 0
+    for node in dag.op_nodes():
+        if node.name == "swap":
+            total += SWAP_CNOTS
+        elif node.name == "ccx":
+            q0, q1, q2 = (qubit_indices[qarg] for qarg in node.qargs)
+            if adjacency[q0, q1] and adjacency[q0, q2] and adjacency[q1, q2]:
+                total += TOFFOLI_TRIANGLE_CNOTS
+            else:
+                total += TOFFOLI_LINE_CNOTS
+        elif len(node.qargs) == 2 and node.name != "barrier":
+            total += 1
+    return total
+
+
+def _run_trial(seed, dag, coupling_map, heuristic, toffoli_target, cost):
+    #runs in a worker process, so everything it needs comes in the arguments
+    router = SabreSwap_(coupling_map, heuristic=heuristic, seed=seed, toffoli_target=toffoli_target)
+    mapped_dag = router.run(dag)
+    cost = routing_cost(mapped_dag, coupling_map, cost)
+    return cost, mapped_dag, router.property_set["final_layout"]
+
+
+class SabreTrials_(TransformationPass):
+    """Route a DAGCircuit with the best of several seeded SabreSwap_ trials.
+
+    The tie-breaks of SabreSwap_ are random, so different seeds give different routings.
+    The trials are run with ``parallel_map``, one per process (in turn when the pass already
+    runs in a worker process), and the routed dag with the lowest cost is kept (the earliest
+    trial wins a tie, so the result only depends on the seed). The costs of all the trials
+    are stored in ``property_set["routing_trial_costs"]``.
+    """
+
+    def __init__(self, coupling_map, trials=8, seed=None, heuristic="decay", toffoli_target="line",
+                 cost="swaps", num_processes=None):
+        """SabreTrials_ initializer.
+
+        Args:
+            coupling_map (CouplingMap): CouplingMap of the target backend.
+            trials (int): number of SabreSwap_ trials.
+            seed (int): seed the seeds of the trials are drawn from.
+            heuristic (str): the heuristic of SabreSwap_.
+            toffoli_target (str): ``"line"`` or ``"triangle"``, see SabreSwap_.
+            cost (str): ``"swaps"`` or ``"estimated_cnots"``, see ``routing_cost``.
+            num_processes (int): maximum number of processes, defaults to the number of CPUs.
+
+        Raises:
+            TranspilerError: if the number of trials or the cost is not valid.
+        """
+        super().__init__()
+        if trials < 1:
+            raise TranspilerError("SabreTrials_ needs at least one trial.")
+        if cost not in ("swaps", "estimated_cnots"):
+            raise TranspilerError("Routing cost %s not recognized." % cost)
+        self.coupling_map = coupling_map
+        self.trials = trials
+        self.seed = seed
+        self.heuristic = heuristic
+        self.toffoli_target = toffoli_target
+        self.cost = cost
+        self.num_processes = num_processes
+
+    def run(self, dag):
+        """Run the SabreTrials_ pass on `dag`.
+
+        Args:
+            dag (DAGCircuit): the directed acyclic graph to be mapped.
+        Returns:
+            DAGCircuit: the best of the routed dags.
+        """
+        seeds = np.random.default_rng(self.seed).integers(2 ** 31, size=self.trials).tolist()
+        task_args = (dag, self.coupling_map, self.heuristic, self.toffoli_target, self.cost)
+        if multiprocessing.parent_process() is not None:
+            #already in a worker process (e.g. of transpile_context), a nested pool would
+            #oversubscribe the machine, so the trials run in turn
+            results = [_run_trial(seed, *task_args) for seed in seeds]
+        elif self.num_processes is None:
+            results = parallel_map(_run_trial, seeds, task_args=task_args)
+        else:
+            results = parallel_map(
+                _run_trial, seeds, task_args=task_args, num_processes=self.num_processes
+            )
+
+        costs = [result[0] for result in results]
+        best = costs.index(min(costs))
+        logger.debug("SabreTrials_ costs %s, keeping trial %d (seed %d)", costs, best, seeds[best])
+        _, mapped_dag, final_layout = results[best]
+        self.property_set["routing_trial_costs"] = costs
+        self.property_set["final_layout"] = final_layout
+        return mapped_dag
@@ -12,10 +12,14 @@
 
 """Recursively expands 3q+ gates until the circuit only contains 2q or 1q gates."""
 
+import logging
+
 from qiskit.transpiler.basepasses import TransformationPass
 from qiskit.exceptions import QiskitError
 from qiskit.converters.circuit_to_dag import circuit_to_dag
 
+logger = logging.getLogger(__name__)
+
 
 class Unroll3qOrMore_(TransformationPass):
     """Recursively expands 3q+ gates (except Toffoli) until the circuit only contains 2q or 1q gates."""
@@ -32,7 +36,7 @@ class Unroll3qOrMore_(TransformationPass):
         """
         for node in dag.multi_qubit_ops():
 
-            print(node.op.name)
+            logger.debug("multi-qubit op %s", node.op.name)
 
             #if the node is a Toffoli, then pass
             if node.op.name == 'ccx':
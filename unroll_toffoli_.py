@@ -12,6 +12,9 @@
 
 """Recursively expands 3q+ gates until the circuit only contains 2q or 1q gates."""
 
+import logging
+from collections import Counter
+
 from qiskit.transpiler.basepasses import TransformationPass
 from qiskit.exceptions import QiskitError
 from qiskit.converters.circuit_to_dag import circuit_to_dag
@@ -19,6 +22,10 @@ from qiskit.converters import dag_to_circuit
 from qiskit import QuantumCircuit
 from qiskit.transpiler.layout import Layout
 
+from coupling_tables import get_coupling_tables
+
+logger = logging.getLogger(__name__)
+
 
 class UnrollToffoli_(TransformationPass):
     """Recursively expands all toffoli gates until the circuit only contains 2q or 1q gates."""
@@ -48,6 +55,10 @@ class UnrollToffoli_(TransformationPass):
         Note: In a toffoli gate, node.qargs is a list of three qubits. The first two qubits are the control qubits and the last qubit is the target qubit.
         i.e. node.qargs[0] and node.qargs[1] are control qubits and node.qargs[2] is the target qubit.
         """
+        decomposition_counts = Counter()
+        coupling_tables = get_coupling_tables(self.coupling_map)
+        adjacency = coupling_tables.adjacency
+        distance_matrix = coupling_tables.distance_matrix
         for node in dag.multi_qubit_ops():
 
             assert node.op.name == 'ccx'
@@ -72,14 +83,14 @@ class UnrollToffoli_(TransformationPass):
             #print('The distances between the toffoli qubits are: ', self.coupling_map.distance(control1, target), 'between qubits 0 and 2')
 
             #now compute the distances
-            bool1 = self.coupling_map.distance(control1, control2) == 1
-            bool2 = self.coupling_map.distance(control2, target) == 1
-            bool3 = self.coupling_map.distance(control1, target) == 1
+            bool1 = adjacency[control1, control2]
+            bool2 = adjacency[control2, target]
+            bool3 = adjacency[control1, target]
 
             #distances
-            d1 = self.coupling_map.distance(control1, control2)
-            d2 = self.coupling_map.distance(control2, target)
-            d3 = self.coupling_map.distance(control1, target)
+            d1 = distance_matrix[control1, control2]
+            d2 = distance_matrix[control2, target]
+            d3 = distance_matrix[control1, target]
 
 
             #if all qubits are adjacent to each other
@@ -90,8 +101,8 @@ class UnrollToffoli_(TransformationPass):
                 #print('distance between control 2 and target: ', d2)
                 #print('distance between control 1 and target: ', d3)
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using a 6 cnot decomposition')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: a 6 cnot decomposition', control1, control2, target)
+                decomposition_counts['6cx'] += 1
 
                 #create a 6 cnot circuit
                 #print('6 cnot toffoli: ', control1, control2, target)
@@ -118,8 +129,8 @@ class UnrollToffoli_(TransformationPass):
             #if physical qubit 1 is connected to both but zero and two are not connected
             elif bool1 and bool2 and (not bool3):
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - one in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - one in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
 
                 #create an 8 cnot circuit
                 #print('Case 1: ', control1, control2, target)
@@ -150,8 +161,8 @@ class UnrollToffoli_(TransformationPass):
             #if physical qubit 0 is connected to both but one and two are not connected
             elif bool1 and (not bool2) and bool3:
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - zero in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - zero in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
 
                 #create an 8 cnot circuit
                 #print('Case 2: ', control1, control2, target)
@@ -181,8 +192,8 @@ class UnrollToffoli_(TransformationPass):
             #if physical qubit 2 is connected to both but 0 and 1 are not connected
             elif (not bool1) and bool2 and bool3:
 
-                print('The physical qubits for the toffoli are: ', control1, control2, target)
-                print('The required toffoli will be decomposed using an 8 cnot decomposition - two in center')
+                logger.debug('Toffoli on physical qubits %s, %s, %s: an 8 cnot decomposition - two in center', control1, control2, target)
+                decomposition_counts['8cx'] += 1
 
                 #create a 8 cnot circuit
                 #print('Case 3: ', control1, control2, target)
@@ -212,7 +223,8 @@ class UnrollToffoli_(TransformationPass):
 
             else:
 
-                print('The routing pass is not correct')
+                logger.warning('The routing pass is not correct, toffoli on physical qubits %s, %s, %s is not routed', control1, control2, target)
+                decomposition_counts['unrouted'] += 1
 
 
             # rule = node.op.definition.data
@@ -227,4 +239,5 @@ class UnrollToffoli_(TransformationPass):
             # decomposition = circuit_to_dag(node.op.definition)
             # decomposition = self.run(decomposition)  # recursively unroll
             # dag.substitute_node_with_dag(node, decomposition)
+        self.property_set["toffoli_decomposition_counts"] = decomposition_counts
         return dag
\ No newline at end of file